@@ -0,0 +1,261 @@
+import asyncio
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+
+from .tracing import span
+
+# Longest leave a single structured row may expand to (start_date..end_date)
+MAX_RANGE_DAYS = 366
+LIST_SEPARATORS = (";", "|", " ")
+
+# Import work that must finish even if the client goes away
+_detached = set()
+
+
+def keep_running(coro):
+    """
+    Run `coro` as a task that is referenced until done.
+    """
+    task = asyncio.ensure_future(coro)
+    _detached.add(task)
+    task.add_done_callback(_detached.discard)
+    return task
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_csv_rows(lines):
+    """
+    Rows of a CSV with a header line, as dicts. Quoted fields may span lines.
+    """
+    header = None
+    record = ""
+    for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue  # inside a quoted field
+        if record.strip():
+            values = next(csv.reader([record]))
+            if header is None:
+                header = [name.strip().lower() for name in values]
+            else:
+                yield dict(zip(header, (value.strip() for value in values)))
+        record = ""
+
+
+def iter_jsonl_rows(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {"_error": f"invalid JSON: {e}"}
+        yield row if isinstance(row, dict) else {"_error": "each line must be a JSON object"}
+
+
+def parse_day(value):
+    """
+    DD-MM-YYYY (the app's format) or ISO YYYY-MM-DD, returned as DD-MM-YYYY.
+    """
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt).strftime("%d-%m-%Y")
+        except ValueError:
+            pass
+    raise RowError(f"bad date {value!r}, use DD-MM-YYYY")
+
+
+def split_list(value):
+    if isinstance(value, list):
+        return [str(v) for v in value if str(v).strip()]
+    for sep in LIST_SEPARATORS:
+        if sep in value:
+            return [v for v in value.split(sep) if v.strip()]
+    return [value] if value.strip() else []
+
+
+def structured_leave_info(row):
+    """
+    leave_info for rows that already carry dates (no LLM needed), or None
+    for free-text rows.
+    """
+    if row.get("leave_dates"):
+        days = [parse_day(day) for day in split_list(row["leave_dates"])]
+    elif row.get("start_date"):
+        start = datetime.strptime(parse_day(row["start_date"]), "%d-%m-%Y")
+        end = datetime.strptime(parse_day(row.get("end_date") or row["start_date"]), "%d-%m-%Y")
+        if end < start or (end - start).days >= MAX_RANGE_DAYS:
+            raise RowError("end_date must be on or after start_date and within a year")
+        days = [(start + timedelta(days=n)).strftime("%d-%m-%Y") for n in range((end - start).days + 1)]
+    else:
+        return None
+    return {
+        "leave_type": row.get("leave_type") or None,
+        "leave_dates": sorted(set(days), key=lambda d: datetime.strptime(d, "%d-%m-%Y")),
+        "leave_reason": row.get("leave_reason") or None,
+        "manager_mention": row.get("manager_mention") or None,
+    }
+
+
+class BulkImport:
+    """
+    One HR bulk import: rows are resolved concurrently (at most
+    `llm_concurrency` free-text rows in the LLM at once), stored as pending
+    and, at the end, each manager gets their requests grouped into as few
+    DMs as possible. `run()` yields progress dicts for streaming. If the
+    consumer stops early (client disconnect), no new rows are started, but
+    rows already in progress finish and every stored request's manager is
+    still DM'd, in a background task.
+
+    The Slack/LLM helpers are passed in so the module stays free of client
+    imports: `parse_text(user_id, text)`, `resolve_manager(mention)` (sync),
+    `create(user_id, manager_id, leave_info)` (async, returns the request id
+    once stored, or raises RowError to reject the row),
+    `notify_manager(manager_id, [(request_id, user_id, leave_info)])` and,
+    optionally, `is_duplicate(user_id, manager_id, leave_info)` (sync) to
+    skip rows whose dates the user already has leave on.
+    """
+    def __init__(self, parse_text, resolve_manager, create, notify_manager,
+                 llm_concurrency=8, llm_timeout=30.0, max_rows=5000, is_duplicate=None):
+        self.parse_text = parse_text
+        self.resolve_manager = resolve_manager
+        self.create = create
+        self.notify_manager = notify_manager
+        self.is_duplicate = is_duplicate
+        self.llm_slots = asyncio.Semaphore(llm_concurrency)
+        # Read ahead of the LLM workers, but not the whole upload
+        self.in_flight = asyncio.Semaphore(llm_concurrency * 4)
+        self.llm_timeout = llm_timeout
+        self.max_rows = max_rows
+        self.by_manager = {}
+        self.detached = False
+        self.counts = {"rows": 0, "created": 0, "failed": 0, "llm_parsed": 0, "structured": 0}
+
+    async def resolve_row(self, row):
+        if row.get("_error"):
+            raise RowError(row["_error"])
+        user_id = (row.get("user_id") or "").strip()
+        if not user_id:
+            raise RowError("user_id is required")
+        leave_info = structured_leave_info(row)
+        if leave_info is not None:
+            self.counts["structured"] += 1
+        elif (row.get("text") or "").strip():
+            async with self.llm_slots:
+                with span("bulk_llm_parse"):
+                    leave_info = await asyncio.wait_for(
+                        self.parse_text(user_id, row["text"]), timeout=self.llm_timeout
+                    )
+            self.counts["llm_parsed"] += 1
+            if not leave_info or not leave_info.get("leave_dates"):
+                raise RowError("could not understand the leave text")
+        else:
+            raise RowError("row needs leave_dates, start_date or text")
+
+        manager_id = (row.get("manager_id") or "").strip()
+        if not manager_id:
+            manager_id = await asyncio.to_thread(self.resolve_manager, leave_info.get("manager_mention"))
+        if not manager_id:
+            raise RowError("no manager_id and the manager mention could not be resolved")
+        if manager_id == user_id:
+            raise RowError("manager_id is the requester")
+        return user_id, manager_id, leave_info
+
+    async def process(self, index, row, results):
+        try:
+            user_id, manager_id, leave_info = await self.resolve_row(row)
+            # No await between the check and create queueing the row, so
+            # duplicate rows in the same upload are caught too
+            if self.is_duplicate and self.is_duplicate(user_id, manager_id, leave_info):
+                raise RowError("user already has leave on all of these dates")
+            request_id = await self.create(user_id, manager_id, leave_info)
+            self.by_manager.setdefault(manager_id, []).append((request_id, user_id, leave_info))
+            self.counts["created"] += 1
+            result = {"row": index, "status": "pending", "request_id": request_id,
+                      "user_id": user_id, "manager_id": manager_id}
+        except Exception as e:
+            self.counts["failed"] += 1
+            reason = "LLM timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            result = {"row": index, "status": "error", "error": reason}
+        finally:
+            self.in_flight.release()
+        await results.put(result)
+
+    async def _feed(self, rows, results):
+        tasks = []
+        try:
+            index = 0
+            for row in rows:
+                if self.detached:
+                    break
+                index += 1
+                if index > self.max_rows:
+                    await results.put({"row": index, "status": "error",
+                                       "error": f"import is limited to {self.max_rows} rows"})
+                    break
+                await self.in_flight.acquire()
+                self.counts["rows"] = index
+                tasks.append(asyncio.create_task(self.process(index, row, results)))
+            await asyncio.gather(*tasks)
+        finally:
+            await results.put(None)
+
+    async def notify_managers(self):
+        """
+        DM each manager their stored requests. Returns (messages sent,
+        [notify_failed progress dicts]).
+        """
+        messages = 0
+        failures = []
+        sends = [self.notify_manager(manager_id, requests) for manager_id, requests in self.by_manager.items()]
+        with span("bulk_notify_managers"):
+            for manager_id, sent in zip(self.by_manager, await asyncio.gather(*sends, return_exceptions=True)):
+                if isinstance(sent, Exception):
+                    print(f"[BulkImport] Could not DM manager {manager_id}: {sent}")
+                    failures.append({"manager_id": manager_id, "status": "notify_failed", "error": str(sent)})
+                else:
+                    messages += sent
+        return messages, failures
+
+    async def _finish_detached(self, feeder):
+        try:
+            await feeder
+        finally:
+            messages, failures = await self.notify_managers()
+            print(f"[BulkImport] Client went away after {self.counts['rows']} rows; "
+                  f"sent {messages} DMs to {len(self.by_manager)} managers ({len(failures)} failed)")
+
+    async def run(self, rows):
+        started = time.perf_counter()
+        results = asyncio.Queue()
+        feeder = asyncio.create_task(self._feed(rows, results))
+        finished = False
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+            await asyncio.shield(feeder)
+            finished = True
+        finally:
+            if not finished:
+                # Rows already stored must still reach their managers
+                self.detached = True
+                keep_running(self._finish_detached(feeder))
+
+        messages, failures = await asyncio.shield(keep_running(self.notify_managers()))
+        for failure in failures:
+            yield failure
+        yield {
+            "done": True,
+            **self.counts,
+            "managers": len(self.by_manager),
+            "dm_messages": messages,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        }
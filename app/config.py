@@ -2,12 +2,81 @@ import os
 
 class Settings:
     def __init__(self):
-        # Required settings
-        self.SLACK_BOT_TOKEN = self._get("SLACK_BOT_TOKEN")
+        # One app serving many workspaces: bot tokens come from TENANT_DB_PATH, keyed by team_id
+        self.MULTI_TENANT = self._get_optional("MULTI_TENANT", "false").lower() in ("1", "true", "yes")
+
+        # Required settings (the bot token and calendar address are per workspace in multi-tenant mode)
+        self.SLACK_BOT_TOKEN = self._get_optional("SLACK_BOT_TOKEN", "") if self.MULTI_TENANT else self._get("SLACK_BOT_TOKEN")
         self.SLACK_SIGNING_SECRET = self._get("SLACK_SIGNING_SECRET")
         self.OPENAI_API_KEY = self._get("OPENAI_API_KEY")
         # self.MANAGER_USER_ID = self._get("MANAGER_USER_ID")
-        self.EMPLOYEE_GCAL_EMAIL = self._get("EMPLOYEE_GCAL_EMAIL")
+        self.EMPLOYEE_GCAL_EMAIL = (
+            self._get_optional("EMPLOYEE_GCAL_EMAIL", "") if self.MULTI_TENANT else self._get("EMPLOYEE_GCAL_EMAIL")
+        )
+
+        # User token with users.profile:write (an admin's, to set other people's status);
+        # bot tokens can't call users.profile.set, so without it approvals skip the OOO status
+        self.SLACK_STATUS_USER_TOKEN = self._get_optional("SLACK_STATUS_USER_TOKEN", "")
+
+        # Optional tuning (sane defaults)
+        self.EVENT_QUEUE_MAXSIZE = int(self._get_optional("EVENT_QUEUE_MAXSIZE", "100"))
+        self.EVENT_WORKERS = int(self._get_optional("EVENT_WORKERS", "4"))
+        self.EVENT_ENQUEUE_TIMEOUT = float(self._get_optional("EVENT_ENQUEUE_TIMEOUT", "1.0"))
+        self.DEDUP_BACKEND = self._get_optional("DEDUP_BACKEND", "memory")
+        self.DEDUP_SQLITE_PATH = self._get_optional("DEDUP_SQLITE_PATH", "data/dedup.sqlite3")
+        self.DEDUP_TTL_SECONDS = int(self._get_optional("DEDUP_TTL_SECONDS", "900"))
+        self.DEDUP_MAX_ENTRIES = int(self._get_optional("DEDUP_MAX_ENTRIES", "50000"))
+        self.PROFILE_CACHE_TTL = int(self._get_optional("PROFILE_CACHE_TTL", "3600"))
+        self.PROFILE_CACHE_MAX_ENTRIES = int(self._get_optional("PROFILE_CACHE_MAX_ENTRIES", "20000"))
+        # Set above 1.0 to always use the LLM
+        self.FAST_PARSE_MIN_CONFIDENCE = float(self._get_optional("FAST_PARSE_MIN_CONFIDENCE", "0.9"))
+        # "full" (rules + examples) or "compact"; see scripts/prompt_tokens.py
+        self.LLM_PROMPT_VARIANT = self._get_optional("LLM_PROMPT_VARIANT", "full")
+        # "classic" (gpt-4, plain JSON) or "structured" (streamed JSON-schema output)
+        self.LLM_MODE = self._get_optional("LLM_MODE", "classic")
+        self.LLM_FAST_MODEL = self._get_optional("LLM_FAST_MODEL", "gpt-4o-mini")
+        self.LEAVE_DB_PATH = self._get_optional("LEAVE_DB_PATH", "data/leave.sqlite3")
+        self.LEAVE_WRITE_BATCH_SIZE = int(self._get_optional("LEAVE_WRITE_BATCH_SIZE", "100"))
+        self.LEAVE_WRITE_FLUSH_MS = int(self._get_optional("LEAVE_WRITE_FLUSH_MS", "50"))
+        # Bearer token for the /leave admin endpoints; empty disables them
+        self.ADMIN_API_TOKEN = self._get_optional("ADMIN_API_TOKEN", "")
+        self.LLM_CACHE_MAX_ENTRIES = int(self._get_optional("LLM_CACHE_MAX_ENTRIES", "5000"))
+        # Empty = memory only
+        self.LLM_CACHE_SQLITE_PATH = self._get_optional("LLM_CACHE_SQLITE_PATH", "")
+        # Import SDKs / build clients in the background once the server is up
+        self.STARTUP_PREWARM = self._get_optional("STARTUP_PREWARM", "true").lower() in ("1", "true", "yes")
+        self.STARTUP_PREWARM_DELAY = float(self._get_optional("STARTUP_PREWARM_DELAY", "0.5"))
+        # Requests slower than this are logged with their spans (0 disables)
+        self.TRACE_SLOW_MS = int(self._get_optional("TRACE_SLOW_MS", "5000"))
+        self.TRACE_RECENT = int(self._get_optional("TRACE_RECENT", "200"))
+        # POST /leave/bulk: free-text rows in the LLM at once, per-row LLM timeout, row cap
+        self.BULK_LLM_CONCURRENCY = int(self._get_optional("BULK_LLM_CONCURRENCY", "8"))
+        self.BULK_LLM_TIMEOUT = float(self._get_optional("BULK_LLM_TIMEOUT", "30"))
+        self.BULK_MAX_ROWS = int(self._get_optional("BULK_MAX_ROWS", "5000"))
+        # Most people on one manager's team out on the same day (0 = no limit)
+        self.TEAM_CAPACITY_LIMIT = int(self._get_optional("TEAM_CAPACITY_LIMIT", "0"))
+        # Point the Slack / OpenAI clients at another server (e.g. scripts/fake_services.py); empty = the real APIs
+        self.SLACK_API_URL = self._get_optional("SLACK_API_URL", "")
+        self.OPENAI_BASE_URL = self._get_optional("OPENAI_BASE_URL", "")
+        # How often the event loop's wake-up lag is sampled (0 disables)
+        self.EVENT_LOOP_LAG_INTERVAL_MS = int(self._get_optional("EVENT_LOOP_LAG_INTERVAL_MS", "500"))
+        # Durable job journal for slash commands and approve/deny clicks; workers, retries of transient errors
+        self.JOB_DB_PATH = self._get_optional("JOB_DB_PATH", "data/jobs.sqlite3")
+        self.JOB_WORKERS = int(self._get_optional("JOB_WORKERS", "4"))
+        self.JOB_MAX_ATTEMPTS = int(self._get_optional("JOB_MAX_ATTEMPTS", "5"))
+        self.JOB_RETRY_BASE_SECONDS = float(self._get_optional("JOB_RETRY_BASE_SECONDS", "1.0"))
+        self.JOB_RETRY_MAX_SECONDS = float(self._get_optional("JOB_RETRY_MAX_SECONDS", "60"))
+        # Processes sharing JOB_DB_PATH take over a stopped one's jobs after this long
+        self.JOB_LEASE_SECONDS = float(self._get_optional("JOB_LEASE_SECONDS", "30"))
+        # Multi-tenant mode: token store, workspaces kept in memory, and per-workspace caps
+        self.TENANT_DB_PATH = self._get_optional("TENANT_DB_PATH", "data/tenants.sqlite3")
+        self.TENANT_POOL_SIZE = int(self._get_optional("TENANT_POOL_SIZE", "100"))
+        self.TENANT_REFRESH_SECONDS = int(self._get_optional("TENANT_REFRESH_SECONDS", "300"))
+        self.TENANT_DIRECTORY_MAX_MEMBERS = int(self._get_optional("TENANT_DIRECTORY_MAX_MEMBERS", "100000"))
+        self.TENANT_PROFILE_CACHE_MAX_ENTRIES = int(self._get_optional("TENANT_PROFILE_CACHE_MAX_ENTRIES", "2000"))
+        self.TENANT_SLACK_POOL_SIZE = int(self._get_optional("TENANT_SLACK_POOL_SIZE", "10"))
+        self.TENANT_MAX_CHANNEL_BUCKETS = int(self._get_optional("TENANT_MAX_CHANNEL_BUCKETS", "500"))
+        self.TENANT_REQUESTS_PER_MINUTE = int(self._get_optional("TENANT_REQUESTS_PER_MINUTE", "120"))
     
     def _get(self, name):
         value = os.environ.get(name)
@@ -15,5 +84,8 @@ class Settings:
             raise RuntimeError(f"Missing required environment variable: {name}")
         return value
 
+    def _get_optional(self, name, default):
+        return os.environ.get(name, default)
+
 # Create a module-level singleton instance to import anywhere
 settings = Settings()
\ No newline at end of file
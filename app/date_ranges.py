@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+
+
+def merge_date_ranges(leave_dates):
+    """
+    Collapse DD-MM-YYYY leave days into contiguous all-day ranges.
+    Returns [(start_date, end_date_exclusive), ...] sorted by start, the
+    convention both Google Calendar and iCalendar use for all-day events:
+
+    >>> merge_date_ranges(["26-06-2025", "25-06-2025", "30-06-2025"])
+    [(datetime.date(2025, 6, 25), datetime.date(2025, 6, 27)), (datetime.date(2025, 6, 30), datetime.date(2025, 7, 1))]
+    """
+    days = set()
+    for day in leave_dates or []:
+        try:
+            days.add(datetime.strptime(day, "%d-%m-%Y").date())
+        except ValueError:
+            print(f"Skipping unparseable leave date {day!r}")
+    ranges = []
+    for day in sorted(days):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return [tuple(r) for r in ranges]
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Slack retries a failed delivery 3 times over ~5 minutes; keep ids a bit longer.
+DEFAULT_TTL_SECONDS = 900
+
+
+class DedupStore(ABC):
+    """
+    Remembers Slack event ids for `ttl` seconds so retried deliveries are skipped.
+
+    `mark_seen(event_id)` is an atomic check-and-set: it returns True the first
+    time an id is offered (caller should process it) and False for a repeat.
+    Async handlers use `mark_seen_async()` / `forget_async()`, which run a
+    blocking backend off the event loop.
+    """
+    @abstractmethod
+    def mark_seen(self, event_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def forget(self, event_id: str):
+        ...
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    async def mark_seen_async(self, event_id: str) -> bool:
+        return await asyncio.to_thread(self.mark_seen, event_id)
+
+    async def forget_async(self, event_id: str):
+        await asyncio.to_thread(self.forget, event_id)
+
+
+class MemoryDedupStore(DedupStore):
+    """
+    Per-process LRU/TTL store. Entries are kept in insertion order, and with a
+    single TTL that is also expiry order, so eviction only ever pops from the
+    front: O(1) amortized per call and never more than `max_entries` ids.
+    """
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # event_id -> expires_at
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        entries = self._entries
+        while entries:
+            event_id, expires_at = next(iter(entries.items()))
+            if expires_at > now and len(entries) < self.max_entries:
+                break
+            entries.popitem(last=False)
+
+    def mark_seen(self, event_id: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(event_id)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._entries.pop(event_id, None)
+            self._evict(now)
+            self._entries[event_id] = now + self.ttl
+            return True
+
+    def forget(self, event_id: str):
+        with self._lock:
+            self._entries.pop(event_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # In-memory and never blocks: skip the thread hop
+    async def mark_seen_async(self, event_id: str) -> bool:
+        return self.mark_seen(event_id)
+
+    async def forget_async(self, event_id: str):
+        self.forget(event_id)
+
+
+class SqliteDedupStore(DedupStore):
+    """
+    SQLite-backed store that several uvicorn worker processes on the same host
+    can share. Uses WAL so concurrent readers don't block the writer; expired
+    rows are purged every `purge_every` inserts, and the table is capped at
+    `max_entries` rows (oldest dropped first).
+    """
+    def __init__(self, path, ttl=DEFAULT_TTL_SECONDS, max_entries=500000, purge_every=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._inserts = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS slack_event_dedup ("
+            " event_id TEXT PRIMARY KEY,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_slack_event_dedup_expires"
+            " ON slack_event_dedup (expires_at)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def mark_seen(self, event_id: str) -> bool:
+        # Wall clock, since the expiry is shared between processes
+        now = time.time()
+        conn = self._conn()
+        # Insert, or take over an expired row; rowcount is 0 only for a live duplicate
+        cur = conn.execute(
+            "INSERT INTO slack_event_dedup (event_id, expires_at) VALUES (?, ?)"
+            " ON CONFLICT(event_id) DO UPDATE SET expires_at = excluded.expires_at"
+            " WHERE slack_event_dedup.expires_at <= ?",
+            (event_id, now + self.ttl, now),
+        )
+        is_new = cur.rowcount > 0
+        if is_new:
+            self._inserts += 1
+            if self._inserts % self.purge_every == 0:
+                self.purge(now)
+        return is_new
+
+    def purge(self, now=None):
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("DELETE FROM slack_event_dedup WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM slack_event_dedup WHERE event_id IN ("
+            " SELECT event_id FROM slack_event_dedup ORDER BY expires_at DESC"
+            " LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def forget(self, event_id: str):
+        self._conn().execute("DELETE FROM slack_event_dedup WHERE event_id = ?", (event_id,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM slack_event_dedup").fetchone()[0]
+
+
+def make_dedup_store(settings) -> DedupStore:
+    """
+    Build the dedup store selected by DEDUP_BACKEND ("memory" or "sqlite").
+    """
+    backend = settings.DEDUP_BACKEND.lower()
+    if backend == "sqlite":
+        directory = os.path.dirname(settings.DEDUP_SQLITE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SqliteDedupStore(
+            settings.DEDUP_SQLITE_PATH,
+            ttl=settings.DEDUP_TTL_SECONDS,
+            max_entries=settings.DEDUP_MAX_ENTRIES,
+        )
+    if backend != "memory":
+        print(f"[Deduplication] Unknown DEDUP_BACKEND={backend!r}, using memory")
+    return MemoryDedupStore(ttl=settings.DEDUP_TTL_SECONDS, max_entries=settings.DEDUP_MAX_ENTRIES)
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+
+from .tracing import tracer
+
+
+class StageStats:
+    """
+    Running latency totals for one pipeline stage (seconds).
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        avg = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "last_ms": round(self.last * 1000, 2),
+        }
+
+
+class EventPipeline:
+    """
+    Bounded in-process work queue for Slack events.
+
+    The HTTP handler verifies and acks, then calls `submit()`; a pool of
+    `workers` coroutines pulls items off the queue and awaits `handler(item)`.
+    When the queue is full `submit()` waits up to `enqueue_timeout` seconds and
+    then gives up, so the caller can answer Slack with an error and let Slack
+    retry later (backpressure instead of unbounded memory).
+
+    Each item runs in a copy of the submitter's context, so the request's
+    trace follows it onto the worker. Stage timings also feed the tracer's
+    histograms.
+
+    When the handler raises, the item is counted as failed (and timed as the
+    "failed" stage) and `on_failure(item, error)` is awaited, so the sender
+    hears about it.
+    """
+    def __init__(self, handler, maxsize=100, workers=4, enqueue_timeout=1.0, on_failure=None):
+        self.handler = handler
+        self.on_failure = on_failure
+        self.maxsize = maxsize
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+        self.in_flight = 0
+        self.counters = {"enqueued": 0, "rejected": 0, "processed": 0, "failed": 0}
+        self.stages = {}
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"event-worker-{n}")
+            for n in range(self.workers)
+        ]
+        print(f"[EventPipeline] Started {self.workers} workers (queue maxsize={self.maxsize})")
+
+    async def stop(self, drain_timeout=5.0):
+        """
+        Give in-flight items a chance to finish, then cancel the workers.
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            if self.queue.qsize():
+                print(f"[EventPipeline] Dropping {self.queue.qsize()} queued events on shutdown")
+            if self.in_flight:
+                print(f"[EventPipeline] Cancelling {self.in_flight} in-flight events on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, item) -> bool:
+        """
+        Enqueue an item. Returns False if the queue stayed full for `enqueue_timeout`.
+        """
+        context = contextvars.copy_context()
+        try:
+            self.queue.put_nowait((time.perf_counter(), context, item))
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(
+                    self.queue.put((time.perf_counter(), context, item)), timeout=self.enqueue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.counters["rejected"] += 1
+                print(f"[EventPipeline] Queue full ({self.maxsize}), rejecting event")
+                return False
+        self.counters["enqueued"] += 1
+        return True
+
+    def record(self, stage, seconds):
+        self.stages.setdefault(stage, StageStats()).add(seconds)
+        tracer.observe(stage, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of handler code as a named stage:
+
+            with event_pipeline.stage("llm_parse"):
+                leave_info = await parse_leave_request_llm_async(...)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    async def _worker(self, n):
+        while True:
+            enqueued_at, context, item = await self.queue.get()
+            started = time.perf_counter()
+            context.run(self.record, "queue_wait", started - enqueued_at)
+            self.in_flight += 1
+            try:
+                # A task created inside `context` runs with a copy of it
+                await context.run(asyncio.ensure_future, self.handler(item))
+                self.counters["processed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                context.run(self.record, "failed", time.perf_counter() - started)
+                print(f"[EventPipeline] worker-{n} handler error: {type(e).__name__}: {e}")
+                if self.on_failure is not None:
+                    try:
+                        await context.run(asyncio.ensure_future, self.on_failure(item, e))
+                    except Exception as notify_error:
+                        print(f"[EventPipeline] worker-{n} on_failure failed: {notify_error}")
+            finally:
+                self.in_flight -= 1
+                context.run(self.record, "handle", time.perf_counter() - started)
+                self.queue.task_done()
+
+    def snapshot(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_maxsize": self.maxsize,
+            "in_flight": self.in_flight,
+            "workers": len(self._tasks),
+            **self.counters,
+            "stages": {name: s.as_dict() for name, s in self.stages.items()},
+        }
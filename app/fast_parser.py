@@ -0,0 +1,188 @@
+import re
+from datetime import datetime, timedelta
+
+import pytz
+
+WEEKDAYS = {
+    "monday": 0, "mon": 0,
+    "tuesday": 1, "tue": 1, "tues": 1,
+    "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "thur": 3, "thurs": 3,
+    "friday": 4, "fri": 4,
+    "saturday": 5,
+    "sunday": 6,
+}
+
+LEAVE_TYPE_KEYWORDS = {
+    "sick": "sick", "ill": "sick", "unwell": "sick", "fever": "sick", "flu": "sick",
+    "vacation": "vacation", "holiday": "vacation", "holidays": "vacation",
+    "pto": "vacation", "annual": "vacation",
+    "personal": "personal",
+}
+
+# Words that carry no information for the extractor
+FILLER_WORDS = {
+    "i", "im", "i'm", "am", "is", "be", "will", "would", "like", "need", "want",
+    "to", "take", "taking", "a", "an", "the", "my", "me", "on", "from", "for",
+    "and", "&", "please", "pls", "plz", "send", "sent", "forward", "approval",
+    "approve", "manager", "leave", "off", "day", "days", "request", "requesting",
+    "out", "ooo", "of", "office", "feeling", "hi", "hello", "hey", "thanks",
+    "thank", "you", "-", "–", "with", "cc", "by", "it", "as", "@",
+}
+
+# Left-over words that mean there is a date expression we did not understand
+DATEISH_WORDS = {
+    "week", "weeks", "weekend", "month", "months", "year", "next", "this",
+    "coming", "last", "until", "till", "through", "except", "but", "not",
+    "half", "morning", "afternoon", "evening", "tonight", "yesterday",
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december", "jan", "feb", "mar",
+    "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "sat", "sun", "weekday", "weekdays",
+}
+
+MAX_RANGE_DAYS = 60
+
+MENTION_RE = re.compile(r"<@([A-Z0-9]+)(?:\|[^>]*)?>")
+USERNAME_RE = re.compile(r"(?<![\w<])@([a-z0-9._-]+)")
+DATE = r"(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})"
+RANGE_RE = re.compile(rf"(?:from\s+)?{DATE}\s*(?:to|till|until|through|-|–)\s*{DATE}")
+DATE_RE = re.compile(DATE)
+RELATIVE_RE = re.compile(r"\b(day after tomorrow|today|tomorrow|tmrw|tmr)\b")
+WEEKDAY_RE = re.compile(
+    r"\b(?:(next|this|coming)\s+)?(" + "|".join(sorted(WEEKDAYS, key=len, reverse=True)) + r")\b"
+)
+
+FAST_PATH_STATS = {"fast_path": 0, "llm": 0}
+
+
+def _to_date(day, month, year):
+    try:
+        return datetime(int(year), int(month), int(day)).date()
+    except ValueError:
+        return None
+
+
+def _next_weekday(today, weekday):
+    """First `weekday` strictly after today ("next Monday" on a Saturday -> in 2 days)."""
+    return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+
+
+def fast_parse_leave_request(user_message: str, user_tz: str, now=None):
+    """
+    Rule-based extraction for the common shapes of leave request, e.g.
+    "sick today <@U123>" or "vacation 25-06-2025 to 28-06-2025 <@U123>".
+
+    Returns (leave_info, confidence). leave_info has the same keys as the LLM
+    output; confidence is 0.0 when anything in the message looks like
+    something the rules don't cover (reasons, month names, "next week", ...),
+    in which case the caller should ask the LLM instead.
+    """
+    try:
+        tz = pytz.timezone(user_tz)
+    except Exception:
+        tz = pytz.timezone("UTC")
+    today = (now or datetime.now(tz)).astimezone(tz).date()
+
+    text = user_message.strip()
+    mentions = MENTION_RE.findall(text)
+    if MENTION_RE.match(text):
+        # app_mention text starts with the bot's own mention, which is not the
+        # manager. A lone leading mention could be either, so defer to the LLM.
+        if len(mentions) == 1:
+            return None, 0.0
+        text = MENTION_RE.sub(" ", text, count=1)
+        mentions = mentions[1:]
+    text = MENTION_RE.sub(" ", text).lower()
+    usernames = USERNAME_RE.findall(text)
+    text = USERNAME_RE.sub(" ", text)
+    if len(mentions) + len(usernames) > 1:
+        return None, 0.0
+
+    dates = []
+
+    def take_range(m):
+        start = _to_date(*m.group(1, 2, 3))
+        end = _to_date(*m.group(4, 5, 6))
+        if not start or not end or end < start or (end - start).days > MAX_RANGE_DAYS:
+            dates.append(None)
+        else:
+            dates.extend(start + timedelta(days=n) for n in range((end - start).days + 1))
+        return " "
+
+    def take_date(m):
+        dates.append(_to_date(*m.group(1, 2, 3)))
+        return " "
+
+    def take_relative(m):
+        offset = {"today": 0, "tomorrow": 1, "tmrw": 1, "tmr": 1, "day after tomorrow": 2}
+        dates.append(today + timedelta(days=offset[m.group(1)]))
+        return " "
+
+    def take_weekday(m):
+        qualifier, name = m.group(1), m.group(2)
+        weekday = WEEKDAYS[name]
+        if qualifier is None and weekday == today.weekday():
+            # Bare "Monday" said on a Monday: today or next week? Let the LLM decide.
+            dates.append(None)
+        elif qualifier == "this" and weekday == today.weekday():
+            dates.append(today)
+        else:
+            dates.append(_next_weekday(today, weekday))
+        return " "
+
+    text = RANGE_RE.sub(take_range, text)
+    text = DATE_RE.sub(take_date, text)
+    text = RELATIVE_RE.sub(take_relative, text)
+    text = WEEKDAY_RE.sub(take_weekday, text)
+    if not dates or None in dates:
+        return None, 0.0
+
+    leave_type = None
+    unknown = 0
+    for word in re.split(r"\s+", text):
+        word = word.strip(",.!?;:()'\"")
+        if not word or word in FILLER_WORDS:
+            continue
+        if word in DATEISH_WORDS or any(ch.isdigit() for ch in word):
+            return None, 0.0
+        if word in LEAVE_TYPE_KEYWORDS:
+            found = LEAVE_TYPE_KEYWORDS[word]
+            if leave_type and found != leave_type:
+                return None, 0.0
+            leave_type = found
+            continue
+        # Probably a reason or a manager name in plain text; the LLM is better at those
+        unknown += 1
+
+    confidence = 1.0
+    if leave_type is None:
+        confidence *= 0.6
+    confidence *= 0.8 ** unknown
+
+    if mentions:
+        manager_mention = f"<@{mentions[0]}>"
+    elif usernames:
+        manager_mention = f"@{usernames[0]}"
+    else:
+        manager_mention = None
+
+    leave_info = {
+        "leave_type": leave_type,
+        "leave_dates": [d.strftime("%d-%m-%Y") for d in sorted(set(dates))],
+        "leave_reason": None,
+        "manager_mention": manager_mention,
+    }
+    return leave_info, confidence
+
+
+def record_parse_path(fast: bool):
+    FAST_PATH_STATS["fast_path" if fast else "llm"] += 1
+
+
+def fast_path_snapshot():
+    total = FAST_PATH_STATS["fast_path"] + FAST_PATH_STATS["llm"]
+    return {
+        **FAST_PATH_STATS,
+        "fast_path_ratio": round(FAST_PATH_STATS["fast_path"] / total, 3) if total else 0.0,
+    }
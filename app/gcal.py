@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from .date_ranges import merge_date_ranges
+from .tracing import span
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+# Google's batch endpoint takes at most 50 calls per request for Calendar
+BATCH_LIMIT = 50
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+def leave_event_id(request_id, start):
+    """
+    Deterministic Calendar event id for one range of a leave request, so a
+    retried write hits 409 instead of creating a duplicate. Calendar ids
+    must be base32hex (a-v, 0-9); hex digits qualify.
+    """
+    return "lv" + hashlib.sha1(f"{request_id}:{start.isoformat()}".encode()).hexdigest()
+
+
+def fallback_request_id(leave_info):
+    """
+    Stable id for callers that don't have a stored request (legacy buttons).
+    """
+    raw = json.dumps(
+        [leave_info.get("user_id"), sorted(leave_info.get("leave_dates") or [])], sort_keys=True
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def build_ooo_event(request_id, leave_info, start, end):
+    return {
+        'id': leave_event_id(request_id, start),
+        'summary': 'Out of Office',
+        'description': leave_info.get('leave_reason') or '',
+        'start': {'date': start.isoformat(), 'timeZone': 'UTC'},
+        'end': {'date': end.isoformat(), 'timeZone': 'UTC'},
+        'transparency': 'opaque',
+        'visibility': 'default',
+    }
+
+
+class CalendarWriter:
+    """
+    Long-lived Google Calendar client.
+
+    Credentials are read from `<creds_dir>/token.json` once and the service is
+    built from the discovery document bundled with google-api-python-client
+    (no discovery fetch). A daemon thread refreshes the access token shortly
+    before it expires and writes it back to token.json. Pass `service` (and
+    `batch_uri`, which the discovery document otherwise pins to
+    googleapis.com) to run against a local stub instead.
+
+    The Google libraries are imported when the first writer is created, not
+    when this module is.
+    """
+    def __init__(self, creds_dir=None, service=None, batch_uri=None):
+        self.creds_dir = creds_dir
+        self.batch_uri = batch_uri
+        self._lock = threading.Lock()  # httplib2 connections are not thread-safe
+        self._stop = threading.Event()
+        self.credentials = None
+        if service is not None:
+            self.service = service
+            return
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build
+
+        self.token_file = os.path.join(creds_dir, "token.json")
+        self.credentials = Credentials.from_authorized_user_file(self.token_file, SCOPES)
+        if not self.credentials.valid:
+            self._refresh()
+        self.service = build('calendar', 'v3', credentials=self.credentials,
+                             static_discovery=True, cache_discovery=False)
+        threading.Thread(target=self._refresh_loop, name="gcal-token-refresh", daemon=True).start()
+
+    def _refresh(self):
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            self.credentials.refresh(Request())
+        try:
+            with open(self.token_file, "w") as f:
+                f.write(self.credentials.to_json())
+        except OSError as e:
+            print(f"[CalendarWriter] Could not save refreshed token: {e}")
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            expiry = self.credentials.expiry  # naive UTC
+            if expiry is None:
+                wait = 600.0
+            else:
+                wait = max(30.0, (expiry - REFRESH_MARGIN - datetime.utcnow()).total_seconds())
+            if self._stop.wait(wait):
+                return
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"[CalendarWriter] Token refresh failed: {e}")
+
+    def close(self):
+        self._stop.set()
+
+    def write_leaves(self, items, strict=False):
+        """
+        Write OOO events for many leave requests, batching up to 50 inserts per
+        HTTP round trip. `items` is [(request_id, leave_info, calendar_id), ...].
+        Consecutive days become one all-day event. Returns
+        {"<calendar_id>:<event_id>": status} where status is "created",
+        "exists" (written by an earlier attempt) or an error message. With
+        `strict`, the first failed insert is raised instead, after every
+        batch has been sent.
+        """
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import BatchHttpRequest
+
+        calls = []
+        for request_id, leave_info, calendar_id in items:
+            for start, end in merge_date_ranges(leave_info.get('leave_dates')):
+                calls.append((calendar_id, build_ooo_event(request_id, leave_info, start, end)))
+
+        results = {}
+        errors = []
+
+        def on_response(part_id, response, exception):
+            if exception is None:
+                results[part_id] = "created"
+            elif isinstance(exception, HttpError) and exception.resp.status == 409:
+                results[part_id] = "exists"
+            else:
+                results[part_id] = str(exception)
+                errors.append(exception)
+                print(f"[CalendarWriter] Insert {part_id} failed: {exception}")
+
+        for offset in range(0, len(calls), BATCH_LIMIT):
+            if self.batch_uri:
+                batch = BatchHttpRequest(callback=on_response, batch_uri=self.batch_uri)
+            else:
+                batch = self.service.new_batch_http_request(callback=on_response)
+            for calendar_id, body in calls[offset:offset + BATCH_LIMIT]:
+                # Event ids repeat across calendars, batch part ids must not
+                batch.add(self.service.events().insert(calendarId=calendar_id, body=body),
+                          request_id=f"{calendar_id}:{body['id']}")
+            with self._lock, span("gcal.batch", kind="external"):
+                batch.execute()
+        if strict and errors:
+            raise errors[0]
+        return results
+
+    def write_leave(self, request_id, leave_info, calendar_id, strict=False):
+        return self.write_leaves([(request_id, leave_info, calendar_id)], strict=strict)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_calendar_writer(creds_dir):
+    """
+    One CalendarWriter per credentials directory for the life of the process.
+    """
+    with _writers_lock:
+        writer = _writers.get(creds_dir)
+        if writer is None:
+            writer = _writers[creds_dir] = CalendarWriter(creds_dir)
+        return writer
@@ -0,0 +1,135 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from .date_ranges import merge_date_ranges
+from .gcal import leave_event_id
+
+PRODID = "-//FlexiOff//Leave Feed//EN"
+
+
+def escape_text(value):
+    """
+    RFC 5545 TEXT escaping.
+    """
+    return (
+        (value or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line):
+    """
+    Fold a content line to 75 octets, as RFC 5545 requires, without splitting
+    a UTF-8 sequence.
+    """
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts = []
+    limit = 75
+    while data:
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def render_event(uid, start, end, summary, description="", dtstamp=None):
+    """
+    One all-day VEVENT; `end` is exclusive (the day after the last leave day).
+    """
+    dtstamp = dtstamp or datetime.now(timezone.utc)
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{dtstamp.strftime('%Y%m%dT%H%M%SZ')}",
+        f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{end.strftime('%Y%m%d')}",
+        f"SUMMARY:{escape_text(summary)}",
+        "TRANSP:OPAQUE",
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(description)}")
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
+
+
+def calendar_header(name=None):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN"]
+    if name:
+        lines.append(f"X-WR-CALNAME:{escape_text(name)}")
+    return "".join(fold_line(line) for line in lines)
+
+
+CALENDAR_FOOTER = "END:VCALENDAR\r\n"
+
+
+class EventTextCache:
+    """
+    LRU of serialized VEVENT text. Keys include the request's updated_at, so
+    a status change naturally misses and re-renders.
+    """
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return text
+        text = render()
+        with self._lock:
+            self.stats["misses"] += 1
+            self._entries[key] = text
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+
+event_text_cache = EventTextCache()
+
+
+def feed_etag(*parts):
+    return '"' + hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest() + '"'
+
+
+def iter_leave_feed(leaves, name=None, user_label=None):
+    """
+    Yield an iCalendar feed chunk by chunk for stored leave requests (dicts
+    from LeaveStore.iter_team_leaves). Consecutive days are merged exactly as
+    on the Google Calendar path.
+    """
+    user_label = user_label or (lambda user_id: user_id)
+    yield calendar_header(name)
+    for leave in leaves:
+        for start, end in merge_date_ranges(leave["leave_dates"]):
+            key = (leave["request_id"], start, leave["updated_at"])
+
+            def render(leave=leave, start=start, end=end):
+                leave_type = (leave.get("leave_type") or "leave").capitalize()
+                suffix = "" if leave["status"] == "approved" else f" [{leave['status']}]"
+                return render_event(
+                    uid=f"{leave_event_id(leave['request_id'], start)}@flexioff",
+                    start=start,
+                    end=end,
+                    summary=f"{user_label(leave['user_id'])}: Out of Office ({leave_type}){suffix}",
+                    description=leave.get("leave_reason") or "",
+                    dtstamp=datetime.fromtimestamp(leave["updated_at"], timezone.utc),
+                )
+
+            yield event_text_cache.get_or_render(key, render)
+    yield CALENDAR_FOOTER
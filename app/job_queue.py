@@ -0,0 +1,445 @@
+import asyncio
+import heapq
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from .event_queue import StageStats
+from .tracing import tracer, current_trace
+
+# Lower runs first: approve/deny clicks go ahead of new leave parses
+LANES = {"interactive": 0, "parse": 1}
+
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id     TEXT PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    lane       TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    run_at     REAL NOT NULL,
+    trace_id   TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_owners (
+    owner   TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+"""
+
+# Failures worth another attempt, by class name so the SDKs needn't be imported
+TRANSIENT_ERROR_NAMES = {
+    # openai
+    "RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+    # aiohttp
+    "ClientConnectionError", "ClientPayloadError", "ServerTimeoutError",
+}
+TRANSIENT_SLACK_ERRORS = {"ratelimited", "service_unavailable", "internal_error", "fatal_error", "request_timeout"}
+
+_current_job = ContextVar("current_job", default=None)
+
+
+def is_transient(error):
+    """
+    True for timeouts, connection errors, 408/429/5xx responses and Slack's
+    retryable error codes; anything else (bad input, a bug) fails for good.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if isinstance(status, int) and (status in (408, 429) or status >= 500):
+        return True
+    data = getattr(response, "data", None)
+    return isinstance(data, dict) and data.get("error") in TRANSIENT_SLACK_ERRORS
+
+
+class Job:
+    __slots__ = ("job_id", "kind", "lane", "payload", "attempts", "trace_id", "ready_at")
+
+    def __init__(self, job_id, kind, lane, payload, attempts=0, trace_id=None, ready_at=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.lane = lane
+        self.payload = payload
+        self.attempts = attempts
+        self.trace_id = trace_id
+        self.ready_at = ready_at or time.time()
+
+
+class JobKind:
+    def __init__(self, handler, lane, on_failure=None):
+        self.handler = handler
+        self.lane = lane
+        self.on_failure = on_failure
+
+
+class JobScheduler:
+    """
+    Durable background jobs for work that must not be lost (slash commands,
+    approve/deny clicks).
+
+    `submit()` writes the job to a SQLite journal before returning, so a job
+    acked to Slack survives a restart. A pool of `workers` coroutines runs
+    jobs by lane (LANES, lowest first) and then oldest first. A handler that
+    raises a transient error (see is_transient) is retried with exponential
+    backoff and jitter, up to `max_attempts`; after that, or for any other
+    error, the job is marked failed and its kind's `on_failure` runs.
+    Finished jobs are deleted from the journal. Journal writes run in a
+    thread, off the event loop.
+
+    Several processes (uvicorn workers) may share one journal. Every job
+    has an owner, the process that runs it; each scheduler renews a lease
+    in `job_owners` every `lease / 3` seconds. On start and at each renewal
+    a scheduler claims, in one UPDATE, the unfinished jobs whose owner's
+    lease has lapsed (a crashed or stopped process), so each job is
+    replayed by exactly one process. A job is only run if it is still ours
+    when it starts.
+
+    Handlers take the JSON payload given to `submit()` and may run more than
+    once (retry, replay after a crash). A handler with steps that must not
+    be repeated records them with `checkpoint()` and skips them next time.
+    """
+    def __init__(self, path, workers=4, max_attempts=5, retry_base=1.0, retry_max=60.0,
+                 failed_retention=7 * 86400, lease=30.0):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.failed_retention = failed_retention
+        self.lease = lease
+        self.owner = self._new_owner()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # Journals from before job owners existed
+        if "owner" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self.kinds = {}
+        self._ready = []    # heap of (lane rank, seq, job)
+        self._delayed = []  # heap of (run_at, seq, job)
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._lease_task = None
+        self._stopping = False
+        self.running = 0
+        self.counters = {"submitted": 0, "succeeded": 0, "retried": 0, "failed": 0, "replayed": 0}
+        self.waits = {lane: StageStats() for lane in LANES}
+
+    @staticmethod
+    def _new_owner():
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, kind, handler, lane="parse", on_failure=None):
+        """
+        `handler(payload)` and `on_failure(payload, error)` are coroutine functions.
+        """
+        if lane not in LANES:
+            raise ValueError(f"unknown lane {lane!r}")
+        self.kinds[kind] = JobKind(handler, lane, on_failure)
+
+    # --- queueing ---
+
+    def _push(self, job):
+        self._seq += 1
+        if job.ready_at > time.time():
+            heapq.heappush(self._delayed, (job.ready_at, self._seq, job))
+        else:
+            heapq.heappush(self._ready, (LANES[job.lane], self._seq, job))
+        self._wakeup.set()
+
+    def _execute(self, sql, params=()):
+        return self._conn().execute(sql, params).rowcount
+
+    async def _write(self, sql, params=()):
+        """
+        Run one journal statement in a thread; returns the row count.
+        """
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def submit(self, kind, payload):
+        """
+        Journal a job and queue it. Returns the job id.
+        """
+        lane = self.kinds[kind].lane
+        trace = current_trace()
+        job = Job(uuid.uuid4().hex, kind, lane, payload, trace_id=trace.trace_id if trace else None)
+        now = time.time()
+        await self._write(
+            "INSERT INTO jobs (job_id, kind, lane, payload, status, attempts, run_at, trace_id,"
+            " created_at, updated_at, owner) VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)",
+            (job.job_id, kind, lane, json.dumps(payload), QUEUED, now, job.trace_id, now, now, self.owner),
+        )
+        self.counters["submitted"] += 1
+        self._push(job)
+        return job.job_id
+
+    async def _update(self, job, status, error=None):
+        """
+        Returns False if the job now belongs to another process.
+        """
+        updated = await self._write(
+            "UPDATE jobs SET status = ?, attempts = ?, run_at = ?, last_error = ?, updated_at = ?"
+            " WHERE job_id = ? AND owner = ?",
+            (status, job.attempts, job.ready_at, error, time.time(), job.job_id, self.owner),
+        )
+        return updated == 1
+
+    async def checkpoint(self, **progress):
+        """
+        Merge `progress` into the running job's payload and journal it, so a
+        retry or a replay after a crash sees it.
+        """
+        job = _current_job.get()
+        if job is None:
+            raise RuntimeError("checkpoint() called outside a job")
+        job.payload.update(progress)
+        await self._write(
+            "UPDATE jobs SET payload = ?, updated_at = ? WHERE job_id = ?",
+            (json.dumps(job.payload), time.time(), job.job_id),
+        )
+
+    def _claim(self):
+        """
+        Renew our lease, and take over the unfinished jobs of owners whose
+        lease lapsed (one transaction, so two processes never claim the same
+        job). Also prunes old failures. Returns the claimed rows.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO job_owners (owner, seen_at) VALUES (?, ?)"
+                " ON CONFLICT (owner) DO UPDATE SET seen_at = excluded.seen_at",
+                (self.owner, now),
+            )
+            conn.execute("DELETE FROM job_owners WHERE seen_at < ?", (now - self.lease,))
+            conn.execute("DELETE FROM jobs WHERE status = ? AND updated_at < ?",
+                         (FAILED, now - self.failed_retention))
+            rows = conn.execute(
+                "UPDATE jobs SET owner = ? WHERE status IN (?, ?)"
+                " AND (owner IS NULL OR owner NOT IN (SELECT owner FROM job_owners))"
+                " RETURNING *",
+                (self.owner, QUEUED, RUNNING),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return sorted(rows, key=lambda row: row["created_at"])
+
+    async def _adopt(self):
+        """
+        Claim orphaned jobs and queue them. Returns how many were claimed.
+        """
+        rows = await asyncio.to_thread(self._claim)
+        for row in rows:
+            job = Job(row["job_id"], row["kind"], row["lane"], json.loads(row["payload"]),
+                      attempts=row["attempts"], trace_id=row["trace_id"], ready_at=row["run_at"])
+            if job.kind not in self.kinds or job.lane not in LANES:
+                await self._update(job, FAILED, f"unknown job kind {job.kind!r}")
+                continue
+            self._push(job)
+        self.counters["replayed"] += len(rows)
+        return len(rows)
+
+    async def _renew_lease(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                adopted = await self._adopt()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[JobScheduler] Lease renewal failed: {e}")
+                continue
+            if adopted:
+                print(f"[JobScheduler] Took over {adopted} jobs from a stopped process")
+
+    async def _next_job(self):
+        while True:
+            now = time.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, job = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (LANES[job.lane], seq, job))
+            if self._ready:
+                return heapq.heappop(self._ready)[2]
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- running ---
+
+    def backoff(self, attempts):
+        """
+        Seconds before retry number `attempts`: exponential, capped, with
+        "equal jitter" so retries after an outage don't arrive together.
+        """
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _run(self, job):
+        kind = self.kinds[job.kind]
+        job.attempts += 1
+        wait = max(0.0, time.time() - job.ready_at)
+        self.waits[job.lane].add(wait)
+        tracer.observe(f"job_wait.{job.lane}", wait, kind="queue")
+        if not await self._update(job, RUNNING):
+            print(f"[JobScheduler] {job.kind} {job.job_id} was taken over by another process, skipping")
+            return
+        token = _current_job.set(job)
+        try:
+            with tracer.trace(f"job {job.kind}", trace_id=job.trace_id), tracer.span(job.kind, kind="job"):
+                await kind.handler(job.payload)
+        except asyncio.CancelledError:
+            raise  # shutdown: left as running, replayed on the next start
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if is_transient(e) and job.attempts < self.max_attempts:
+                delay = self.backoff(job.attempts)
+                job.ready_at = time.time() + delay
+                await self._update(job, QUEUED, error)
+                self.counters["retried"] += 1
+                print(f"[JobScheduler] {job.kind} {job.job_id} attempt {job.attempts} failed ({error}), "
+                      f"retrying in {delay:.1f}s")
+                self._push(job)
+                return
+            await self._update(job, FAILED, error)
+            self.counters["failed"] += 1
+            print(f"[JobScheduler] {job.kind} {job.job_id} failed after {job.attempts} attempt(s): {error}")
+            if kind.on_failure is not None:
+                try:
+                    await kind.on_failure(job.payload, e)
+                except Exception as notify_error:
+                    print(f"[JobScheduler] on_failure for {job.kind} failed: {notify_error}")
+            return
+        finally:
+            _current_job.reset(token)
+        await self._write("DELETE FROM jobs WHERE job_id = ? AND owner = ?", (job.job_id, self.owner))
+        self.counters["succeeded"] += 1
+
+    async def _worker(self, n):
+        while not self._stopping:
+            job = await self._next_job()
+            self.running += 1
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[JobScheduler] worker-{n} error running {job.kind} {job.job_id}: {e}")
+            finally:
+                self.running -= 1
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._stopping = False
+        # A fresh id, so a restart adopts what the previous run released
+        self.owner = self._new_owner()
+        replayed = await self._adopt()
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"job-worker-{n}")
+            for n in range(self.workers)
+        ]
+        self._lease_task = asyncio.create_task(self._renew_lease(), name="job-lease")
+        print(f"[JobScheduler] Started {self.workers} workers, replayed {replayed} unfinished jobs")
+
+    async def stop(self, drain_timeout=5.0):
+        """
+        Let running jobs finish for up to `drain_timeout`; queued and
+        interrupted jobs stay in the journal, and giving up our lease lets
+        another process (or the next start) take them over.
+        """
+        self._stopping = True
+        deadline = time.monotonic() + drain_timeout
+        while self.running and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        tasks = self._tasks + ([self._lease_task] if self._lease_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._lease_task = None
+        self._ready.clear()
+        self._delayed.clear()
+        try:
+            await self._write("DELETE FROM job_owners WHERE owner = ?", (self.owner,))
+        except sqlite3.Error as e:
+            print(f"[JobScheduler] Could not release lease: {e}")
+
+    # --- metrics ---
+
+    def depth(self):
+        depth = {lane: {"ready": 0, "delayed": 0} for lane in LANES}
+        for _, _, job in self._ready:
+            depth[job.lane]["ready"] += 1
+        for _, _, job in self._delayed:
+            depth[job.lane]["delayed"] += 1
+        return depth
+
+    def snapshot(self):
+        depth = self.depth()
+        return {
+            "workers": len(self._tasks),
+            "running": self.running,
+            **self.counters,
+            "lanes": {lane: {**depth[lane], "wait": self.waits[lane].as_dict()} for lane in LANES},
+        }
+
+    def prometheus(self):
+        lines = [
+            "# HELP flexioff_jobs_total Background jobs by outcome.",
+            "# TYPE flexioff_jobs_total counter",
+        ]
+        for outcome, n in self.counters.items():
+            lines.append(f'flexioff_jobs_total{{outcome="{outcome}"}} {n}')
+        lines += [
+            "# HELP flexioff_job_queue_depth Jobs waiting to run (delayed = waiting to retry).",
+            "# TYPE flexioff_job_queue_depth gauge",
+        ]
+        for lane, counts in self.depth().items():
+            for state, n in counts.items():
+                lines.append(f'flexioff_job_queue_depth{{lane="{lane}",state="{state}"}} {n}')
+        lines += [
+            "# HELP flexioff_jobs_running Jobs being run right now.",
+            "# TYPE flexioff_jobs_running gauge",
+            f"flexioff_jobs_running {self.running}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,214 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import date, datetime
+
+from .leave_store import PENDING, APPROVED
+
+ACTIVE_STATUSES = (PENDING, APPROVED)
+# Days listed individually in the approval note; the rest are summarised
+MAX_NOTE_DAYS = 10
+LOAD_CHUNK = 1000
+
+
+def day_number(dd_mm_yyyy):
+    return datetime.strptime(dd_mm_yyyy, "%d-%m-%Y").toordinal()
+
+
+def iso_day_number(iso_day):
+    return date.fromisoformat(iso_day).toordinal()
+
+
+class LeaveIndex:
+    """
+    In-memory index of pending and approved leave days, for overlap and team
+    capacity checks without a SQL round trip per date.
+
+    Days are stored as proleptic ordinals. Users and teams are keyed by
+    (team_id, id), so workspaces never see each other's leave. Each user
+    has a sorted list of (day, request_id), so "does this user already have
+    leave on D" is a bisect (O(log n)). Each team (the requests routed to
+    one manager) has a day -> [request_id] map, so "who else is out on D"
+    is one dict lookup.
+    A few thousand employees with years of history is a few hundred
+    thousand entries.
+
+    LeaveStore calls `on_change` for every create and status change; `load`
+    reads what is already on disk. Changes that arrive while loading are
+    merged, so the index can be loaded in the background after startup.
+    """
+    def __init__(self, capacity_limit=0):
+        self.capacity_limit = capacity_limit
+        self.requests = {}    # request_id -> (team_id, user_id, manager_id, days, status)
+        self.user_days = {}   # (team_id, user_id) -> sorted [(day, request_id)]
+        self.team_days = {}   # (team_id, manager_id) -> {day: [request_id]}
+        self.loaded = False
+        self._late_status = {}  # status changes seen while loading
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _add(self, request_id, team_id, user_id, manager_id, days, status):
+        if request_id in self.requests:
+            return
+        days = tuple(sorted(set(days)))
+        self.requests[request_id] = (team_id, user_id, manager_id, days, status)
+        user_days = self.user_days.setdefault((team_id, user_id), [])
+        team = self.team_days.setdefault((team_id, manager_id), {})
+        for day in days:
+            insort(user_days, (day, request_id))
+            team.setdefault(day, []).append(request_id)
+
+    def _remove(self, request_id):
+        entry = self.requests.pop(request_id, None)
+        if entry is None:
+            return
+        team_id, user_id, manager_id, days, _ = entry
+        user_days = self.user_days.get((team_id, user_id), [])
+        team = self.team_days.get((team_id, manager_id), {})
+        for day in days:
+            i = bisect_left(user_days, (day, request_id))
+            if i < len(user_days) and user_days[i] == (day, request_id):
+                del user_days[i]
+            on_day = team.get(day)
+            if on_day and request_id in on_day:
+                on_day.remove(request_id)
+                if not on_day:
+                    del team[day]
+        if not user_days:
+            self.user_days.pop((team_id, user_id), None)
+
+    def _set_status(self, request_id, status):
+        if status not in ACTIVE_STATUSES:
+            self._remove(request_id)
+        elif request_id in self.requests:
+            team_id, user_id, manager_id, days, _ = self.requests[request_id]
+            self.requests[request_id] = (team_id, user_id, manager_id, days, status)
+
+    def on_change(self, request_id, status, details=None):
+        """
+        LeaveStore listener. `details` is (team_id, user_id, manager_id,
+        iso_days) when a request is created and None for a status change.
+        """
+        with self._lock:
+            if details is not None:
+                if status in ACTIVE_STATUSES:
+                    team_id, user_id, manager_id, iso_days = details
+                    self._add(request_id, team_id, user_id, manager_id,
+                              [iso_day_number(d) for d in iso_days], status)
+                return
+            if not self.loaded:
+                self._late_status[request_id] = status
+            self._set_status(request_id, status)
+
+    def load(self, store):
+        """
+        Build the index from the store's pending and approved leave.
+        Returns the number of requests indexed.
+        """
+        by_request = {}
+        for row in store.iter_leave_days(ACTIVE_STATUSES):
+            entry = by_request.get(row["request_id"])
+            if entry is None:
+                entry = by_request[row["request_id"]] = (
+                    row["team_id"], row["user_id"], row["manager_id"], [], row["status"]
+                )
+            entry[3].append(iso_day_number(row["day"]))
+        entries = list(by_request.items())
+        # In chunks, so creates arriving meanwhile don't wait for the whole load
+        for i in range(0, len(entries), LOAD_CHUNK):
+            with self._lock:
+                for request_id, entry in entries[i:i + LOAD_CHUNK]:
+                    self._add(request_id, *entry)
+        with self._lock:
+            for request_id, status in self._late_status.items():
+                self._set_status(request_id, status)
+            self._late_status.clear()
+            self.loaded = True
+            return len(self.requests)
+
+    def ensure_loaded(self, store):
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load(store)
+
+    # --- queries ---
+
+    def user_requests_on(self, team_id, user_id, day):
+        """
+        Request ids of `user_id` that include `day` (an ordinal).
+        """
+        user_days = self.user_days.get((team_id, user_id), [])
+        i = bisect_left(user_days, (day, ""))
+        found = []
+        while i < len(user_days) and user_days[i][0] == day:
+            found.append(user_days[i][1])
+            i += 1
+        return found
+
+    def check(self, team_id, user_id, manager_id, leave_dates, exclude_request_id=None):
+        """
+        Overlap and capacity report for a (new) request in workspace `team_id`:
+
+            {"overlap": {day: [request_id, ...]},       # the user's own other leave
+             "team_out": {day: {user_id: status}},      # others on the team
+             "over_capacity": [day, ...], "capacity_limit": n}
+
+        Days are DD-MM-YYYY; unparseable dates are ignored.
+        """
+        report = {"overlap": {}, "team_out": {}, "over_capacity": [], "capacity_limit": self.capacity_limit}
+        with self._lock:
+            team = self.team_days.get((team_id, manager_id), {})
+            for label in leave_dates or []:
+                try:
+                    day = day_number(label)
+                except ValueError:
+                    continue
+                mine = [rid for rid in self.user_requests_on(team_id, user_id, day) if rid != exclude_request_id]
+                if mine:
+                    report["overlap"][label] = mine
+                others = {}
+                for request_id in team.get(day, ()):
+                    _, other, _, _, status = self.requests[request_id]
+                    if other != user_id and request_id != exclude_request_id:
+                        # Approved wins over pending when someone has both
+                        if others.get(other) != APPROVED:
+                            others[other] = status
+                if others:
+                    report["team_out"][label] = others
+                if self.capacity_limit and len(others) + 1 > self.capacity_limit:
+                    report["over_capacity"].append(label)
+        return report
+
+    def snapshot(self):
+        return {
+            "loaded": self.loaded,
+            "requests": len(self.requests),
+            "users": len(self.user_days),
+            "teams": len(self.team_days),
+            "capacity_limit": self.capacity_limit,
+        }
+
+
+def format_capacity_note(user_id, report):
+    """
+    mrkdwn lines for the manager's approval message, or None if there's
+    nothing to flag.
+    """
+    lines = []
+    if report["overlap"]:
+        lines.append(f"⚠️ <@{user_id}> already has leave on {', '.join(report['overlap'])}.")
+    if report["over_capacity"]:
+        lines.append(
+            f"🚫 Over the team limit of {report['capacity_limit']} people out on "
+            f"{', '.join(report['over_capacity'])}."
+        )
+    team_out = list(report["team_out"].items())
+    for label, others in team_out[:MAX_NOTE_DAYS]:
+        people = ", ".join(
+            f"<@{other}>" + (" (pending)" if status == PENDING else "")
+            for other, status in sorted(others.items())
+        )
+        lines.append(f"👥 Also out on {label}: {people}")
+    if len(team_out) > MAX_NOTE_DAYS:
+        lines.append(f"👥 …and others out on {len(team_out) - MAX_NOTE_DAYS} more of these days.")
+    return "\n".join(lines) or None
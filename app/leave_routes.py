@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import hmac
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from .utils import (
+    leave_store, leave_index, user_directory, parse_leave_request_llm_async,
+    extract_manager_id_from_mention, post_manager_bulk_requests, is_duplicate_leave, tenant_pool,
+)
+from .tenants import use_tenant
+from .ics_feed import iter_leave_feed, feed_etag
+from .bulk_import import BulkImport, RowError, iter_csv_rows, iter_jsonl_rows
+from .config import settings
+
+router = APIRouter(prefix="/leave")
+
+
+def require_admin(authorization: str = Header(default="")):
+    """
+    Leave data is personal: these endpoints need `Authorization: Bearer <ADMIN_API_TOKEN>`
+    and are disabled when ADMIN_API_TOKEN is not set.
+    """
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled")
+    if not hmac.compare_digest(authorization, f"Bearer {settings.ADMIN_API_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/out", dependencies=[Depends(require_admin)])
+async def leave_who_is_out(date: str, include_pending: bool = False, team_id: str = None):
+    """
+    Who is out on `date` (DD-MM-YYYY)?
+    """
+    tenant = resolve_tenant(team_id)
+    try:
+        datetime.strptime(date, "%d-%m-%Y")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be DD-MM-YYYY")
+    statuses = ("approved", "pending") if include_pending else ("approved",)
+    user_ids = await asyncio.to_thread(leave_store.who_is_out, tenant.team_id, date, statuses)
+    return {"date": date, "user_ids": user_ids}
+
+
+@router.get("/pending/{manager_id}", dependencies=[Depends(require_admin)])
+async def leave_pending_for_manager(manager_id: str, limit: int = 100, team_id: str = None):
+    tenant = resolve_tenant(team_id)
+    requests = await asyncio.to_thread(
+        leave_store.pending_for_manager, tenant.team_id, manager_id, min(limit, 1000)
+    )
+    return {"manager_id": manager_id, "requests": requests}
+
+
+def resolve_tenant(team_id):
+    """
+    Workspace for an admin request (`team_id` query parameter; ignored in
+    single-workspace mode).
+    """
+    tenant = tenant_pool.get(team_id)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="Unknown team_id")
+    return tenant
+
+
+def calendar_feed_token(manager_id, team_id=None):
+    """
+    Per-manager secret for the .ics feed URL (calendar apps can't send
+    headers). It covers the workspace too, so a feed URL can't be replayed
+    against another workspace's manager with the same id.
+    """
+    # Without a team_id (single-workspace URLs) the token is the same as before workspaces
+    scope = f"{team_id}:{manager_id}" if team_id else manager_id
+    return hmac.new(
+        settings.ADMIN_API_TOKEN.encode(), f"ics:{scope}".encode(), hashlib.sha256
+    ).hexdigest()[:32]
+
+
+def _user_label(user_id):
+    user = user_directory.peek(user_id) or {}
+    return user.get("real_name") or user_id
+
+
+@router.get("/calendar/{manager_id}.ics", name="leave_team_calendar")
+async def leave_team_calendar(manager_id: str, token: str, request: Request, include_pending: bool = False,
+                              team_id: str = None):
+    """
+    iCalendar feed of a manager's team leave. Pollers get 304 while nothing changed.
+    """
+    if not settings.ADMIN_API_TOKEN or not hmac.compare_digest(token, calendar_feed_token(manager_id, team_id)):
+        raise HTTPException(status_code=403, detail="Invalid feed token")
+    tenant = resolve_tenant(team_id)
+    statuses = ("approved", "pending") if include_pending else ("approved",)
+    count, last_update = await asyncio.to_thread(leave_store.team_version, tenant.team_id, manager_id, statuses)
+    etag = feed_etag(tenant.team_id, manager_id, statuses, count, last_update)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    leaves = await asyncio.to_thread(
+        lambda: list(leave_store.iter_team_leaves(tenant.team_id, manager_id, statuses))
+    )
+
+    async def body(chunk_events=256):
+        buf = []
+        # Streamed after this handler returns, so the workspace is selected here
+        with use_tenant(tenant):
+            for piece in iter_leave_feed(leaves, name="Team leave", user_label=_user_label):
+                buf.append(piece)
+                if len(buf) >= chunk_events:
+                    yield "".join(buf)
+                    buf = []
+                    await asyncio.sleep(0)  # let other requests run between chunks
+        yield "".join(buf)
+
+    return StreamingResponse(body(), media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+@router.get("/calendar-url/{manager_id}", dependencies=[Depends(require_admin)])
+async def leave_team_calendar_url(manager_id: str, request: Request, team_id: str = None):
+    url = request.url_for("leave_team_calendar", manager_id=manager_id)
+    workspace = f"&team_id={team_id}" if team_id else ""
+    return {"url": f"{url}?token={calendar_feed_token(manager_id, team_id)}{workspace}"}
+
+
+@router.post("/bulk", dependencies=[Depends(require_admin)])
+async def leave_bulk_import(request: Request, format: str = None, team_id: str = None):
+    """
+    HR bulk import. The body is CSV (with a header line) or JSON lines; each
+    row has user_id plus either structured fields (leave_dates, or
+    start_date/end_date, leave_type, leave_reason) or free `text` for the
+    LLM, and manager_id (or a manager mention in the text). Requests are
+    stored as pending and each manager gets one grouped DM. Progress is
+    streamed back as NDJSON, one line per row, then a summary line. In
+    multi-tenant mode `team_id` picks the workspace.
+    """
+    tenant = resolve_tenant(team_id)
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    # Read the upload up front: StreamingResponse listens for disconnects on
+    # the same receive channel, so the body can't be read while we stream
+    lines = (await request.body()).decode("utf-8-sig").splitlines()
+    rows = iter_csv_rows(lines) if fmt == "csv" else iter_jsonl_rows(lines)
+
+    # users.list carries everyone's timezone; load it once instead of a
+    # users.info call per free-text row
+    await asyncio.to_thread(tenant.user_directory.index)
+    await asyncio.to_thread(leave_index.ensure_loaded, leave_store)
+
+    def is_duplicate(user_id, manager_id, leave_info):
+        leave_dates = leave_info.get("leave_dates") or []
+        report = leave_index.check(tenant.team_id, user_id, manager_id, leave_dates)
+        return is_duplicate_leave(leave_dates, report)
+
+    async def create(user_id, manager_id, leave_info):
+        # Re-checked in the insert transaction: catches other workers' requests
+        # and duplicate rows of this upload that are still being written
+        request_id, _ = await leave_store.create_checked(tenant.team_id, user_id, manager_id, leave_info)
+        if request_id is None:
+            raise RowError("user already has leave on all of these dates")
+        return request_id
+
+    bulk = BulkImport(
+        parse_text=parse_leave_request_llm_async,
+        resolve_manager=extract_manager_id_from_mention,
+        create=create,
+        notify_manager=post_manager_bulk_requests,
+        llm_concurrency=settings.BULK_LLM_CONCURRENCY,
+        llm_timeout=settings.BULK_LLM_TIMEOUT,
+        max_rows=settings.BULK_MAX_ROWS,
+        is_duplicate=is_duplicate,
+    )
+
+    async def progress():
+        # Select the tenant around each step rather than across yields: if the
+        # client disconnects, this generator may be closed from another task
+        items = bulk.run(rows)
+        try:
+            while True:
+                with use_tenant(tenant):
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield json.dumps(item) + "\n"
+        finally:
+            with use_tenant(tenant):
+                await items.aclose()
+        print(f"[BulkImport] {bulk.counts}")
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
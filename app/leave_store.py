@@ -0,0 +1,400 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+
+PENDING = "pending"
+APPROVED = "approved"
+DENIED = "denied"
+# Listener status for a created request whose batch failed to commit
+DISCARDED = "discarded"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leave_requests (
+    request_id   TEXT PRIMARY KEY,
+    user_id      TEXT NOT NULL,
+    manager_id   TEXT NOT NULL,
+    leave_type   TEXT,
+    leave_reason TEXT,
+    status       TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL,
+    team_id      TEXT NOT NULL DEFAULT 'default'  -- workspace; 'default' in single-workspace mode
+);
+CREATE TABLE IF NOT EXISTS leave_days (
+    request_id TEXT NOT NULL REFERENCES leave_requests (request_id),
+    user_id    TEXT NOT NULL,
+    day        TEXT NOT NULL,  -- ISO YYYY-MM-DD so it sorts
+    PRIMARY KEY (request_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_leave_days_user_day ON leave_days (user_id, day);
+CREATE INDEX IF NOT EXISTS idx_leave_days_day ON leave_days (day, user_id);
+"""
+
+# Created after the team_id migration below
+INDEXES = """
+DROP INDEX IF EXISTS idx_leave_requests_manager_status;
+CREATE INDEX IF NOT EXISTS idx_leave_requests_team_manager_status
+    ON leave_requests (team_id, manager_id, status, created_at);
+"""
+
+
+def to_iso_day(dd_mm_yyyy):
+    return datetime.strptime(dd_mm_yyyy, "%d-%m-%Y").strftime("%Y-%m-%d")
+
+
+def from_iso_day(iso_day):
+    return datetime.strptime(iso_day, "%Y-%m-%d").strftime("%d-%m-%Y")
+
+
+class LeaveStore:
+    """
+    SQLite (WAL) store for leave requests. Every request belongs to a
+    workspace (`team_id`), and every query is scoped to one.
+
+    New requests are queued and written by a background thread in batches,
+    one transaction per batch, so concurrent creates share a commit.
+    `create()` returns once its batch has committed and raises if it
+    failed; `create_nowait()` returns a Future for the same. Reads and
+    status changes first wait for queued writes to land, so they always see
+    every request created before them.
+
+    `create_checked()` also re-checks the user's overlapping leave and the
+    team's capacity in SQL, inside the write transaction. Batches are
+    written under BEGIN IMMEDIATE, so that check and the insert are atomic
+    across every process sharing the file, not just this one.
+
+    Callables in `listeners` are told about every change as
+    `listener(request_id, status, details)`: details is
+    (team_id, user_id, manager_id, iso_days) for a new request, None for a
+    status change. Listeners hear about a `create()` as soon as it is
+    queued, and get DISCARDED for it if its batch then fails; a
+    `create_checked()` is announced once it has committed.
+    """
+    def __init__(self, path, batch_size=100, flush_interval=0.05):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # Stores from before workspaces: their requests belong to the single-workspace tenant
+        if "team_id" not in {row["name"] for row in conn.execute("PRAGMA table_info(leave_requests)")}:
+            conn.execute("ALTER TABLE leave_requests ADD COLUMN team_id TEXT NOT NULL DEFAULT 'default'")
+        conn.executescript(INDEXES)
+        self._writes = queue.Queue()
+        # Writes are numbered in queue order; the writer commits them in that order
+        self._progress = threading.Condition()
+        self._queued = 0
+        self._written = 0
+        self._writer = threading.Thread(target=self._write_loop, name="leave-store-writer", daemon=True)
+        self._writer.start()
+        self.listeners = []
+
+    def _notify(self, request_id, status, details=None):
+        for listener in self.listeners:
+            try:
+                listener(request_id, status, details)
+            except Exception as e:
+                print(f"[LeaveStore] Listener failed for {request_id}: {e}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # --- writes ---
+
+    def _write_loop(self):
+        conn = self._conn()
+        while True:
+            batch = [self._writes.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            results = []
+            try:
+                # IMMEDIATE: take the write lock before the checks read anything
+                conn.execute("BEGIN IMMEDIATE")
+                for request_row, day_rows, capacity_limit, _ in batch:
+                    if capacity_limit is None:
+                        results.append(request_row[0])
+                    else:
+                        report = self._conflicts(conn, request_row, day_rows, capacity_limit)
+                        # Every day already taken: a duplicate, don't store it
+                        if day_rows and len(report["overlap"]) == len(day_rows):
+                            results.append((None, report))
+                            continue
+                        results.append((request_row[0], report))
+                    conn.execute(
+                        "INSERT OR IGNORE INTO leave_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        request_row,
+                    )
+                    conn.executemany("INSERT OR IGNORE INTO leave_days VALUES (?, ?, ?)", day_rows)
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                print(f"[LeaveStore] Batch write of {len(batch)} requests failed: {e}")
+                for request_row, _, capacity_limit, done in batch:
+                    if capacity_limit is None:
+                        self._notify(request_row[0], DISCARDED)
+                    done.set_exception(e)
+            else:
+                for (request_row, day_rows, capacity_limit, done), result in zip(batch, results):
+                    if capacity_limit is not None and result[0] is not None:
+                        request_id, user_id, manager_id, _, _, status, _, _, team_id = request_row
+                        self._notify(request_id, status, (team_id, user_id, manager_id, [d for _, _, d in day_rows]))
+                    done.set_result(result)
+            finally:
+                with self._progress:
+                    self._written += len(batch)
+                    self._progress.notify_all()
+
+    @staticmethod
+    def _conflicts(conn, request_row, day_rows, capacity_limit):
+        """
+        The same report as LeaveIndex.check, from the tables: the user's
+        own pending/approved leave on these days, who else on the team is
+        out, and the days over `capacity_limit`.
+        """
+        report = {"overlap": {}, "team_out": {}, "over_capacity": [], "capacity_limit": capacity_limit}
+        if not day_rows:
+            return report
+        request_id, user_id, manager_id, *_, team_id = request_row
+        days = [day for _, _, day in day_rows]
+        day_marks = ",".join("?" * len(days))
+        rows = conn.execute(
+            "SELECT d.day, d.user_id, r.request_id, r.manager_id, r.status FROM leave_days d"
+            " JOIN leave_requests r ON r.request_id = d.request_id"
+            f" WHERE d.day IN ({day_marks}) AND r.team_id = ? AND r.status IN (?, ?)"
+            " AND (d.user_id = ? OR r.manager_id = ?) AND r.request_id != ?",
+            (*days, team_id, PENDING, APPROVED, user_id, manager_id, request_id),
+        ).fetchall()
+        team_out = {}
+        for row in rows:
+            label = from_iso_day(row["day"])
+            if row["user_id"] == user_id:
+                report["overlap"].setdefault(label, []).append(row["request_id"])
+            elif row["manager_id"] == manager_id:
+                others = team_out.setdefault(row["day"], {})
+                # Approved wins over pending when someone has both
+                if others.get(row["user_id"]) != APPROVED:
+                    others[row["user_id"]] = row["status"]
+        for day in days:
+            others = team_out.get(day, {})
+            if others:
+                report["team_out"][from_iso_day(day)] = others
+            if capacity_limit and len(others) + 1 > capacity_limit:
+                report["over_capacity"].append(from_iso_day(day))
+        return report
+
+    def _queue(self, team_id, user_id, manager_id, leave_info, status, request_id, capacity_limit):
+        request_id = request_id or uuid.uuid4().hex
+        now = time.time()
+        days = []
+        for day in leave_info.get("leave_dates") or []:
+            try:
+                days.append(to_iso_day(day))
+            except ValueError:
+                print(f"[LeaveStore] Skipping unparseable date {day!r} for {request_id}")
+        request_row = (
+            request_id, user_id, manager_id, leave_info.get("leave_type"),
+            leave_info.get("leave_reason"), status, now, now, team_id,
+        )
+        days = sorted(set(days))
+        done = Future()
+        with self._progress:
+            self._queued += 1
+            self._writes.put((request_row, [(request_id, user_id, day) for day in days], capacity_limit, done))
+        return request_id, days, done
+
+    def create_nowait(self, team_id, user_id, manager_id, leave_info, status=PENDING, request_id=None):
+        """
+        Queue a new leave request. Returns a Future that resolves to its id
+        once the batch holding it commits, or raises the write error.
+        """
+        request_id, days, done = self._queue(team_id, user_id, manager_id, leave_info, status, request_id, None)
+        self._notify(request_id, status, (team_id, user_id, manager_id, days))
+        return done
+
+    async def create(self, team_id, user_id, manager_id, leave_info, status=PENDING, request_id=None):
+        """
+        Store a new leave request and return its id once it is committed.
+        Queued before the first await, so a check made just before the call
+        sees it in the listeners' view.
+        """
+        done = self.create_nowait(team_id, user_id, manager_id, leave_info, status=status, request_id=request_id)
+        return await asyncio.wrap_future(done)
+
+    async def create_checked(self, team_id, user_id, manager_id, leave_info, capacity_limit=0,
+                             status=PENDING, request_id=None):
+        """
+        Store a new leave request unless the user already has leave on every
+        one of its days. Returns (request_id or None, conflict report), the
+        report being the one LeaveIndex.check gives, as of the insert.
+        """
+        _, _, done = self._queue(team_id, user_id, manager_id, leave_info, status, request_id, capacity_limit)
+        return await asyncio.wrap_future(done)
+
+    def flush(self):
+        """
+        Block until the writes queued before this call are committed (or
+        failed). Writes queued meanwhile don't hold it up.
+        """
+        with self._progress:
+            target = self._queued
+            self._progress.wait_for(lambda: self._written >= target)
+
+    def transition(self, team_id, request_id, from_status, to_status):
+        """
+        Atomically move a request of workspace `team_id` from `from_status`
+        to `to_status`. Returns False if it was not in `from_status` (e.g.
+        already approved) or belongs to another workspace.
+        """
+        self.flush()
+        cur = self._conn().execute(
+            "UPDATE leave_requests SET status = ?, updated_at = ?"
+            " WHERE request_id = ? AND team_id = ? AND status = ?",
+            (to_status, time.time(), request_id, team_id, from_status),
+        )
+        if cur.rowcount != 1:
+            return False
+        self._notify(request_id, to_status)
+        return True
+
+    # --- reads ---
+
+    def get(self, request_id):
+        """
+        Returns the request as a dict (leave_dates as DD-MM-YYYY) or None.
+        """
+        self.flush()
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM leave_requests WHERE request_id = ?", (request_id,)).fetchone()
+        if row is None:
+            return None
+        days = conn.execute(
+            "SELECT day FROM leave_days WHERE request_id = ? ORDER BY day", (request_id,)
+        ).fetchall()
+        return {**dict(row), "leave_dates": [from_iso_day(d["day"]) for d in days]}
+
+    def who_is_out(self, team_id, day, statuses=(APPROVED,)):
+        """
+        User ids in the workspace with leave on `day` (DD-MM-YYYY) in one of `statuses`.
+        """
+        self.flush()
+        marks = ",".join("?" * len(statuses))
+        rows = self._conn().execute(
+            "SELECT DISTINCT d.user_id FROM leave_days d"
+            " JOIN leave_requests r ON r.request_id = d.request_id"
+            f" WHERE d.day = ? AND r.team_id = ? AND r.status IN ({marks})"
+            " ORDER BY d.user_id",
+            (to_iso_day(day), team_id, *statuses),
+        ).fetchall()
+        return [r["user_id"] for r in rows]
+
+    def pending_for_manager(self, team_id, manager_id, limit=100):
+        """
+        Oldest-first pending requests waiting on `manager_id`.
+        """
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT r.*, group_concat(d.day) AS days FROM ("
+            "   SELECT * FROM leave_requests"
+            "   WHERE team_id = ? AND manager_id = ? AND status = ?"
+            "   ORDER BY created_at LIMIT ?"
+            " ) r LEFT JOIN leave_days d ON d.request_id = r.request_id"
+            " GROUP BY r.request_id ORDER BY r.created_at",
+            (team_id, manager_id, PENDING, limit),
+        ).fetchall()
+        requests = []
+        for row in rows:
+            request = dict(row)
+            days = request.pop("days")
+            request["leave_dates"] = [from_iso_day(d) for d in sorted(days.split(","))] if days else []
+            requests.append(request)
+        return requests
+
+    def user_days(self, team_id, user_id, start_day, end_day, statuses=(PENDING, APPROVED)):
+        """
+        Leave days (DD-MM-YYYY) a user already has between two dates, inclusive.
+        """
+        self.flush()
+        marks = ",".join("?" * len(statuses))
+        rows = self._conn().execute(
+            "SELECT DISTINCT d.day FROM leave_days d"
+            " JOIN leave_requests r ON r.request_id = d.request_id"
+            f" WHERE d.user_id = ? AND d.day BETWEEN ? AND ? AND r.team_id = ? AND r.status IN ({marks})"
+            " ORDER BY d.day",
+            (user_id, to_iso_day(start_day), to_iso_day(end_day), team_id, *statuses),
+        ).fetchall()
+        return [from_iso_day(r["day"]) for r in rows]
+
+    def team_version(self, team_id, manager_id, statuses=(APPROVED,)):
+        """
+        Cheap change marker for a manager's team feed: (count, last update).
+        """
+        self.flush()
+        marks = ",".join("?" * len(statuses))
+        row = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(MAX(updated_at), 0) FROM leave_requests"
+            f" WHERE team_id = ? AND manager_id = ? AND status IN ({marks})",
+            (team_id, manager_id, *statuses),
+        ).fetchone()
+        return row[0], row[1]
+
+    def iter_team_leaves(self, team_id, manager_id, statuses=(APPROVED,)):
+        """
+        Yield every request of a manager's team in `statuses`, oldest first,
+        with leave_dates as DD-MM-YYYY. Rows are streamed from the cursor.
+        """
+        self.flush()
+        marks = ",".join("?" * len(statuses))
+        cursor = self._conn().execute(
+            "SELECT r.*, group_concat(d.day) AS days FROM leave_requests r"
+            " LEFT JOIN leave_days d ON d.request_id = r.request_id"
+            f" WHERE r.team_id = ? AND r.manager_id = ? AND r.status IN ({marks})"
+            " GROUP BY r.request_id ORDER BY r.created_at",
+            (team_id, manager_id, *statuses),
+        )
+        for row in cursor:
+            request = dict(row)
+            days = request.pop("days")
+            request["leave_dates"] = [from_iso_day(d) for d in sorted(days.split(","))] if days else []
+            yield request
+
+    def iter_leave_days(self, statuses=(APPROVED,)):
+        """
+        Yield one row (request_id, team_id, user_id, manager_id, status,
+        ISO day) per leave day of every request in `statuses`, streamed from
+        the cursor.
+        """
+        self.flush()
+        marks = ",".join("?" * len(statuses))
+        yield from self._conn().execute(
+            "SELECT r.request_id, r.team_id, r.user_id, r.manager_id, r.status, d.day FROM leave_requests r"
+            " JOIN leave_days d ON d.request_id = r.request_id"
+            f" WHERE r.status IN ({marks})",
+            statuses,
+        )
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytz
+
+MENTION_RE = re.compile(r"<@([A-Z0-9]+)(?:\|[^>]*)?>|(?<![\w<])@([A-Za-z0-9._-]+)")
+
+
+def normalize_message(user_message: str):
+    """
+    Canonical form of a leave message for cache keys. Mentions are replaced
+    by positional placeholders so "sick today <@U1>" and "Sick  today <@U2>"
+    share an entry:
+
+    >>> normalize_message("Sick  today <@U1>!")
+    ('sick today <@m0>', {'<@M0>': '<@U1>'})
+    """
+    bindings = {}
+
+    def placeholder(m):
+        if m.group(1):
+            token, real = f"<@M{len(bindings)}>", f"<@{m.group(1)}>"
+        else:
+            token, real = f"@m{len(bindings)}", f"@{m.group(2)}"
+        bindings[token] = real
+        return token
+
+    text = MENTION_RE.sub(placeholder, user_message)
+    text = re.sub(r"\s+", " ", text.strip().lower()).rstrip(".!?")
+    return text, bindings
+
+
+def _rebind(value, bindings):
+    """
+    Replace every occurrence of bindings' keys by their values in the string
+    fields of a leave_info dict (and in lists of strings).
+    """
+    # Longest first so "<@U12>" isn't clobbered by the replacement for "<@U1>"
+    pairs = sorted(bindings.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def sub(s):
+        for old, new in pairs:
+            s = s.replace(old, new)
+        return s
+
+    if isinstance(value, str):
+        return sub(value)
+    if isinstance(value, list):
+        return [_rebind(v, bindings) for v in value]
+    if isinstance(value, dict):
+        return {k: _rebind(v, bindings) for k, v in value.items()}
+    return value
+
+
+def _local_day(user_tz: str):
+    """
+    Returns (local date string, epoch seconds of the next local midnight).
+    """
+    try:
+        tz = pytz.timezone(user_tz)
+    except Exception:
+        tz = pytz.timezone("UTC")
+    now = datetime.now(tz)
+    midnight = tz.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+    return now.strftime("%Y-%m-%d"), midnight.timestamp()
+
+
+class LLMResponseCache:
+    """
+    Cache of parsed LLM results keyed by (normalized message, timezone,
+    local date). The system prompt only depends on the timezone and the local
+    date, so an identical normalized message yields the same answer until the
+    user's midnight, which is when the entry expires.
+
+    The memory tier is an LRU capped at `max_entries`; when `sqlite_path` is
+    set, entries are also written to SQLite and survive restarts. Async
+    callers use `get_async`/`put_async`, which answer memory hits inline and
+    run the SQLite side in a worker thread.
+    """
+    def __init__(self, max_entries=5000, sqlite_path=None, namespace=""):
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self._entries = OrderedDict()  # key -> (leave_info template, expires_at)
+        self._lock = threading.Lock()
+        self.sqlite_path = sqlite_path
+        self._local = threading.local()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        if sqlite_path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._db().execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.sqlite_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.sqlite_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, normalized, user_tz, local_date):
+        raw = f"{self.namespace}|{user_tz}|{local_date}|{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, template, expires_at):
+        with self._lock:
+            self._entries[key] = (template, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+        return None
+
+    def _get_disk(self, key, now):
+        row = self._db().execute(
+            "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        template = json.loads(row[0])
+        self._remember(key, template, row[1])
+        self.stats["disk_hits"] += 1
+        return template
+
+    def _lookup_key(self, user_message, user_tz):
+        normalized, bindings = normalize_message(user_message)
+        local_date, _ = _local_day(user_tz)
+        return self._key(normalized, user_tz, local_date), bindings
+
+    def get(self, user_message: str, user_tz: str):
+        key, bindings = self._lookup_key(user_message, user_tz)
+        now = time.time()
+        template = self._get_memory(key, now)
+        if template is None and self.sqlite_path:
+            template = self._get_disk(key, now)
+        if template is None:
+            self.stats["misses"] += 1
+            return None
+        return _rebind(template, bindings)
+
+    async def get_async(self, user_message: str, user_tz: str):
+        """
+        get() for the event loop: a memory miss goes to SQLite in a thread.
+        """
+        key, bindings = self._lookup_key(user_message, user_tz)
+        now = time.time()
+        template = self._get_memory(key, now)
+        if template is None and self.sqlite_path:
+            template = await asyncio.to_thread(self._get_disk, key, now)
+        if template is None:
+            self.stats["misses"] += 1
+            return None
+        return _rebind(template, bindings)
+
+    def _store(self, user_message, user_tz, leave_info):
+        """
+        Remember in memory; returns the SQLite row to write, if any.
+        """
+        normalized, bindings = normalize_message(user_message)
+        local_date, expires_at = _local_day(user_tz)
+        key = self._key(normalized, user_tz, local_date)
+        # Store with placeholders, re-bound to the real mentions on a hit
+        template = _rebind(leave_info, {real: token for token, real in bindings.items()})
+        self._remember(key, template, expires_at)
+        self.stats["stores"] += 1
+        return (key, json.dumps(template), expires_at) if self.sqlite_path else None
+
+    def _put_disk(self, row):
+        self._db().execute("INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)", row)
+
+    def put(self, user_message: str, user_tz: str, leave_info: dict):
+        if not leave_info:
+            return
+        row = self._store(user_message, user_tz, leave_info)
+        if row:
+            self._put_disk(row)
+
+    async def put_async(self, user_message: str, user_tz: str, leave_info: dict):
+        """
+        put() for the event loop: the SQLite write runs in a thread.
+        """
+        if not leave_info:
+            return
+        row = self._store(user_message, user_tz, leave_info)
+        if row:
+            await asyncio.to_thread(self._put_disk, row)
+
+    def snapshot(self):
+        hits = self.stats["hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
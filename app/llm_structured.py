@@ -0,0 +1,266 @@
+import json
+import re
+import time
+from datetime import datetime
+from typing import Annotated, List, Optional
+
+from pydantic import AfterValidator, BaseModel, TypeAdapter, ValidationError
+
+from .event_queue import StageStats
+
+MENTION_VALUE_RE = re.compile(r"^(<@[A-Z0-9]+>|@[\w.\-]+)$")
+
+
+def _check_leave_dates(value):
+    for day in value:
+        datetime.strptime(day, "%d-%m-%Y")  # ValueError -> ValidationError
+    return value
+
+
+def _check_manager_mention(value):
+    if value is not None and not MENTION_VALUE_RE.match(value):
+        raise ValueError("must be a <@U...> mention, an @username or null")
+    return value
+
+
+FIELD_TYPES = {
+    "leave_type": Optional[str],
+    "leave_dates": Annotated[List[str], AfterValidator(_check_leave_dates)],
+    "leave_reason": Optional[str],
+    "manager_mention": Annotated[Optional[str], AfterValidator(_check_manager_mention)],
+}
+FIELD_ADAPTERS = {name: TypeAdapter(tp) for name, tp in FIELD_TYPES.items()}
+
+
+class LeaveRequestSchema(BaseModel):
+    leave_type: FIELD_TYPES["leave_type"]
+    leave_dates: FIELD_TYPES["leave_dates"]
+    leave_reason: FIELD_TYPES["leave_reason"]
+    manager_mention: FIELD_TYPES["manager_mention"]
+
+
+def response_format_for(fields):
+    """
+    OpenAI strict json_schema response_format restricted to `fields`.
+    """
+    properties = {
+        "leave_type": {"type": ["string", "null"]},
+        "leave_dates": {"type": "array", "items": {"type": "string"},
+                        "description": "Every leave day as DD-MM-YYYY"},
+        "leave_reason": {"type": ["string", "null"]},
+        "manager_mention": {"type": ["string", "null"],
+                            "description": "<@U...> mention, @username, or null"},
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "leave_request",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {name: properties[name] for name in fields},
+                "required": list(fields),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+class MemberScanner:
+    """
+    Incremental scanner that returns the top-level members of a streamed
+    JSON object as soon as each one is complete.
+    """
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start = None
+
+    def feed(self, text):
+        self.buf += text
+        raw_members = []
+        while self.pos < len(self.buf):
+            ch = self.buf[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.member_start = self.pos + 1
+            elif ch in "}]":
+                if self.depth == 1 and self.member_start is not None:
+                    raw_members.append(self.buf[self.member_start:self.pos])
+                self.depth -= 1
+            elif ch == "," and self.depth == 1:
+                raw_members.append(self.buf[self.member_start:self.pos])
+                self.member_start = self.pos + 1
+            self.pos += 1
+
+        members = []
+        for raw in raw_members:
+            if not raw.strip():
+                continue
+            try:
+                members.extend(json.loads("{" + raw + "}").items())
+            except ValueError:
+                pass  # reported as missing when the stream ends
+        return members
+
+
+class StructuredLeaveParse:
+    """
+    Accumulates one streamed completion, validating each field as soon as it
+    arrives. After the stream ends, `broken` lists fields that are missing or
+    failed validation, with the reason.
+    """
+    def __init__(self):
+        self.scanner = MemberScanner()
+        self.fields = {}
+        self.errors = {}
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def feed(self, text):
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        for name, value in self.scanner.feed(text):
+            if name not in FIELD_ADAPTERS:
+                continue
+            self.accept(name, value)
+
+    def accept(self, name, value):
+        try:
+            self.fields[name] = FIELD_ADAPTERS[name].validate_python(value)
+            self.errors.pop(name, None)
+        except ValidationError as e:
+            self.errors[name] = (value, e.errors()[0]["msg"])
+
+    @property
+    def broken(self):
+        missing = {name: (None, "missing") for name in FIELD_TYPES if name not in self.fields}
+        return {**missing, **self.errors}
+
+    def result(self):
+        return LeaveRequestSchema(**self.fields).model_dump()
+
+
+class StructuredLLMStats:
+    def __init__(self):
+        self.counters = {"requests": 0, "repairs": 0, "repair_failures": 0}
+        self.ttft = StageStats()
+        self.total = StageStats()
+
+    def snapshot(self):
+        return {
+            **self.counters,
+            "ttft": self.ttft.as_dict(),
+            "total": self.total.as_dict(),
+        }
+
+
+structured_llm_stats = StructuredLLMStats()
+
+
+def _chunk_text(chunk):
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def _repair_messages(messages, previous, broken):
+    """
+    The original conversation, the model's broken answer as its own turn,
+    and a request to resend just the fields that need fixing.
+    """
+    details = "; ".join(
+        f"{name}={value!r} ({reason})" for name, (value, reason) in broken.items()
+    )
+    return messages + [{"role": "assistant", "content": previous}, {
+        "role": "user",
+        "content": (
+            f"Your previous answer had missing or invalid fields: {details}. "
+            f"Reply with a JSON object containing only: {', '.join(broken)}."
+        ),
+    }]
+
+
+def _finish(parse, repaired_content):
+    if repaired_content is not None:
+        try:
+            for name, value in json.loads(repaired_content).items():
+                if name in FIELD_ADAPTERS:
+                    parse.accept(name, value)
+        except ValueError:
+            pass
+        if parse.broken:
+            structured_llm_stats.counters["repair_failures"] += 1
+    if parse.first_token_at is not None:
+        structured_llm_stats.ttft.add(parse.first_token_at - parse.started)
+    structured_llm_stats.total.add(time.perf_counter() - parse.started)
+    if parse.broken:
+        print(f"[StructuredLLM] Unrepairable fields: {parse.broken}")
+        return {}
+    return parse.result()
+
+
+def parse_leave_request_structured(client, model, messages):
+    """
+    Streamed structured-output parse with one targeted repair retry
+    (blocking client).
+    """
+    structured_llm_stats.counters["requests"] += 1
+    parse = StructuredLeaveParse()
+    stream = client.chat.completions.create(
+        model=model, messages=messages, response_format=response_format_for(FIELD_TYPES),
+        stream=True, max_tokens=512, temperature=0.0,
+    )
+    for chunk in stream:
+        parse.feed(_chunk_text(chunk))
+
+    repaired = None
+    broken = parse.broken
+    if broken:
+        structured_llm_stats.counters["repairs"] += 1
+        response = client.chat.completions.create(
+            model=model, messages=_repair_messages(messages, parse.scanner.buf, broken),
+            response_format=response_format_for(broken), max_tokens=256, temperature=0.0,
+        )
+        repaired = response.choices[0].message.content
+    return _finish(parse, repaired)
+
+
+async def parse_leave_request_structured_async(client, model, messages):
+    """
+    Same as parse_leave_request_structured, for AsyncOpenAI.
+    """
+    structured_llm_stats.counters["requests"] += 1
+    parse = StructuredLeaveParse()
+    stream = await client.chat.completions.create(
+        model=model, messages=messages, response_format=response_format_for(FIELD_TYPES),
+        stream=True, max_tokens=512, temperature=0.0,
+    )
+    async for chunk in stream:
+        parse.feed(_chunk_text(chunk))
+
+    repaired = None
+    broken = parse.broken
+    if broken:
+        structured_llm_stats.counters["repairs"] += 1
+        response = await client.chat.completions.create(
+            model=model, messages=_repair_messages(messages, parse.scanner.buf, broken),
+            response_format=response_format_for(broken), max_tokens=256, temperature=0.0,
+        )
+        repaired = response.choices[0].message.content
+    return _finish(parse, repaired)
@@ -1,7 +1,69 @@
+import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .slack_events import router as slack_router
+from .slack_events import router as slack_router, event_pipeline, job_scheduler
+from .leave_routes import router as leave_router
+from .utils import tenant_pool, warm_clients, leave_index, leave_store
+from .tracing import TracingMiddleware, tracer
 from .config import settings  # Will error immediately at app startup if anything is missing
 
-app = FastAPI()
-app.include_router(slack_router)
\ No newline at end of file
+
+async def prewarm():
+    """
+    Load the lazily imported SDKs and clients in a thread so the first Slack
+    request doesn't pay for them. The delay lets uvicorn bind the port first.
+    """
+    await asyncio.sleep(settings.STARTUP_PREWARM_DELAY)
+    started = time.perf_counter()
+    timings = await asyncio.to_thread(warm_clients)
+    print(f"[Startup] Pre-warmed in {(time.perf_counter() - started) * 1000:.0f} ms: {timings}")
+
+
+async def load_leave_index():
+    """
+    Build the in-memory leave index off the request path; requests that need
+    it before this finishes load it themselves.
+    """
+    started = time.perf_counter()
+    await asyncio.to_thread(leave_index.ensure_loaded, leave_store)
+    print(f"[Startup] Leave index loaded in {(time.perf_counter() - started) * 1000:.0f} ms: {leave_index.snapshot()}")
+
+
+async def monitor_event_loop(interval):
+    """
+    Sample how late the event loop wakes up from a sleep: time spent in
+    blocking code shows up as runtime:event_loop_lag on /metrics.
+    """
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        tracer.observe("event_loop_lag", max(0.0, time.perf_counter() - started - interval), kind="runtime")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await event_pipeline.start()
+    await job_scheduler.start()
+    warm_task = asyncio.create_task(prewarm()) if settings.STARTUP_PREWARM else None
+    index_task = asyncio.create_task(load_leave_index())
+    lag_task = (
+        asyncio.create_task(monitor_event_loop(settings.EVENT_LOOP_LAG_INTERVAL_MS / 1000.0))
+        if settings.EVENT_LOOP_LAG_INTERVAL_MS else None
+    )
+    yield
+    index_task.cancel()
+    if lag_task is not None:
+        lag_task.cancel()
+    if warm_task is not None:
+        warm_task.cancel()
+    await event_pipeline.stop()
+    await job_scheduler.stop()
+    await tenant_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TracingMiddleware)
+app.include_router(slack_router)
+app.include_router(leave_router)
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ProfileCache:
+    """
+    TTL + LRU cache of Slack user objects keyed by user id.
+
+    - Filled in bulk from users.list (`put_many`) and per user on a miss.
+    - Concurrent misses for the same user share one fetch (single-flight),
+      both for threads (`get`) and coroutines (`aget`).
+    - If the fetch fails and we still hold an expired entry, that entry is
+      served instead (counted as a stale serve).
+    """
+    def __init__(self, ttl=3600, max_entries=20000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (user, fetched_at)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self.stats = {"hits": 0, "misses": 0, "stale_serves": 0, "coalesced": 0, "errors": 0}
+
+    def put(self, user_id, user, fetched_at=None):
+        with self._lock:
+            self._entries[user_id] = (user, fetched_at or time.time())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put_many(self, users):
+        now = time.time()
+        for user in users:
+            if user.get("id"):
+                self.put(user["id"], user, now)
+
+    def _lookup(self, user_id):
+        """
+        Returns (user, is_fresh); (None, False) if we have nothing.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(user_id)
+        user, fetched_at = entry
+        return user, time.time() - fetched_at < self.ttl
+
+    def _fallback(self, user_id, stale, error):
+        self.stats["errors"] += 1
+        if stale is not None:
+            self.stats["stale_serves"] += 1
+            print(f"[ProfileCache] Serving stale profile for {user_id}: {error}")
+            return stale
+        raise error
+
+    def get(self, user_id, fetch):
+        """
+        Return the cached user, calling `fetch()` (blocking) on a miss.
+        """
+        user, fresh = self._lookup(user_id)
+        if fresh:
+            self.stats["hits"] += 1
+            return user
+        self.stats["misses"] += 1
+
+        with self._lock:
+            flight = self._flights.get(user_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[user_id] = _Flight()
+        if not leader:
+            self.stats["coalesced"] += 1
+            flight.done.wait()
+            if flight.error is not None:
+                return self._fallback(user_id, user, flight.error)
+            return flight.result
+
+        try:
+            flight.result = fetch()
+            self.put(user_id, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            return self._fallback(user_id, user, e)
+        finally:
+            with self._lock:
+                del self._flights[user_id]
+            flight.done.set()
+
+    async def aget(self, user_id, fetch):
+        """
+        Async twin of `get`; `fetch` is a coroutine function.
+        """
+        user, fresh = self._lookup(user_id)
+        if fresh:
+            self.stats["hits"] += 1
+            return user
+        self.stats["misses"] += 1
+
+        future = self._async_flights.get(user_id)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except Exception as e:
+                return self._fallback(user_id, user, e)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_flights[user_id] = future
+        try:
+            result = await fetch()
+            self.put(user_id, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unwaited future doesn't log a warning
+            future.exception()
+            return self._fallback(user_id, user, e)
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._async_flights[user_id]
+
+    def snapshot(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
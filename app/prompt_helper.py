@@ -1,21 +1,13 @@
 from datetime import datetime
+from functools import lru_cache
 import pytz
 
-def get_llm_leave_system_prompt(tz_name):
-    """
-    Returns a robust system prompt string for leave extraction,
-    based on the current date in the user's timezone.
-    """
-    try:
-        tz = pytz.timezone(tz_name)
-    except Exception:
-        tz = pytz.timezone("UTC")
-    now = datetime.now(tz)
-    TODAY = now.strftime("%d-%m-%Y")
-    DAY_OF_WEEK = now.strftime("%A")
+# The prefix of every variant is static and byte-identical across requests so
+# the provider's prompt caching can reuse it; only the short date line at the
+# end changes (once per timezone per day).
 
-    prompt = f"""
-You are an expert HR assistant. Today's date is {TODAY}, which is a {DAY_OF_WEEK}, and all date calculations should use the user's local timezone and date.
+FULL_PROMPT_PREFIX = """
+You are an expert HR assistant. All date calculations should use the user's local timezone and date, given at the end of these instructions.
 
 When an employee requests leave, your job is to:
 - **Extract ALL leave dates** from the request. These may be given as natural language ("next Monday", "coming Friday", "from 25-06-2025 to 30-06-2025", "on 12-07-2025 and 15-07-2025", "the 2nd and 4th of July", "tomorrow", "this Wednesday") or as explicit dates.
@@ -34,42 +26,85 @@ When an employee requests leave, your job is to:
 - `"leave_reason"`: Any provided reason, as text, or null if not specified.
 
 **Your ONLY output must be valid JSON with:**
-{{
+{
   "leave_type": ...,
   "leave_dates": [...],  // List of all DD-MM-YYYY dates, each as a string
   "leave_reason": ...,
   "manager_mention": ...
-}}
+}
 
-**EXAMPLES (for {TODAY}, which is a {DAY_OF_WEEK}):**
+**EXAMPLES (assuming today is 07-06-2025, which is a Saturday):**
 
 User: "I need vacation next Monday and Tuesday, please send to manager <@U99887766>"
 → Output:
-{{
+{
   "leave_type": "vacation",
   "leave_dates": ["09-06-2025", "10-06-2025"],
   "leave_reason": null,
   "manager_mention": "<@U99887766>"
-}}
+}
 
 User: "Sick off today, send to manager @arajadurai"
 → Output:
-{{
+{
   "leave_type": "sick",
   "leave_dates": ["07-06-2025"],
   "leave_reason": null,
   "manager_mention": "@arajadurai"
-}}
+}
 
 User: "Annual vacation on 15-07-2025 for trip."
 → Output:
-{{
+{
   "leave_type": "vacation",
   "leave_dates": ["15-07-2025"],
   "leave_reason": "trip",
   "manager_mention": null
-}}
+}
 
 **Be precise—output only a single JSON object as described. "manager_mention" must be exactly as in the user's message: the canonical Slack mention if present, otherwise @username if written, otherwise null. Never use display names or emails.**
 """
-    return prompt
\ No newline at end of file
+
+COMPACT_PROMPT_PREFIX = """
+Extract the employee's leave request. Output ONLY one JSON object:
+{"leave_type": "vacation"|"sick"|"personal"|..., "leave_dates": ["DD-MM-YYYY", ...], "leave_reason": string|null, "manager_mention": string|null}
+Rules:
+- leave_dates: every leave day as DD-MM-YYYY. Expand ranges inclusively. Resolve relative days ("tomorrow", "next Monday" = first Monday after today) from today's date in the user's timezone.
+- leave_type: as stated or implied.
+- manager_mention: the canonical Slack mention (e.g. "<@U12345>") if present, else an @username exactly as written, else null. Never a display name or email.
+"""
+
+DATE_LINE = "\nToday's date is {today}, which is a {day_of_week}, in the user's local timezone.\n"
+
+PROMPT_VARIANTS = {
+    "full": FULL_PROMPT_PREFIX,
+    "compact": COMPACT_PROMPT_PREFIX,
+}
+DEFAULT_PROMPT_VARIANT = "full"
+
+
+@lru_cache(maxsize=512)
+def _timezone(tz_name):
+    try:
+        return pytz.timezone(tz_name)
+    except Exception:
+        return pytz.timezone("UTC")
+
+
+@lru_cache(maxsize=2048)
+def render_system_prompt(variant, today, day_of_week):
+    """
+    Renders the system prompt for a local date ("07-06-2025", "Saturday").
+    Memoized, so each (variant, date) is built once.
+    """
+    prefix = PROMPT_VARIANTS.get(variant, PROMPT_VARIANTS[DEFAULT_PROMPT_VARIANT])
+    return prefix + DATE_LINE.format(today=today, day_of_week=day_of_week)
+
+
+def get_llm_leave_system_prompt(tz_name, variant=DEFAULT_PROMPT_VARIANT):
+    """
+    Returns a robust system prompt string for leave extraction,
+    based on the current date in the user's timezone.
+    """
+    now = datetime.now(_timezone(tz_name))
+    return render_system_prompt(variant, now.strftime("%d-%m-%Y"), now.strftime("%A"))
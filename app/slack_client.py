@@ -0,0 +1,205 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from .event_queue import StageStats
+from .tracing import tracer
+
+# Requests per minute for each of Slack's Web API rate-limit tiers
+# (https://api.slack.com/docs/rate-limits)
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+
+METHOD_TIERS = {
+    "users.list": 2,
+    "chat.update": 3,
+    "users.profile.set": 3,
+    "conversations.open": 3,
+    "users.info": 4,
+}
+DEFAULT_TIER = 3
+
+# chat.postMessage has its own limit: about one message per second per channel
+POST_MESSAGE_RATE = 1.0
+POST_MESSAGE_BURST = 3
+MAX_CHANNEL_BUCKETS = 5000
+
+
+class TokenBucket:
+    """
+    Token bucket for a single asyncio loop. `reserve()` takes a token (going
+    negative if needed) and returns how long the caller must sleep, so no lock
+    is required.
+    """
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 0:
+            wait = max(wait, -self.tokens / self.rate)
+        return wait
+
+    def try_acquire(self):
+        """
+        Take a token only if one is available right now.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1 or now < self.blocked_until:
+            return False
+        self.tokens -= 1
+        return True
+
+    def block_for(self, seconds):
+        """
+        Slack told us to back off (429 Retry-After); nobody goes before then.
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.throttle_wait = 0.0
+        self.rate_limited = 0
+        self.latency = StageStats()
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "throttle_wait_s": round(self.throttle_wait, 3),
+            "rate_limited": self.rate_limited,
+            "latency": self.latency.as_dict(),
+        }
+
+
+class RateLimitedSlackClient:
+    """
+    Shared async Slack Web API layer:
+
+    - one pooled aiohttp session (keep-alive connections) for every call;
+    - client-side token buckets per method tier (per channel for chat.postMessage);
+    - 429 responses honour Retry-After and pause that method's bucket;
+    - `gather()` to send independent calls concurrently.
+
+    Method names are the Slack ones (`await client.call("chat.update", ...)`);
+    the common ones also have AsyncWebClient-style shortcuts.
+    """
+    def __init__(self, token, max_retries=3, pool_size=100, base_url=None, max_channel_buckets=MAX_CHANNEL_BUCKETS):
+        self.token = token
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.base_url = base_url
+        self.max_channel_buckets = max_channel_buckets
+        self._client = None
+        self._session = None
+        self._buckets = {}
+        self._channel_buckets = OrderedDict()
+        self.stats = {}
+
+    def _web_client(self):
+        if self._client is None or self._session.closed:
+            # Imported here so that importing the app doesn't pay for aiohttp/slack_sdk
+            import aiohttp
+            from slack_sdk.web.async_client import AsyncWebClient
+
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            kwargs = {"base_url": self.base_url} if self.base_url else {}
+            self._client = AsyncWebClient(token=self.token, session=self._session, **kwargs)
+        return self._client
+
+    def _bucket(self, method, channel=None):
+        if method == "chat.postMessage" and channel:
+            bucket = self._channel_buckets.get(channel)
+            if bucket is None:
+                bucket = self._channel_buckets[channel] = TokenBucket(POST_MESSAGE_RATE, POST_MESSAGE_BURST)
+                if len(self._channel_buckets) > self.max_channel_buckets:
+                    self._channel_buckets.popitem(last=False)
+            else:
+                self._channel_buckets.move_to_end(channel)
+            return bucket
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            per_minute = TIER_RATES[METHOD_TIERS.get(method, DEFAULT_TIER)]
+            # Allow a short burst of about 10 seconds' worth of calls
+            bucket = self._buckets[method] = TokenBucket(per_minute / 60.0, max(1, per_minute // 6))
+        return bucket
+
+    async def call(self, method, **kwargs):
+        stats = self.stats.setdefault(method, MethodStats())
+        bucket = self._bucket(method, kwargs.get("channel"))
+        func = getattr(self._web_client(), method.replace(".", "_"))
+        from slack_sdk.errors import SlackApiError
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                stats.throttled += 1
+                stats.throttle_wait += wait
+                await asyncio.sleep(wait)
+            stats.calls += 1
+            started = time.perf_counter()
+            try:
+                return await func(**kwargs)
+            except SlackApiError as e:
+                if e.response.status_code == 429 and attempt < self.max_retries:
+                    retry_after = float(e.response.headers.get("Retry-After", 1))
+                    stats.rate_limited += 1
+                    bucket.block_for(retry_after)
+                    attempt += 1
+                    print(f"[SlackClient] {method} rate limited, retrying in {retry_after}s")
+                    continue
+                stats.errors += 1
+                raise
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                stats.latency.add(elapsed)
+                tracer.observe(f"slack.{method}", elapsed, kind="external")
+
+    async def chat_postMessage(self, **kwargs):
+        return await self.call("chat.postMessage", **kwargs)
+
+    async def chat_update(self, **kwargs):
+        return await self.call("chat.update", **kwargs)
+
+    async def users_info(self, **kwargs):
+        return await self.call("users.info", **kwargs)
+
+    async def users_profile_set(self, **kwargs):
+        return await self.call("users.profile.set", **kwargs)
+
+    async def gather(self, *calls):
+        """
+        Run independent calls concurrently. Failures are logged and returned
+        in place of the result, so one failed side effect doesn't cancel the rest.
+        """
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"[SlackClient] Side effect failed: {result}")
+        return results
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._client = None
+
+    def snapshot(self):
+        return {method: s.as_dict() for method, s in self.stats.items()}
@@ -1,177 +1,477 @@
-import os
-import json
-import tempfile
-from fastapi import APIRouter, Request, Form, BackgroundTasks
+import asyncio
+from fastapi import APIRouter, Request, Form
 from fastapi.responses import JSONResponse, PlainTextResponse
-from slack_sdk.signature import SignatureVerifier
 
 from .utils import (
-    parse_leave_request_llm, post_manager_leave_request,slack_client,
+    post_manager_leave_request, slack_api, set_slack_ooo, add_leave_to_calendar,
+    store_leave_request, notify_manager_leave_request,
+    mark_bulk_request_handled, BULK_BLOCK_PREFIX,
     extract_manager_id_from_mention,build_leave_confirmation,
-    get_slack_user_timezone
+    parse_leave_request_llm_async,
+    llm_cache, leave_store, leave_index, tenant_pool
 )
+from .leave_store import PENDING, APPROVED, DENIED
+from .event_queue import EventPipeline
+from .job_queue import JobScheduler
+from .dedup import make_dedup_store
+from .fast_parser import fast_path_snapshot
+from .llm_structured import structured_llm_stats
+from .tracing import tracer, span, tag_trace
+from .slack_payload import decode_slack_body, payload_type, payload_team_id, loads
+from .tenants import current_tenant, use_tenant
 from .config import settings
 
 router = APIRouter()
-verifier = SignatureVerifier(settings.SLACK_SIGNING_SECRET)
+_verifier = None
 
-HANDLED_EVENT_IDS = set()
 
-# GOOGLE_CREDS_DIR = os.path.join(os.path.dirname(__file__), "google_creds")
+def get_verifier():
+    """
+    SignatureVerifier, created on first use (importing slack_sdk is slow).
+    """
+    global _verifier
+    if _verifier is None:
+        from slack_sdk.signature import SignatureVerifier
+        _verifier = SignatureVerifier(settings.SLACK_SIGNING_SECRET)
+    return _verifier
 
-@router.post("/slack/events")
-async def slack_events(request: Request):
-    body = await request.body()
-    if not verifier.is_valid_request(body=body, headers=request.headers):
-        return JSONResponse(status_code=403, content={"msg": "Slack Verification Failed"})
+handled_events = make_dedup_store(settings)
 
-    # Handle Slack interactive approvals (block_actions)
-    form = await request.form()
-    if "payload" in form:
-        slack_payload = json.loads(form["payload"])
-        if slack_payload.get("type") == "block_actions":
-            action = slack_payload["actions"][0]
-            if action["action_id"] == "approve_leave":
-                value = json.loads(action['value'])
-                user_id = value['uid']
-                leave_dates = value.get('leave_dates', [])
-                leave_type = value.get('leave_type', '')
-                slack_client.chat_postMessage(
-                    channel=user_id,
-                    text=f"✅ Your leave ({', '.join(leave_dates)}) [{leave_type}] was approved! 🎉"
-                )
-                slack_client.chat_update(
-                    channel=slack_payload["channel"]["id"],
-                    ts=slack_payload["message"]["ts"],
-                    text="✅ Approved.",
-                    blocks=[]
-                )
-                return {"ok": True}
-            elif action["action_id"] == "deny_leave":
-                value = json.loads(action["value"])
-                user_id = value["uid"]
-                slack_client.chat_postMessage(
-                    channel=user_id,
-                    text="❌ Your leave request was denied by your manager."
-                )
-                slack_client.chat_update(
-                    channel=slack_payload["channel"]["id"],
-                    ts=slack_payload["message"]["ts"],
-                    text="❌ Denied.",
-                    blocks=[]
-                )
-                return {"ok": True}
-        return JSONResponse(content={"msg": "No action."})
+ALREADY_BOOKED_TEXT = (
+    "ℹ️ You already have leave requested or approved on all of these dates, so I didn't send a new request."
+)
 
-    payload = await request.json()
-    event_id = payload.get("event_id")
-    if event_id:
-        if event_id in HANDLED_EVENT_IDS:
-            print(f"[Deduplication] Already processed event_id={event_id}, skipping.")
-            return {"ok": True}
-        HANDLED_EVENT_IDS.add(event_id)
-
-
-    if payload.get('challenge'):
-        return JSONResponse(content={"challenge": payload['challenge']})
-
-    if payload.get('event', {}).get('type') == 'app_mention':
-        event = payload['event']
-        user_id = event['user']
-        user_message = event['text']
-
-        leave_info = parse_leave_request_llm(user_id, user_message)
-        if not leave_info:
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="Sorry, I couldn't understand your leave request. Please try rephrasing."
-            )
-            return {"ok": True}
-
-        # Manager mention must be present
-        manager_mention = leave_info.get("manager_mention", "")
-        manager_id = extract_manager_id_from_mention(manager_mention)
-        
-        if not manager_id:
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="Please @-mention your manager in your leave request!"
-            )
-            return {"ok": True}
-        if manager_id == user_id:
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="You cannot approve your own leave. Please @-mention a different manager."
-            )
-            return {"ok": True}
 
-        leave_dates = leave_info.get("leave_dates", [])
-        leave_type = leave_info.get('leave_type', '')
+async def handle_app_mention(event):
+    """
+    Worker side of the app_mention pipeline: parse with the LLM, resolve the
+    manager and post the approval request. Runs off the request path.
+    """
+    user_id = event['user']
+    user_message = event['text']
 
-        if not isinstance(leave_dates, list) or not leave_dates:
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="Sorry, I couldn't parse the leave dates. Please specify clearly (e.g., '25-06-2025 and 27-06-2025' or 'next Monday and Thursday')."
-            )
-            return {"ok": True}
+    with event_pipeline.stage("llm_parse"):
+        leave_info = await parse_leave_request_llm_async(user_id, user_message)
+    if not leave_info:
+        await slack_api.chat_postMessage(
+            channel=user_id,
+            text="Sorry, I couldn't understand your leave request. Please try rephrasing."
+        )
+        return
+
+    # Manager mention must be present
+    manager_mention = leave_info.get("manager_mention", "")
+    with event_pipeline.stage("resolve_manager"):
+        # May hit users.list on a cold cache, keep it off the event loop
+        manager_id = await asyncio.to_thread(extract_manager_id_from_mention, manager_mention)
+
+    if not manager_id:
+        await slack_api.chat_postMessage(
+            channel=user_id,
+            text="Please @-mention your manager in your leave request!"
+        )
+        return
+    if manager_id == user_id:
+        await slack_api.chat_postMessage(
+            channel=user_id,
+            text="You cannot approve your own leave. Please @-mention a different manager."
+        )
+        return
+
+    leave_dates = leave_info.get("leave_dates", [])
+    leave_type = leave_info.get('leave_type', '')
+
+    if not isinstance(leave_dates, list) or not leave_dates:
+        await slack_api.chat_postMessage(
+            channel=user_id,
+            text="Sorry, I couldn't parse the leave dates. Please specify clearly (e.g., '25-06-2025 and 27-06-2025' or 'next Monday and Thursday')."
+        )
+        return
+    with event_pipeline.stage("slack_post"):
         # 🚩 ***SEND ONE APPROVAL REQUEST TO MANAGER ONLY!***
-        post_manager_leave_request(user_id, leave_info, manager_id)
+        request_id = await post_manager_leave_request(user_id, leave_info, manager_id)
+        if request_id is None:
+            await slack_api.chat_postMessage(channel=user_id, text=ALREADY_BOOKED_TEXT)
+            return
 
         # Confirmation to user
         msg = build_leave_confirmation(leave_dates, leave_type)
-        slack_client.chat_postMessage(
+        await slack_api.chat_postMessage(
             channel=user_id,
             text=msg
         )
+
+
+async def notify_mention_failure(event, error):
+    await slack_api.chat_postMessage(
+        channel=event["user"],
+        text="⚠️ Error processing your leave request. Please try again or contact HR."
+    )
+
+
+event_pipeline = EventPipeline(
+    handle_app_mention,
+    on_failure=notify_mention_failure,
+    maxsize=settings.EVENT_QUEUE_MAXSIZE,
+    workers=settings.EVENT_WORKERS,
+    enqueue_timeout=settings.EVENT_ENQUEUE_TIMEOUT,
+)
+
+# Slash commands and approve/deny clicks: journaled, retried, replayed after a restart
+job_scheduler = JobScheduler(
+    settings.JOB_DB_PATH,
+    workers=settings.JOB_WORKERS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_base=settings.JOB_RETRY_BASE_SECONDS,
+    retry_max=settings.JOB_RETRY_MAX_SECONDS,
+    lease=settings.JOB_LEASE_SECONDS,
+)
+
+def in_tenant(handler):
+    """
+    Run a job handler (or its on_failure) in the workspace the job came
+    from; jobs carry the team_id because a replayed job has no request.
+    """
+    async def run(job, *args):
+        with use_tenant(tenant_pool.require(job.get("team_id"))):
+            return await handler(job, *args)
+    return run
+
+async def run_side_effects(job, effects):
+    """
+    Run a job's independent side effects ({name: coroutine function})
+    concurrently. The ones that succeed are checkpointed and skipped on a
+    retry; the first failure is raised, so a transient one retries the job.
+    """
+    done = set(job.get("effects_done", []))
+    names = [name for name in effects if name not in done]
+    results = await asyncio.gather(*(effects[name]() for name in names), return_exceptions=True)
+    done.update(name for name, result in zip(names, results) if not isinstance(result, Exception))
+    await job_scheduler.checkpoint(effects_done=sorted(done))
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            print(f"[LeaveDecision] {name} failed: {result}")
+            raise result
+
+def resolve_leave_action(value, new_status):
+    """
+    Look up the request behind an Approve/Deny button and move it out of
+    pending. Returns the request dict, or None if it was already handled.
+    Buttons posted before the leave store existed carry the whole request.
+    """
+    if "rid" not in value:
+        return {
+            "request_id": None,
+            "user_id": value["uid"],
+            "leave_dates": value.get("leave_dates", []),
+            "leave_type": value.get("leave_type", ""),
+            "leave_reason": value.get("leave_reason"),
+        }
+    if not leave_store.transition(current_tenant().team_id, value["rid"], PENDING, new_status):
+        return None
+    return leave_store.get(value["rid"])
+
+async def on_leave_decision(payload, action, approve):
+    """
+    Approve/Deny button on a manager's leave request (run as a job; the
+    outcome of the status change is checkpointed so a retry doesn't report
+    its own first attempt as "already handled").
+    """
+    if "leave" not in payload:
+        with span("resolve_leave_action"):
+            leave = await asyncio.to_thread(
+                resolve_leave_action, loads(action["value"]), APPROVED if approve else DENIED
+            )
+        await job_scheduler.checkpoint(leave=leave)
+    leave = payload["leave"]
+    channel_id = payload["channel"]["id"]
+    message_ts = payload["message"]["ts"]
+    block_id = action.get("block_id", "")
+
+    def outcome(text):
+        # Grouped (bulk) messages keep the other requests' buttons
+        if block_id.startswith(BULK_BLOCK_PREFIX):
+            blocks = mark_bulk_request_handled(payload["message"].get("blocks", []), block_id, text)
+            return {"text": payload["message"].get("text", text), "blocks": blocks}
+        return {"text": text, "blocks": []}
+
+    if leave is None:
+        await slack_api.chat_update(
+            channel=channel_id, ts=message_ts,
+            **outcome("ℹ️ This leave request was already handled.")
+        )
         return {"ok": True}
+    user_id = leave["user_id"]
+    if approve:
+        leave_dates = leave["leave_dates"]
+        leave_type = (leave.get("leave_type") or "not specified").capitalize()
+        # Independent side effects, sent concurrently
+        with span("approval_side_effects"):
+            await run_side_effects(payload, {
+                "notify_user": lambda: slack_api.chat_postMessage(
+                    channel=user_id,
+                    text=f"✅ Your leave ({', '.join(leave_dates)}) [{leave_type}] was approved! 🎉"
+                ),
+                "update_message": lambda: slack_api.chat_update(
+                    channel=channel_id, ts=message_ts, **outcome("✅ Approved.")
+                ),
+                "slack_status": lambda: set_slack_ooo(user_id, leave),
+                "calendar": lambda: asyncio.to_thread(add_leave_to_calendar, leave.get("request_id"), leave),
+            })
+    else:
+        with span("denial_side_effects"):
+            await run_side_effects(payload, {
+                "notify_user": lambda: slack_api.chat_postMessage(
+                    channel=user_id,
+                    text="❌ Your leave request was denied by your manager."
+                ),
+                "update_message": lambda: slack_api.chat_update(
+                    channel=channel_id, ts=message_ts, **outcome("❌ Denied.")
+                ),
+            })
+    return {"ok": True}
 
-    return JSONResponse(content={"msg": "Unhandled event."})
+job_scheduler.register(
+    "leave_decision",
+    in_tenant(lambda job: on_leave_decision(job, job["action"], job["approve"])),
+    lane="interactive",
+)
+
+async def queue_leave_decision(payload, action, approve):
+    """
+    Ack the click now; the decision runs as a job in the interactive lane,
+    ahead of queued slash-command parses.
+    """
+    message = payload.get("message") or {}
+    with span("enqueue"):
+        await job_scheduler.submit("leave_decision", {
+            "team_id": current_tenant().team_id,
+            "channel": {"id": payload["channel"]["id"]},
+            "message": {"ts": message.get("ts"), "text": message.get("text"), "blocks": message.get("blocks", [])},
+            "action": {"value": action["value"], "block_id": action.get("block_id", "")},
+            "approve": approve,
+        })
+    return {"ok": True}
+
+ACTION_HANDLERS = {
+    "approve_leave": lambda payload, action: queue_leave_decision(payload, action, approve=True),
+    "deny_leave": lambda payload, action: queue_leave_decision(payload, action, approve=False),
+}
+
+async def on_block_actions(payload):
+    tag_trace(payload.get("trigger_id"))
+    actions = payload.get("actions") or [{}]
+    handler = ACTION_HANDLERS.get(actions[0].get("action_id"))
+    if handler is None:
+        return JSONResponse(content={"msg": "No action."})
+    return await handler(payload, actions[0])
+
+async def on_app_mention(payload, event_id):
+    # Ack now, the worker pool does the slow part. A workspace over its
+    # request rate gets the same push back as a full queue.
+    with span("enqueue"):
+        accepted = current_tenant().admit() and await event_pipeline.submit(payload['event'])
+    if not accepted:
+        # Backpressure: let Slack retry this delivery later
+        if event_id:
+            await handled_events.forget_async(event_id)
+        return JSONResponse(status_code=503, content={"msg": "Busy, retry later."})
+    return {"ok": True}
+
+EVENT_HANDLERS = {
+    "app_mention": on_app_mention,
+}
+
+async def on_event_callback(payload):
+    event_id = payload.get("event_id")
+    tag_trace(event_id)
+    with span("dedup"):
+        first_delivery = not event_id or await handled_events.mark_seen_async(event_id)
+    if not first_delivery:
+        print(f"[Deduplication] Already processed event_id={event_id}, skipping.")
+        return {"ok": True}
+    handler = EVENT_HANDLERS.get((payload.get("event") or {}).get("type"))
+    if handler is None:
+        return JSONResponse(content={"msg": "Unhandled event."})
+    return await handler(payload, event_id)
+
+async def on_url_verification(payload):
+    return JSONResponse(content={"challenge": payload.get("challenge")})
+
+PAYLOAD_HANDLERS = {
+    "url_verification": on_url_verification,
+    "event_callback": on_event_callback,
+    "block_actions": on_block_actions,
+}
+
+@router.post("/slack/events")
+async def slack_events(request: Request):
+    body = await request.body()
+    with span("slack_verify"):
+        valid = get_verifier().is_valid_request(body=body, headers=request.headers)
+    if not valid:
+        return JSONResponse(status_code=403, content={"msg": "Slack Verification Failed"})
+
+    # A retry after a slow ack means we already queued the original delivery;
+    # drop it before touching the body. Retries after an error response (e.g.
+    # our 503 backpressure) fall through to the event_id dedup check below.
+    if (request.headers.get("x-slack-retry-num")
+            and request.headers.get("x-slack-retry-reason") == "http_timeout"):
+        print(f"[Deduplication] Skipping Slack retry #{request.headers['x-slack-retry-num']} (http_timeout)")
+        return JSONResponse(content={"ok": True}, headers={"X-Slack-No-Retry": "1"})
+
+    # One decode of the bytes we already hold: JSON for events, form-encoded
+    # `payload` for interactivity (block_actions)
+    with span("decode_payload"):
+        payload = decode_slack_body(body, request.headers.get("content-type"))
+    handler = PAYLOAD_HANDLERS.get(payload_type(payload))
+    if handler is None:
+        return JSONResponse(content={"msg": "Unhandled event."})
+    if handler is on_url_verification:
+        return await handler(payload)
+    # The workspace's token, clients and caches, for this request and the
+    # pipeline work it queues
+    tenant = tenant_pool.get(payload_team_id(payload))
+    if tenant is None:
+        print(f"[Tenants] Ignoring payload from unknown workspace {payload_team_id(payload)}")
+        return JSONResponse(content={"msg": "Unknown workspace."})
+    with use_tenant(tenant):
+        return await handler(payload)
+
+@router.get("/slack/pipeline")
+async def slack_pipeline_stats(team_id: str = None):
+    """
+    Pipeline stats. Profile cache and Slack API stats are per workspace:
+    the only one in single-workspace mode, else `team_id`'s if it is loaded.
+    """
+    tenant = tenant_pool.peek(team_id)
+    return {
+        **event_pipeline.snapshot(),
+        "dedup_entries": len(handled_events),
+        **(tenant.snapshot() if tenant else {}),
+        "parser": fast_path_snapshot(),
+        "llm_cache": llm_cache.snapshot(),
+        "structured_llm": structured_llm_stats.snapshot(),
+        "tenants": tenant_pool.snapshot(),
+        "latency": tracer.snapshot(),
+        "leave_index": leave_index.snapshot(),
+        "jobs": job_scheduler.snapshot(),
+    }
+
+@router.get("/slack/traces")
+async def slack_traces(trace_id: str = None, limit: int = 50):
+    """
+    Recent request traces, newest first. `trace_id` is the Slack event_id
+    or trigger_id.
+    """
+    return {"traces": tracer.traces(trace_id, limit)}
+
+def pipeline_metrics():
+    """
+    Pipeline counters and gauges in Prometheus text format.
+    """
+    snapshot = event_pipeline.snapshot()
+    lines = [
+        "# HELP flexioff_pipeline_events_total app_mention events by outcome.",
+        "# TYPE flexioff_pipeline_events_total counter",
+    ]
+    for outcome in ("enqueued", "rejected", "processed", "failed"):
+        lines.append(f'flexioff_pipeline_events_total{{outcome="{outcome}"}} {snapshot[outcome]}')
+    lines += [
+        "# HELP flexioff_pipeline_queue_depth Events waiting for a worker.",
+        "# TYPE flexioff_pipeline_queue_depth gauge",
+        f"flexioff_pipeline_queue_depth {snapshot['queue_depth']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+@router.get("/metrics")
+async def metrics():
+    return PlainTextResponse(
+        tracer.prometheus() + pipeline_metrics() + job_scheduler.prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
 
 # --- /leave slash command handler ---
 @router.post("/slack/slash")
 async def slack_leave_slash(
-    background_tasks: BackgroundTasks,
     request: Request,
     user_id: str = Form(...),
     text: str = Form(...),
+    trigger_id: str = Form(""),
+    team_id: str = Form(""),
 ):
-    
-    # Immediately return, Slack will show this as an ephemeral message
-    background_tasks.add_task(process_leave_request_slash, user_id, text)
+    tag_trace(trigger_id)
+    tenant = tenant_pool.get(team_id)
+    if tenant is None:
+        return PlainTextResponse("FlexiOff isn't installed in this workspace yet.")
+    if not tenant.admit():
+        return PlainTextResponse("⏳ Too many leave requests from this workspace right now, please try again in a minute.")
+    # Journal the job and return immediately, Slack will show this as an ephemeral message
+    with span("enqueue"):
+        await job_scheduler.submit("slash_leave", {"team_id": tenant.team_id, "user_id": user_id, "text": text})
     return PlainTextResponse("Processing your leave request...")
 
 
-def process_leave_request_slash(user_id, text):
-    try:
-        leave_info = parse_leave_request_llm(user_id, text)
-        manager_mention = leave_info.get("manager_mention", "")
-        manager_id = extract_manager_id_from_mention(manager_mention)
+async def process_leave_request_slash(job):
+    """
+    Job for the /leave command. Errors propagate so the scheduler can retry
+    transient ones. Each finished step is checkpointed, so a retry or a
+    replay picks up where the last attempt stopped instead of storing the
+    request or DMing the manager twice.
+    """
+    user_id = job["user_id"]
+    if "leave_info" not in job:
+        with span("llm_parse"):
+            leave_info = await parse_leave_request_llm_async(user_id, job["text"])
+        await job_scheduler.checkpoint(leave_info=leave_info)
+    leave_info = job["leave_info"]
+    manager_mention = leave_info.get("manager_mention", "")
+    with span("resolve_manager"):
+        manager_id = await asyncio.to_thread(extract_manager_id_from_mention, manager_mention)
 
-        if not manager_id or manager_id == user_id:
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="❗Please @-mention your manager (as a clickable tag) and do not set yourself as the approver."
-            )
+    if not manager_id or manager_id == user_id:
+        await slack_api.chat_postMessage(
+            channel=user_id,
+            text="❗Please @-mention your manager (as a clickable tag) and do not set yourself as the approver."
+        )
+        return
+
+    with span("slack_post"):
+        if "request_id" not in job:
+            request_id, capacity_note = await store_leave_request(user_id, leave_info, manager_id)
+            await job_scheduler.checkpoint(request_id=request_id, capacity_note=capacity_note)
+        if job["request_id"] is None:
+            await slack_api.chat_postMessage(channel=user_id, text=ALREADY_BOOKED_TEXT)
             return
-        
+
         # Send approval message to manager
-        post_manager_leave_request(user_id, leave_info, manager_id)
+        if not job.get("manager_notified"):
+            await notify_manager_leave_request(
+                user_id, leave_info, manager_id, job["request_id"], job["capacity_note"]
+            )
+            await job_scheduler.checkpoint(manager_notified=True)
 
         # Confirmation/feedback to user (as DM)
         leave_dates = leave_info["leave_dates"]
         leave_type = leave_info.get("leave_type", "")
         confirmation_msg = build_leave_confirmation(leave_dates, leave_type)
 
-        slack_client.chat_postMessage(
+        await slack_api.chat_postMessage(
             channel=user_id,
             text=confirmation_msg
         )
-    except Exception as e:
-        print(f"Slash background task error: {e}")
-        try:
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="⚠️ Error processing your leave request. Please try again or contact HR."
-            )
-        except:
-            pass
\ No newline at end of file
+
+
+async def notify_slash_failure(job, error):
+    await slack_api.chat_postMessage(
+        channel=job["user_id"],
+        text="⚠️ Error processing your leave request. Please try again or contact HR."
+    )
+
+
+job_scheduler.register(
+    "slash_leave",
+    in_tenant(process_leave_request_slash),
+    lane="parse",
+    on_failure=in_tenant(notify_slash_failure),
+)
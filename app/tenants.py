@@ -0,0 +1,375 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .profile_cache import ProfileCache
+from .slack_client import RateLimitedSlackClient, TokenBucket
+from .user_directory import UserDirectory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    team_id      TEXT PRIMARY KEY,
+    team_name    TEXT,
+    bot_token    TEXT NOT NULL,
+    gcal_email   TEXT,
+    installed_at REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+"""
+
+# The one tenant in single-workspace mode; also the workspace leave
+# requests stored before team ids existed belong to
+DEFAULT_TEAM_ID = "default"
+
+# Evicted tenants' HTTP sessions are closed this long after eviction, so
+# calls already in flight can finish
+CLOSE_GRACE_SECONDS = 30.0
+
+_current_tenant = ContextVar("current_tenant", default=None)
+_default_tenant = None
+
+
+class UnknownTenantError(LookupError):
+    pass
+
+
+class TenantStore:
+    """
+    SQLite table of installed workspaces: team_id -> bot token (and the
+    Google Calendar address OOO events go to). The file holds bot tokens,
+    so it is created readable by its owner only.
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        os.chmod(path, 0o600)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, team_id):
+        row = self._conn().execute("SELECT * FROM tenants WHERE team_id = ?", (team_id,)).fetchone()
+        return dict(row) if row else None
+
+    def put(self, team_id, bot_token, team_name=None, gcal_email=None):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO tenants (team_id, team_name, bot_token, gcal_email, installed_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (team_id) DO UPDATE SET team_name = excluded.team_name,"
+            " bot_token = excluded.bot_token, gcal_email = excluded.gcal_email, updated_at = excluded.updated_at",
+            (team_id, team_name, bot_token, gcal_email, now, now),
+        )
+
+    def remove(self, team_id):
+        return self._conn().execute("DELETE FROM tenants WHERE team_id = ?", (team_id,)).rowcount > 0
+
+    def list(self):
+        """
+        Installed workspaces, without their tokens.
+        """
+        rows = self._conn().execute(
+            "SELECT team_id, team_name, gcal_email, installed_at, updated_at FROM tenants ORDER BY team_id"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class Tenant:
+    """
+    One workspace: its bot token and everything built from it (async and
+    sync Slack clients, member directory, profile cache), plus a client for
+    `status_token`, the user token that sets Slack statuses, when there is
+    one. Slack rate limits are per workspace, so each tenant has its own
+    token buckets. With
+    `requests_per_minute` set, `admit()` also caps how much new work the
+    workspace can start, so one busy tenant can't fill the shared queues.
+    """
+    def __init__(self, team_id, bot_token, gcal_email="", base_url=None, profile_ttl=3600,
+                 profile_max_entries=20000, directory_ttl=600, slack_pool_size=100,
+                 max_channel_buckets=5000, requests_per_minute=0, status_token=""):
+        self.team_id = team_id
+        self.bot_token = bot_token
+        self.gcal_email = gcal_email
+        self.base_url = base_url
+        self.slack_api = RateLimitedSlackClient(
+            token=bot_token, pool_size=slack_pool_size, base_url=base_url,
+            max_channel_buckets=max_channel_buckets,
+        )
+        self.status_api = (
+            RateLimitedSlackClient(token=status_token, pool_size=2, base_url=base_url) if status_token else None
+        )
+        self._slack_client = None
+        self._client_lock = threading.Lock()
+        self.user_directory = UserDirectory(self.get_slack_client, ttl=directory_ttl)
+        self.profile_cache = ProfileCache(ttl=profile_ttl, max_entries=profile_max_entries)
+        # users.list already carries tz for everyone, reuse it instead of users.info
+        self.user_directory.listeners.append(self.profile_cache.put_many)
+        # Allow a burst of about 10 seconds' worth of requests
+        self.ingress = (
+            TokenBucket(requests_per_minute / 60.0, max(1, requests_per_minute // 6))
+            if requests_per_minute else None
+        )
+        self.rejected = 0
+        self.loaded_at = time.time()
+
+    def get_slack_client(self):
+        """
+        Blocking WebClient, created on first use (importing slack_sdk is slow).
+        """
+        if self._slack_client is None:
+            with self._client_lock:
+                if self._slack_client is None:
+                    from slack_sdk import WebClient
+                    kwargs = {"base_url": self.base_url} if self.base_url else {}
+                    self._slack_client = WebClient(token=self.bot_token, **kwargs)
+        return self._slack_client
+
+    def admit(self):
+        """
+        False when the workspace is over its request rate.
+        """
+        if self.ingress is None or self.ingress.try_acquire():
+            return True
+        self.rejected += 1
+        return False
+
+    async def close(self, delay=0.0):
+        if delay:
+            await asyncio.sleep(delay)
+        await self.slack_api.close()
+        if self.status_api is not None:
+            await self.status_api.close()
+
+    def snapshot(self):
+        return {
+            "profile_cache": self.profile_cache.snapshot(),
+            "slack_api": self.slack_api.snapshot(),
+            "directory_members": len(self.user_directory),
+            "rejected": self.rejected,
+        }
+
+
+class TenantPool:
+    """
+    Tenants by team_id, built on first use from `store` records by
+    `factory(record)` and kept in an LRU of at most `max_tenants`; the least
+    recently used one is evicted (and its HTTP session closed) to make room.
+    Records are re-read after `refresh_seconds`, so a rotated token or an
+    uninstalled workspace is picked up without a restart.
+
+    Member directories are the big per-tenant object, so they share a
+    budget of `max_directory_members` (0 = no limit): when a load goes over
+    it, the least recently used tenants' directories are unloaded until it
+    fits, and reload on their next lookup. The one that just loaded is kept
+    even if it alone is over.
+
+    With a `default` tenant (single-workspace mode) every lookup returns it
+    and there is no store.
+    """
+    def __init__(self, store=None, factory=None, max_tenants=100, refresh_seconds=300, default=None,
+                 max_directory_members=0):
+        self.store = store
+        self.factory = factory
+        self.max_tenants = max_tenants
+        self.max_directory_members = max_directory_members
+        self.refresh_seconds = refresh_seconds
+        self.default = default
+        self._tenants = OrderedDict()
+        self._lock = threading.Lock()
+        self._closing = set()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "unknown": 0, "directory_unloads": 0}
+
+    def _build(self, record):
+        tenant = self.factory(record)
+        if self.max_directory_members:
+            tenant.user_directory.listeners.append(lambda members: self._trim_directories(tenant))
+        return tenant
+
+    def _load(self, team_id):
+        record = self.store.get(team_id) if team_id else None
+        return self._build(record) if record else None
+
+    def _trim_directories(self, keep):
+        """
+        Unload least recently used directories (other than `keep`'s) until
+        the pool is within `max_directory_members`.
+        """
+        with self._lock:
+            tenants = list(self._tenants.values())
+        total = sum(len(tenant.user_directory) for tenant in tenants)
+        for tenant in tenants:
+            if total <= self.max_directory_members:
+                break
+            if tenant is keep or not len(tenant.user_directory):
+                continue
+            total -= tenant.user_directory.unload()
+            self.stats["directory_unloads"] += 1
+
+    def _fresh(self, tenant):
+        """
+        Re-read an old entry's record: None if the workspace is gone, a new
+        tenant if its token or calendar changed, else the same one.
+        """
+        record = self.store.get(tenant.team_id)
+        if record is None:
+            return None
+        if record["bot_token"] != tenant.bot_token or (record["gcal_email"] or "") != tenant.gcal_email:
+            return self._build(record)
+        tenant.loaded_at = time.time()
+        return tenant
+
+    def get(self, team_id):
+        """
+        The tenant for `team_id`, or None if the workspace isn't installed.
+        """
+        if self.default is not None:
+            return self.default
+        with self._lock:
+            tenant = self._tenants.get(team_id)
+            if tenant is not None:
+                self._tenants.move_to_end(team_id)
+        if tenant is not None and time.time() - tenant.loaded_at > self.refresh_seconds:
+            fresh = self._fresh(tenant)
+            if fresh is not tenant:
+                self._replace(team_id, tenant, fresh)
+                tenant = fresh
+        if tenant is not None:
+            self.stats["hits"] += 1
+            return tenant
+
+        tenant = self._load(team_id)
+        if tenant is None:
+            self.stats["unknown"] += 1
+            return None
+        self.stats["misses"] += 1
+        with self._lock:
+            # Another request may have loaded it meanwhile
+            existing = self._tenants.get(team_id)
+            if existing is not None:
+                return existing
+            self._tenants[team_id] = tenant
+            evicted = []
+            while len(self._tenants) > self.max_tenants:
+                evicted.append(self._tenants.popitem(last=False)[1])
+        for old in evicted:
+            self.stats["evictions"] += 1
+            self._close_later(old)
+        return tenant
+
+    def require(self, team_id):
+        tenant = self.get(team_id)
+        if tenant is None:
+            raise UnknownTenantError(f"Workspace {team_id!r} is not installed")
+        return tenant
+
+    def peek(self, team_id):
+        """
+        Like get(), but never loads; None if not in the pool.
+        """
+        if self.default is not None:
+            return self.default
+        return self._tenants.get(team_id)
+
+    def _replace(self, team_id, old, new):
+        with self._lock:
+            if new is None:
+                self._tenants.pop(team_id, None)
+            else:
+                self._tenants[team_id] = new
+        self._close_later(old)
+
+    def _close_later(self, tenant):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (scripts, threads): its session, if any, goes with it
+        task = loop.create_task(tenant.close(CLOSE_GRACE_SECONDS))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def close(self):
+        for task in list(self._closing):
+            task.cancel()
+        tenants = [self.default] if self.default is not None else list(self._tenants.values())
+        await asyncio.gather(*(tenant.close() for tenant in tenants), return_exceptions=True)
+
+    def snapshot(self, recent=20):
+        """
+        Pool counters plus per-tenant stats for the most recently used ones.
+        """
+        if self.default is not None:
+            return {"mode": "single", "size": 1}
+        tenants = list(self._tenants.items())[-recent:]
+        return {
+            "mode": "multi",
+            "size": len(self._tenants),
+            "max_tenants": self.max_tenants,
+            **self.stats,
+            "rejected": sum(tenant.rejected for tenant in self._tenants.values()),
+            "directory_members": sum(len(tenant.user_directory) for tenant in self._tenants.values()),
+            "recent": {team_id: tenant.snapshot() for team_id, tenant in reversed(tenants)},
+        }
+
+
+def set_default_tenant(tenant):
+    """
+    Single-workspace mode: the tenant used when none was selected.
+    """
+    global _default_tenant
+    _default_tenant = tenant
+
+
+def current_tenant():
+    """
+    The workspace the running request or job belongs to.
+    """
+    tenant = _current_tenant.get() or _default_tenant
+    if tenant is None:
+        raise UnknownTenantError("No Slack workspace selected for this request")
+    return tenant
+
+
+@contextmanager
+def use_tenant(tenant):
+    """
+    Make `tenant` current for the block; tasks and threads started inside
+    (event pipeline workers, asyncio.to_thread) inherit it.
+    """
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+class TenantAttribute:
+    """
+    Stand-in for a per-tenant object (`utils.slack_api` and friends):
+    attribute access goes to that object on the current tenant.
+    """
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+
+    def _target(self):
+        return getattr(current_tenant(), self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self._target(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._target(), attr, value)
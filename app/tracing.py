@@ -0,0 +1,278 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from .config import settings
+
+# Log-linear buckets in microseconds, HDR-histogram style: values below 16 us
+# are exact, above that every power of two is split into 16 sub-buckets, so a
+# percentile is off by at most 1/16 (~6%) of its value. Fixed size, no
+# allocation per observation.
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+MAX_SHIFT = 32  # top bucket starts at 16 << 32 us (about 19 hours)
+BUCKETS = (MAX_SHIFT + 2) * SUB_COUNT
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Spans kept per trace (bulk imports produce thousands); the rest only feed histograms
+MAX_TRACE_SPANS = 500
+
+
+def bucket_index(micros):
+    if micros < SUB_COUNT:
+        return max(0, micros)
+    shift = micros.bit_length() - SUB_BITS - 1
+    if shift > MAX_SHIFT:
+        return BUCKETS - 1
+    return (shift + 1) * SUB_COUNT + (micros >> shift) - SUB_COUNT
+
+
+def bucket_upper(index):
+    """
+    Largest value (us) that lands in bucket `index`.
+    """
+    if index < SUB_COUNT:
+        return index
+    shift = index // SUB_COUNT - 1
+    top = SUB_COUNT + index % SUB_COUNT
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Fixed-memory latency histogram with percentile queries (seconds in,
+    seconds out).
+    """
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        index = bucket_index(int(seconds * 1_000_000))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentiles(self, quantiles=QUANTILES):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            largest = self.max
+        result = {}
+        if not total:
+            return {q: 0.0 for q in quantiles}
+        targets = sorted((max(1, int(q * total + 0.999999)), q) for q in quantiles)
+        seen = 0
+        pending = iter(targets)
+        rank, q = next(pending)
+        for index, n in enumerate(counts):
+            seen += n
+            while seen >= rank:
+                result[q] = min(bucket_upper(index) / 1_000_000, largest)
+                try:
+                    rank, q = next(pending)
+                except StopIteration:
+                    return result
+        return result
+
+    def as_dict(self):
+        p = self.percentiles()
+        return {
+            "count": self.count,
+            "p50_ms": round(p[0.5] * 1000, 2),
+            "p95_ms": round(p[0.95] * 1000, 2),
+            "p99_ms": round(p[0.99] * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class Trace:
+    def __init__(self, trace_id, name):
+        self.trace_id = trace_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []  # (name, kind, offset_s, duration_s, error)
+        self.dropped_spans = 0
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 2),
+            "dropped_spans": self.dropped_spans,
+            "spans": [
+                {"name": name, "kind": kind, "offset_ms": round(offset * 1000, 2),
+                 "duration_ms": round(duration * 1000, 2), **({"error": error} if error else {})}
+                for name, kind, offset, duration, error in list(self.spans)
+            ],
+        }
+
+
+_current_trace = contextvars.ContextVar("flexioff_trace", default=None)
+
+
+class Tracer:
+    """
+    Request-scoped spans plus one latency histogram per span name.
+
+    The current trace lives in a ContextVar, so it follows the request into
+    awaited coroutines, `asyncio.to_thread` helpers, background tasks and
+    (see EventPipeline) queued work. Spans outside a trace still feed the
+    histograms. Finished traces are kept in a small ring for /slack/traces.
+    """
+    def __init__(self, recent=200, slow_seconds=0.0):
+        self.histograms = {}
+        self.recent = deque(maxlen=recent)
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+
+    def histogram(self, name, kind="stage"):
+        key = (name, kind)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(key, LatencyHistogram())
+        return hist
+
+    def observe(self, name, seconds, kind="stage", error=None):
+        self.histogram(name, kind).add(seconds)
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        if len(trace.spans) >= MAX_TRACE_SPANS:
+            trace.dropped_spans += 1
+        else:
+            trace.spans.append((name, kind, time.perf_counter() - seconds - trace.started, seconds, error))
+
+    @contextmanager
+    def span(self, name, kind="stage"):
+        """
+        Time a block as a span of the current trace:
+
+            with tracer.span("llm_call", kind="external"):
+                response = await client.chat.completions.create(...)
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, kind, error)
+
+    @contextmanager
+    def trace(self, name, trace_id=None):
+        """
+        Start a trace (or a new root under the current trace id).
+        """
+        parent = _current_trace.get()
+        trace = Trace(trace_id or (parent.trace_id if parent else uuid.uuid4().hex[:16]), name)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace):
+        trace.duration = time.perf_counter() - trace.started
+        self.recent.append(trace)
+        if self.slow_seconds and trace.duration >= self.slow_seconds:
+            totals = {}
+            for name, _, _, duration, _ in trace.spans:
+                count, total = totals.get(name, (0, 0.0))
+                totals[name] = (count + 1, total + duration)
+            steps = ", ".join(
+                f"{name}={total * 1000:.0f}ms" + (f" x{count}" if count > 1 else "")
+                for name, (count, total) in totals.items()
+            )
+            print(f"[Trace] Slow {trace.name} {trace.trace_id}: {trace.duration * 1000:.0f} ms ({steps})")
+
+    def traces(self, trace_id=None, limit=50):
+        found = [t for t in reversed(self.recent) if trace_id is None or t.trace_id == trace_id]
+        return [t.as_dict() for t in found[:limit]]
+
+    def snapshot(self):
+        return {f"{kind}:{name}": h.as_dict() for (name, kind), h in sorted(self.histograms.items())}
+
+    def prometheus(self):
+        """
+        Histograms in Prometheus text format, as summaries with p50/p95/p99.
+        """
+        lines = [
+            "# HELP flexioff_span_seconds Latency of pipeline stages and external calls.",
+            "# TYPE flexioff_span_seconds summary",
+        ]
+        for (name, kind), hist in sorted(self.histograms.items()):
+            labels = f'span="{escape_label(name)}",kind="{escape_label(kind)}"'
+            for q, value in sorted(hist.percentiles().items()):
+                lines.append(f'flexioff_span_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"flexioff_span_seconds_sum{{{labels}}} {hist.sum:.6f}")
+            lines.append(f"flexioff_span_seconds_count{{{labels}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def tag_trace(trace_id):
+    """
+    Re-key the current trace once the Slack id (event_id / trigger_id) is known.
+    """
+    trace = _current_trace.get()
+    if trace is not None and trace_id:
+        trace.trace_id = trace_id
+
+
+tracer = Tracer(recent=settings.TRACE_RECENT, slow_seconds=settings.TRACE_SLOW_MS / 1000.0)
+span = tracer.span
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that runs every HTTP request inside a trace. The request
+    latency is recorded under its route template when the response is sent;
+    background tasks (e.g. the slash command) still add spans to the trace.
+    """
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                route = scope.get("route")
+                name = f"http {scope['method']} {getattr(route, 'path', 'unmatched')}"
+                tracer.observe(name, time.perf_counter() - trace.started, kind="http",
+                               error=None if status["code"] < 500 else str(status["code"]))
+            await send(message)
+
+        with tracer.trace(f"{scope['method']} {scope['path']}") as trace:
+            await self.app(scope, receive, send_wrapper)
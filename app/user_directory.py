@@ -0,0 +1,272 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from .tracing import span
+
+PREFIX_MIN = 2
+PREFIX_MAX = 12
+FUZZY_MIN_SCORE = 0.3
+
+
+def normalize_name(value: str) -> str:
+    """
+    Lower-case, strip accents, a leading '@' and extra whitespace:
+    "  @José  Álvarez " -> "jose alvarez"
+    """
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    value = value.strip().lstrip("@").lower()
+    return re.sub(r"\s+", " ", value)
+
+
+def trigrams(value: str):
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DirectoryIndex:
+    """
+    Immutable snapshot of the workspace members plus lookup indexes.
+    Built in full and then swapped in, so readers never see a half-built index.
+    """
+    def __init__(self, users):
+        self.users = users
+        self.by_id = {}
+        self.by_name = {}
+        self.by_display_name = {}
+        self.by_real_name = {}
+        self.by_email = {}
+        self.by_prefix = defaultdict(set)
+        self.by_trigram = defaultdict(set)
+        self.trigram_counts = {}
+        for user in users:
+            self._add(user)
+        self.by_prefix = dict(self.by_prefix)
+        self.by_trigram = dict(self.by_trigram)
+
+    def _add(self, user):
+        user_id = user.get("id")
+        if not user_id:
+            return
+        self.by_id[user_id] = user
+        if user.get("deleted"):
+            return
+        profile = user.get("profile", {})
+        name = normalize_name(user.get("name", ""))
+        display_name = normalize_name(profile.get("display_name", ""))
+        real_name = normalize_name(user.get("real_name") or profile.get("real_name", ""))
+        email = (profile.get("email") or "").strip().lower()
+        # First writer wins, same as the old linear scan
+        for index, key in (
+            (self.by_name, name),
+            (self.by_display_name, display_name),
+            (self.by_real_name, real_name),
+            (self.by_email, email),
+        ):
+            if key:
+                index.setdefault(key, user_id)
+
+        grams = set()
+        for key in {name, display_name, real_name}:
+            if not key:
+                continue
+            for token in {key, *key.split(" ")}:
+                for n in range(PREFIX_MIN, min(len(token), PREFIX_MAX) + 1):
+                    self.by_prefix[token[:n]].add(user_id)
+            grams |= trigrams(key)
+        for gram in grams:
+            self.by_trigram[gram].add(user_id)
+        self.trigram_counts[user_id] = len(grams)
+
+
+class UserDirectory:
+    """
+    Workspace member directory with O(1) lookups by id, username, display name,
+    real name and email, plus prefix/trigram fuzzy name search.
+
+    The first call loads synchronously (paginating users.list); concurrent
+    first callers wait for that one load. If it fails, lookups answer from
+    the empty index and the load is retried no sooner than `retry_base`
+    seconds later, doubling per failure up to `retry_max`. After `ttl`
+    seconds, reads keep using the current index while a background thread
+    builds a new one and swaps it in. Callables in `listeners` receive the
+    full member list after every successful load. `client` may be a
+    WebClient or a zero-argument callable returning one on first load.
+    """
+    def __init__(self, client, ttl=600, page_size=200, retry_base=5.0, retry_max=300.0):
+        self._client = client
+        self.ttl = ttl
+        self.page_size = page_size
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._index = DirectoryIndex([])
+        self._loaded_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self.listeners = []
+
+    @property
+    def client(self):
+        return self._client() if callable(self._client) else self._client
+
+    def fetch_all_members(self):
+        """
+        Page through users.list following next_cursor; raises on API errors.
+        """
+        client = self.client
+        members = []
+        cursor = None
+        while True:
+            with span("slack.users.list", kind="external"):
+                resp = client.users_list(limit=self.page_size, cursor=cursor)
+            if not resp.get("ok"):
+                raise RuntimeError(f"Slack users_list error: {resp.get('error')}")
+            members.extend(resp["members"])
+            cursor = resp.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                return members
+
+    def _load(self):
+        """
+        Fetch and swap in a new index; caller holds `_load_lock`. On error
+        the previous index is kept and the next attempt is pushed back.
+        """
+        try:
+            print("Fetching users from Slack API...")
+            members = self.fetch_all_members()
+        except Exception as e:
+            self._failures += 1
+            delay = min(self.retry_max, self.retry_base * 2 ** (self._failures - 1))
+            self._retry_at = time.time() + delay
+            print(f"Slack users_list API call failed: {e} (next try in {delay:g}s)")
+            return
+        self._index = DirectoryIndex(members)
+        self._loaded_at = time.time()
+        self._failures = 0
+        self._retry_at = 0.0
+        print(f"[UserDirectory] Indexed {len(members)} members")
+        for listener in self.listeners:
+            listener(members)
+
+    def refresh(self):
+        """
+        Reload the directory and swap in the new index. On error the
+        previous index is kept.
+        """
+        with self._load_lock:
+            try:
+                self._load()
+            finally:
+                self._refreshing = False
+
+    def _refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="user-directory-refresh", daemon=True).start()
+
+    def index(self) -> DirectoryIndex:
+        """
+        Current index, loading it first if we have never loaded.
+        """
+        if not self._loaded_at:
+            with self._load_lock:
+                # Re-check: another caller may have loaded (or just failed) while we waited
+                if not self._loaded_at and time.time() >= self._retry_at:
+                    self._load()
+        elif time.time() - self._loaded_at > self.ttl:
+            self._refresh_in_background()
+        return self._index
+
+    def __len__(self):
+        """
+        Members in the current index (never loads).
+        """
+        return len(self._index.users)
+
+    def unload(self):
+        """
+        Drop the index to free its memory; the next lookup loads it again.
+        Returns how many members were dropped.
+        """
+        dropped = len(self._index.users)
+        self._loaded_at = 0.0
+        self._index = DirectoryIndex([])
+        return dropped
+
+    @property
+    def users(self):
+        return self.index().users
+
+    def get(self, user_id):
+        return self.index().by_id.get(user_id)
+
+    def peek(self, user_id):
+        """
+        Like get(), but never loads or refreshes; None if not indexed yet.
+        """
+        return self._index.by_id.get(user_id)
+
+    def find_by_username(self, username):
+        """
+        Match a Slack handle against `name`, then `display_name`.
+        """
+        key = normalize_name(username)
+        index = self.index()
+        return index.by_name.get(key) or index.by_display_name.get(key)
+
+    def find_by_real_name(self, real_name):
+        return self.index().by_real_name.get(normalize_name(real_name))
+
+    def find_by_email(self, email):
+        return self.index().by_email.get((email or "").strip().lower())
+
+    def search(self, name, limit=5):
+        """
+        Best-effort name resolution, most specific match first:
+        exact key, then token/full-name prefix, then trigram similarity.
+        Returns a list of user ids.
+        """
+        key = normalize_name(name)
+        if not key:
+            return []
+        index = self.index()
+        for exact in (index.by_real_name, index.by_display_name, index.by_name):
+            if key in exact:
+                return [exact[key]]
+
+        prefix_hits = index.by_prefix.get(key[:PREFIX_MAX], set())
+        if len(key) > PREFIX_MAX:
+            # Prefix index is truncated, confirm the rest of the name
+            prefix_hits = {
+                uid for uid in prefix_hits
+                if any(key in normalize_name(candidate) for candidate in (
+                    index.by_id[uid].get("real_name", ""),
+                    index.by_id[uid].get("profile", {}).get("display_name", ""),
+                    index.by_id[uid].get("name", ""),
+                ))
+            }
+        if prefix_hits:
+            return sorted(prefix_hits, key=lambda uid: index.by_id[uid].get("real_name", ""))[:limit]
+
+        query_grams = trigrams(key)
+        hits = defaultdict(int)
+        for gram in query_grams:
+            for uid in index.by_trigram.get(gram, ()):
+                hits[uid] += 1
+        scored = []
+        for uid, shared in hits.items():
+            score = shared / (len(query_grams) + index.trigram_counts[uid] - shared)
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((score, uid))
+        scored.sort(reverse=True)
+        return [uid for _, uid in scored[:limit]]
@@ -1,20 +1,128 @@
-import openai
+import os
 import json
+import asyncio
+import hashlib
 import re
+import threading
 import time
 from datetime import date
-from slack_sdk import WebClient
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from datetime import datetime, timedelta
-from ics import Calendar, Event
+from typing import TYPE_CHECKING
 from .prompt_helper import get_llm_leave_system_prompt 
+from .fast_parser import fast_parse_leave_request, record_parse_path
+from .llm_cache import LLMResponseCache
+from .slack_client import RateLimitedSlackClient
+from .tenants import (
+    DEFAULT_TEAM_ID, Tenant, TenantPool, TenantStore, TenantAttribute, current_tenant, set_default_tenant,
+)
+from .leave_store import LeaveStore
+from .leave_index import LeaveIndex, format_capacity_note
+from .gcal import get_calendar_writer, fallback_request_id
+from .ics_feed import calendar_header, render_event, CALENDAR_FOOTER
+from .llm_structured import parse_leave_request_structured, parse_leave_request_structured_async
+from .tracing import span
 
 
 from .config import settings
 
-slack_client = WebClient(token=settings.SLACK_BOT_TOKEN)
-openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
+
+# openai, slack_sdk and the Google libraries take most of the app's import
+# time, so they are imported and their clients built on first use (or by
+# warm_clients() right after startup). `utils.slack_client` etc. still work.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _lazy_client(name, create):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = create()
+    return client
+
+def slack_base_url():
+    # slack_sdk joins method names straight onto base_url
+    url = settings.SLACK_API_URL
+    return {"base_url": url if url.endswith("/") else url + "/"} if url else {}
+
+def get_slack_client():
+    # Per workspace, see tenants.Tenant
+    return current_tenant().get_slack_client()
+
+def get_openai_client():
+    def create():
+        import openai
+        return openai.OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+    return _lazy_client("openai_client", create)
+
+def get_async_openai_client():
+    def create():
+        import openai
+        return openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+    return _lazy_client("async_openai_client", create)
+
+_LAZY_CLIENTS = {
+    "slack_client": get_slack_client,
+    "openai_client": get_openai_client,
+    "async_openai_client": get_async_openai_client,
+}
+
+def __getattr__(name):
+    if name in _LAZY_CLIENTS:
+        return _LAZY_CLIENTS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def make_tenant(record):
+    return Tenant(
+        record["team_id"], record["bot_token"], record.get("gcal_email") or "",
+        base_url=slack_base_url().get("base_url"),
+        profile_ttl=settings.PROFILE_CACHE_TTL,
+        profile_max_entries=settings.TENANT_PROFILE_CACHE_MAX_ENTRIES,
+        slack_pool_size=settings.TENANT_SLACK_POOL_SIZE,
+        max_channel_buckets=settings.TENANT_MAX_CHANNEL_BUCKETS,
+        requests_per_minute=settings.TENANT_REQUESTS_PER_MINUTE,
+    )
+
+# Slack token, clients and caches per workspace. Single-workspace mode has
+# one tenant built from the environment; multi-tenant mode picks one by the
+# payload's team_id (see slack_events) from the tenant store.
+if settings.MULTI_TENANT:
+    tenant_pool = TenantPool(
+        TenantStore(settings.TENANT_DB_PATH), make_tenant,
+        max_tenants=settings.TENANT_POOL_SIZE, refresh_seconds=settings.TENANT_REFRESH_SECONDS,
+        max_directory_members=settings.TENANT_DIRECTORY_MAX_MEMBERS,
+    )
+else:
+    tenant_pool = TenantPool(default=Tenant(
+        DEFAULT_TEAM_ID, settings.SLACK_BOT_TOKEN, settings.EMPLOYEE_GCAL_EMAIL,
+        base_url=slack_base_url().get("base_url"),
+        profile_ttl=settings.PROFILE_CACHE_TTL,
+        profile_max_entries=settings.PROFILE_CACHE_MAX_ENTRIES,
+        status_token=settings.SLACK_STATUS_USER_TOKEN,
+    ))
+    set_default_tenant(tenant_pool.default)
+
+# The current workspace's non-blocking Slack client (used by the event
+# pipeline workers and jobs; its aiohttp session is opened on the first
+# call), member directory and profile cache
+slack_api = TenantAttribute("slack_api")
+user_directory = TenantAttribute("user_directory")
+profile_cache = TenantAttribute("profile_cache")
+
+LLM_MODEL = "gpt-4"
+# "classic" = LLM_MODEL + json.loads; "structured" = streamed JSON-schema output from LLM_FAST_MODEL
+STRUCTURED_MODE = settings.LLM_MODE == "structured"
+ACTIVE_LLM_MODEL = settings.LLM_FAST_MODEL if STRUCTURED_MODE else LLM_MODEL
+
+llm_cache = LLMResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    sqlite_path=settings.LLM_CACHE_SQLITE_PATH or None,
+    # Answers depend on the model and prompt, not just the message
+    namespace=f"{ACTIVE_LLM_MODEL}:{settings.LLM_PROMPT_VARIANT}",
+)
 
 APPROVAL_EMOJI = {
     "vacation": "🌴",
@@ -23,32 +131,96 @@ APPROVAL_EMOJI = {
     "default": "😊"
 }
 
-USER_CACHE = {"users": [], "last_updated": 0}
+leave_store = LeaveStore(
+    settings.LEAVE_DB_PATH,
+    batch_size=settings.LEAVE_WRITE_BATCH_SIZE,
+    flush_interval=settings.LEAVE_WRITE_FLUSH_MS / 1000.0,
+)
+# Pending + approved leave in memory, for overlap / team capacity checks.
+# Only this process's writes reach it, so it answers the quick first check;
+# the store re-checks in the insert transaction (see store_leave_request).
+leave_index = LeaveIndex(capacity_limit=settings.TEAM_CAPACITY_LIMIT)
+leave_store.listeners.append(leave_index.on_change)
 
-def parse_leave_request_llm(user_id: str, user_message: str):
-    user_tz = get_slack_user_timezone(user_id, slack_client)
-    if user_tz is None:
-        user_tz = 'UTC'
+def build_leave_llm_messages(user_tz: str, user_message: str):
+    system_prompt = get_llm_leave_system_prompt(user_tz, settings.LLM_PROMPT_VARIANT)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
 
-    system_prompt =system_prompt = get_llm_leave_system_prompt(user_tz)
-    response = openai_client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ],
-        max_tokens=512,
-        temperature=0.0
-    )
-    # Updated for new API
+def decode_leave_llm_response(response):
     try:
-        import json
         return json.loads(response.choices[0].message.content)
     except Exception as e:
         print("LLM Parse error:", e, response)
         return {}
 
-def post_manager_leave_request(user_id, leave_info, manager_id):
+def try_fast_parse(user_message: str, user_tz: str):
+    """
+    Run the local rule-based extractor; returns leave_info when it is confident
+    enough to skip the LLM, else None.
+    """
+    leave_info, confidence = fast_parse_leave_request(user_message, user_tz)
+    fast = leave_info is not None and confidence >= settings.FAST_PARSE_MIN_CONFIDENCE
+    record_parse_path(fast)
+    return leave_info if fast else None
+
+def parse_leave_request_llm(user_id: str, user_message: str):
+    with span("timezone_lookup"):
+        user_tz = get_slack_user_timezone(user_id, get_slack_client())
+    if user_tz is None:
+        user_tz = 'UTC'
+
+    with span("fast_parse_or_cache"):
+        leave_info = try_fast_parse(user_message, user_tz) or llm_cache.get(user_message, user_tz)
+    if leave_info:
+        return leave_info
+
+    with span("prompt_build"):
+        messages = build_leave_llm_messages(user_tz, user_message)
+    with span(f"openai.{ACTIVE_LLM_MODEL}", kind="external"):
+        if STRUCTURED_MODE:
+            leave_info = parse_leave_request_structured(get_openai_client(), ACTIVE_LLM_MODEL, messages)
+        else:
+            response = get_openai_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                max_tokens=512,
+                temperature=0.0
+            )
+            leave_info = decode_leave_llm_response(response)
+    llm_cache.put(user_message, user_tz, leave_info)
+    return leave_info
+
+async def parse_leave_request_llm_async(user_id: str, user_message: str):
+    with span("timezone_lookup"):
+        user_tz = await get_slack_user_timezone_async(user_id, slack_api)
+    if user_tz is None:
+        user_tz = 'UTC'
+
+    with span("fast_parse_or_cache"):
+        leave_info = try_fast_parse(user_message, user_tz) or await llm_cache.get_async(user_message, user_tz)
+    if leave_info:
+        return leave_info
+
+    with span("prompt_build"):
+        messages = build_leave_llm_messages(user_tz, user_message)
+    with span(f"openai.{ACTIVE_LLM_MODEL}", kind="external"):
+        if STRUCTURED_MODE:
+            leave_info = await parse_leave_request_structured_async(get_async_openai_client(), ACTIVE_LLM_MODEL, messages)
+        else:
+            response = await get_async_openai_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                max_tokens=512,
+                temperature=0.0
+            )
+            leave_info = decode_leave_llm_response(response)
+    await llm_cache.put_async(user_message, user_tz, leave_info)
+    return leave_info
+
+def format_leave_request_text(user_id, leave_info):
     leave_type = (leave_info.get('leave_type') or "not specified").capitalize()
     leave_dates = leave_info.get('leave_dates', [])
     leave_reason = leave_info.get('leave_reason', '')
@@ -57,107 +229,254 @@ def post_manager_leave_request(user_id, leave_info, manager_id):
         else f"{leave_dates[0]} and {leave_dates[1]}" if len(leave_dates) == 2
         else (", ".join(leave_dates[:-1]) + f", and {leave_dates[-1]}" if leave_dates else "")
     )
-    text = (
+    return (
         f"*Leave request* from <@{user_id}>:\n"
         f"*Type*: {leave_type}\n"
         f"*Dates*: {dates_str}\n"
         f"*Reason*: {leave_reason or '_Not specified_'}"
     )
-    blocks = [
-        {"type": "section", "text": {"type": "mrkdwn", "text": text}},
-        {"type": "actions", "elements": [
-            {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "Approve"},
-                "style": "primary",
-                "action_id": "approve_leave",
-                "value": json.dumps({
-                    "uid": user_id,
-                    "leave_dates": leave_dates,
-                    "leave_type": leave_type,
-                    "leave_reason": leave_reason
-                })
-            },
-            {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "Deny"},
-                "style": "danger",
-                "action_id": "deny_leave",
-                "value": json.dumps({
-                    "uid": user_id
-                })
-            }
-        ]}
+
+def build_leave_action_block(request_id, block_id=None):
+    block = {"type": "actions", "elements": [
+        {
+            "type": "button",
+            "text": {"type": "plain_text", "text": "Approve"},
+            "style": "primary",
+            "action_id": "approve_leave",
+            "value": json.dumps({"rid": request_id})
+        },
+        {
+            "type": "button",
+            "text": {"type": "plain_text", "text": "Deny"},
+            "style": "danger",
+            "action_id": "deny_leave",
+            "value": json.dumps({"rid": request_id})
+        }
+    ]}
+    if block_id:
+        block["block_id"] = block_id
+    return block
+
+def build_manager_leave_blocks(user_id, leave_info, request_id, capacity_note=None):
+    """
+    Returns the Approve/Deny block kit payload sent to the manager.
+    The buttons only carry the request id; the request itself is in leave_store.
+    """
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": format_leave_request_text(user_id, leave_info)}}]
+    if capacity_note:
+        blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": capacity_note}]})
+    blocks.append(build_leave_action_block(request_id))
+    return blocks
+
+# Slack allows 50 blocks per message: a header plus two blocks per request
+BULK_REQUESTS_PER_MESSAGE = 24
+BULK_BLOCK_PREFIX = "bulk:"
+
+def build_manager_bulk_blocks(requests, total=None):
+    """
+    One message listing several requests for the same manager, each with its
+    own Approve/Deny buttons. `requests` is [(request_id, user_id, leave_info)].
+    """
+    total = total or len(requests)
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": (
+        f"*{total} leave requests* were imported for your approval"
+        + (f" (showing {len(requests)} in this message)" if total != len(requests) else "") + ":"
+    )}}]
+    for request_id, user_id, leave_info in requests:
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": format_leave_request_text(user_id, leave_info)}})
+        blocks.append(build_leave_action_block(request_id, block_id=f"{BULK_BLOCK_PREFIX}{request_id}"))
+    return blocks
+
+def mark_bulk_request_handled(blocks, block_id, text):
+    """
+    Replace one request's buttons in a grouped message, keeping the others.
+    """
+    return [
+        {"type": "context", "block_id": block_id, "elements": [{"type": "mrkdwn", "text": text}]}
+        if block.get("block_id") == block_id else block
+        for block in blocks
     ]
-    slack_client.chat_postMessage(
+
+async def check_leave_conflicts(user_id, manager_id, leave_dates):
+    """
+    leave_index report (the user's own overlapping leave, who else on the
+    manager's team is out, days over TEAM_CAPACITY_LIMIT) for new dates,
+    within the current workspace.
+    """
+    if not leave_index.loaded:
+        await asyncio.to_thread(leave_index.ensure_loaded, leave_store)
+    with span("leave_index_check"):
+        return leave_index.check(current_tenant().team_id, user_id, manager_id, leave_dates)
+
+def is_duplicate_leave(leave_dates, report):
+    """
+    True when every requested day is already pending or approved for the user.
+    """
+    return bool(leave_dates) and all(day in report["overlap"] for day in leave_dates)
+
+async def store_leave_request(user_id, leave_info, manager_id):
+    """
+    Store the request as pending. Returns (request_id, capacity_note), or
+    (None, None) if the user already has leave on all of these dates.
+
+    The in-memory index turns away obvious duplicates without a write. It
+    doesn't see other workers' requests, so the store repeats the check in
+    the insert transaction, and the note comes from that second check.
+    """
+    leave_dates = leave_info.get("leave_dates") or []
+    report = await check_leave_conflicts(user_id, manager_id, leave_dates)
+    if is_duplicate_leave(leave_dates, report):
+        return None, None
+    with span("leave_store_checked_insert"):
+        request_id, report = await leave_store.create_checked(
+            current_tenant().team_id, user_id, manager_id, leave_info, capacity_limit=leave_index.capacity_limit,
+        )
+    if request_id is None:
+        return None, None
+    return request_id, format_capacity_note(user_id, report)
+
+async def notify_manager_leave_request(user_id, leave_info, manager_id, request_id, capacity_note=None):
+    """
+    DM the manager Approve/Deny buttons for a stored request.
+    """
+    await slack_api.chat_postMessage(
         channel=manager_id,
         text=f"Leave request from <@{user_id}>",
-        blocks=blocks
+        blocks=build_manager_leave_blocks(user_id, leave_info, request_id, capacity_note)
     )
 
-def set_slack_ooo(user_id: str, leave_info: dict):
-    slack_client.users_profile_set(
-        user=user_id,
-        profile={
-            "status_text": f"OOO until {leave_info.get('leave_dates')}",
-            "status_emoji": ":palm_tree:",
-            "status_expiration": 0,
-        }
-    )
+async def post_manager_leave_request(user_id, leave_info, manager_id):
+    """
+    Store the request as pending and DM the manager Approve/Deny buttons,
+    with any overlap / team capacity warnings. Returns the new request id,
+    or None (nothing stored or sent) if the user already has leave on all
+    of these dates.
+    """
+    request_id, capacity_note = await store_leave_request(user_id, leave_info, manager_id)
+    if request_id is not None:
+        await notify_manager_leave_request(user_id, leave_info, manager_id, request_id, capacity_note)
+    return request_id
 
-def create_gcal_ooo_event(leave_info: dict, gcal_email: str, google_creds_dir: str):
-    creds_file = f"{google_creds_dir}/token.json"
-    creds = Credentials.from_authorized_user_file(creds_file, ['https://www.googleapis.com/auth/calendar'])
-    service = build('calendar', 'v3', credentials=creds)
-    # Parse simple date ranges: 2024-06-15 or 2024-06-15 to 2024-06-18
-    dates = leave_info.get('leave_dates').split(' to ')
-    start_date = dates[0]
-    end_date = dates[1] if len(dates) > 1 else dates[0]
-    # Google Calendar end date is exclusive, so add 1 day if single-day
-    if start_date == end_date:
-        end_date_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-        end_date = end_date_dt.strftime("%Y-%m-%d")
-    event = {
-        'summary': 'Out of Office',
-        'description': leave_info.get('leave_reason', ''),
-        'start': {'date': start_date, 'timeZone': 'UTC'},
-        'end': {'date': end_date, 'timeZone': 'UTC'},
-        'transparency': 'opaque',
-        'visibility': 'default',
-    }
-    service.events().insert(calendarId=gcal_email, body=event).execute()
+async def post_manager_bulk_requests(manager_id, requests):
+    """
+    DM a manager already-stored requests grouped into as few messages as
+    Slack allows. Returns the number of messages sent.
+    """
+    chunks = [
+        requests[i:i + BULK_REQUESTS_PER_MESSAGE]
+        for i in range(0, len(requests), BULK_REQUESTS_PER_MESSAGE)
+    ]
+    for chunk in chunks:
+        await slack_api.chat_postMessage(
+            channel=manager_id,
+            text=f"{len(requests)} leave requests waiting for your approval",
+            blocks=build_manager_bulk_blocks(chunk, total=len(requests))
+        )
+    return len(chunks)
+
+async def set_slack_ooo(user_id: str, leave_info: dict):
+    """
+    Best effort: set the user's Slack status to OOO. Needs the workspace's
+    user token (SLACK_STATUS_USER_TOKEN); skipped without one. Failures are
+    logged, not raised, so they never fail an approval. Returns True if set.
+    """
+    status_api = current_tenant().status_api
+    if status_api is None:
+        return False
+    leave_dates = leave_info.get('leave_dates') or []
+    try:
+        await status_api.users_profile_set(
+            user=user_id,
+            profile={
+                "status_text": f"OOO until {leave_dates[-1]}" if leave_dates else "OOO",
+                "status_emoji": ":palm_tree:",
+                "status_expiration": 0,
+            }
+        )
+    except Exception as e:
+        print(f"[SlackStatus] Could not set {user_id}'s OOO status: {e}")
+        return False
+    return True
+
+GOOGLE_CREDS_DIR = os.path.join(os.path.dirname(__file__), "google_creds")
+
+def create_gcal_ooo_event(leave_info: dict, gcal_email: str, google_creds_dir: str = GOOGLE_CREDS_DIR, request_id: str = None,
+                          strict: bool = False):
+    """
+    Add all-day OOO events for leave_info['leave_dates'] (list of DD-MM-YYYY),
+    one per run of consecutive days. Idempotent per request_id. With
+    `strict`, a failed insert raises.
+    """
+    writer = get_calendar_writer(google_creds_dir)
+    return writer.write_leave(request_id or fallback_request_id(leave_info), leave_info, gcal_email, strict=strict)
+
+def add_leave_to_calendar(request_id, leave_info):
+    """
+    Approval side effect; skipped when no Google token is configured.
+    Raises if an event could not be written, so the approval job retries.
+    """
+    if not os.path.exists(os.path.join(GOOGLE_CREDS_DIR, "token.json")):
+        return None
+    gcal_email = current_tenant().gcal_email or settings.EMPLOYEE_GCAL_EMAIL
+    return create_gcal_ooo_event(leave_info, gcal_email, GOOGLE_CREDS_DIR, request_id, strict=True)
+
+# Modules pulled in lazily elsewhere (slack_client, slack_events, gcal)
+WARM_IMPORTS = (
+    "aiohttp",
+    "slack_sdk.web.async_client",
+    "slack_sdk.signature",
+    "googleapiclient.discovery",
+    "google.oauth2.credentials",
+)
+
+def warm_clients():
+    """
+    Import the heavy SDKs and build the clients ahead of the first request.
+    Blocking; run it in a thread. Every step is best effort.
+    """
+    import importlib
+    steps = [(name, lambda name=name: importlib.import_module(name)) for name in WARM_IMPORTS]
+    steps += [
+        ("openai_client", get_openai_client),
+        ("async_openai_client", get_async_openai_client),
+    ]
+    if tenant_pool.default is not None:
+        # Multi-tenant workspaces are loaded when their first request comes in
+        steps += [
+            ("slack_client", get_slack_client),
+            ("user_directory", user_directory.index),
+        ]
+    if os.path.exists(os.path.join(GOOGLE_CREDS_DIR, "token.json")):
+        steps.append(("calendar_writer", lambda: get_calendar_writer(GOOGLE_CREDS_DIR)))
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"[Startup] Pre-warm of {name} failed: {e}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
 
 def lookup_slack_id_by_name(name: str) -> str:
-    """Find Slack user ID by their real name or display name, returns first match or None."""
-    # This will call users.list API (requires users:read permission on the bot)
-    resp = slack_client.users_list()
-    for user in resp['members']:
-        # 'real_name' is full name, 'profile.display_name' is Slack display
-        if not user.get('deleted') and (name.lower() in user['real_name'].lower() or name.lower() in user['profile'].get('display_name', '').lower()):
-            return user['id']
-    return None
+    """Find Slack user ID by their real name or display name, returns best match or None."""
+    # Served from the indexed directory (users.list, requires users:read on the bot)
+    matches = user_directory.search(name, limit=1)
+    return matches[0] if matches else None
 
 def create_ics_event(summary, start_date, end_date, description):
-    c = Calendar()
-    e = Event()
-    e.name = summary
-    e.begin = start_date
-    # If single-day, add 1 day to end (Google/Outlook expects exclusive end)
-    from datetime import datetime, timedelta
-    try:
-        dt_start = datetime.strptime(start_date, "%Y-%m-%d")
-        dt_end = datetime.strptime(end_date, "%Y-%m-%d")
-    except Exception:
-        # fallback: leave unchanged, some date parsing may be needed
-        dt_start = dt_end = None
-    if dt_end and dt_start and dt_end == dt_start:
-        dt_end = dt_start + timedelta(days=1)
-        e.end = dt_end.strftime("%Y-%m-%d")
-    else:
-        e.end = end_date
-    e.description = description
-    c.events.add(e)
-    return str(c)
+    """
+    Single all-day event as an iCalendar string. Dates are YYYY-MM-DD and
+    end_date is the last day of leave (inclusive), same as a one-day leave.
+    """
+    dt_start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    dt_end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    uid = f"{hashlib.sha1(f'{summary}:{start_date}:{end_date}'.encode()).hexdigest()}@flexioff"
+    return (
+        calendar_header()
+        + render_event(uid, dt_start, dt_end + timedelta(days=1), summary, description)
+        + CALENDAR_FOOTER
+    )
 
 def extract_user_ids(text):
     """
@@ -169,7 +488,7 @@ def extract_user_ids(text):
 def extract_manager_id_from_mention(mention_str):
     """
     Extract Slack User ID from either a canonical Slack mention <@U12345>
-    or (if slack_client is given) a plain @username or display_name.
+    or (via the indexed user directory) a plain @username or display_name.
 
     Returns user_id or None.
     """
@@ -182,20 +501,14 @@ def extract_manager_id_from_mention(mention_str):
         return m.group(1)
 
     # 2. Fallback: @username or display name
-    if slack_client:
-        users = get_cached_slack_users(slack_client)
-        username_match = re.match(r"@(\w+)", mention_str)
-        username = username_match.group(1) if username_match else None
-
-        for user in users:
-            # Match username (e.g. @arajadurai)
-            if username and (user.get("name") == username or user.get("profile", {}).get("display_name") == username):
-                return user["id"]
-            # Match plain text mention with real name (e.g. "Priya")
-            if mention_str.strip() == user.get("real_name", ""):
-                return user["id"]
-    
-    return None
+    username_match = re.match(r"@(\w+)", mention_str)
+    if username_match:
+        # Match username (e.g. @arajadurai)
+        user_id = user_directory.find_by_username(username_match.group(1))
+        if user_id:
+            return user_id
+    # Match plain text mention with real name (e.g. "Priya")
+    return user_directory.find_by_real_name(mention_str)
 
 def get_emoji_for_type(leave_type: str) -> str:
     return APPROVAL_EMOJI.get((leave_type or "").lower(), APPROVAL_EMOJI["default"])
@@ -214,37 +527,41 @@ def build_leave_confirmation(dates, leave_type):
         all_but_last = ", ".join(dates[:-1])
         return f"Your leave request for {all_but_last}, and {dates[-1]} has been forwarded to your manager for approval. {emoji}🤝"
     
-def get_slack_user_timezone(user_id, slack_client: WebClient):
+def get_slack_user_timezone(user_id, slack_client: "WebClient"):
     """
     Returns the user's IANA timezone string (e.g. 'Asia/Kolkata') given their Slack user ID,
-    or None if it cannot be determined.
+    or None if it cannot be determined. Served from profile_cache when possible.
     """
     try:
-        response = slack_client.users_info(user=user_id)
-        user = response['user']
+        def fetch():
+            with span("slack.users.info", kind="external"):
+                return slack_client.users_info(user=user_id)['user']
+
+        user = profile_cache.get(user_id, fetch)
         return user.get('tz')  # Example: 'Asia/Kolkata', 'America/Los_Angeles'
     except Exception as e:
         print(f"Unable to fetch user info or timezone for user {user_id}:", e)
         return None
+
+async def get_slack_user_timezone_async(user_id, slack_client: RateLimitedSlackClient):
+    """
+    Same as get_slack_user_timezone, for the async Slack client.
+    """
+    async def fetch():
+        response = await slack_client.users_info(user=user_id)
+        return response['user']
+
+    try:
+        user = await profile_cache.aget(user_id, fetch)
+        return user.get('tz')
+    except Exception as e:
+        print(f"Unable to fetch user info or timezone for user {user_id}:", e)
+        return None
     
-def get_cached_slack_users(slack_client, cache_seconds=600):
+def get_cached_slack_users(slack_client=None, cache_seconds=600):
     """
-    Get list of users from cache, or refresh if cache is old or empty.
-    - Only calls Slack API once per 'cache_seconds' (default 10 min).
-    - On error or ratelimit, returns last known cached list, never blocks.
+    Get list of users from the shared UserDirectory.
+    - Refreshes in the background once the directory is older than its TTL.
+    - On error or ratelimit, returns last known list, never blocks after the first load.
     """
-    now = time.time()
-    # Only update from API when past cache_seconds since last update
-    if now - USER_CACHE["last_updated"] > cache_seconds or not USER_CACHE["users"]:
-        try:
-            print("Fetching users from Slack API...")
-            users_resp = slack_client.users_list()
-            if users_resp.get("ok"):
-                USER_CACHE["users"] = users_resp["members"]
-                USER_CACHE["last_updated"] = now
-            else:
-                print(f"Slack users_list error: {users_resp.get('error')}")
-        except Exception as e:
-            print(f"Slack users_list API call failed: {e}")
-            # Fallback, serve the last cached version anyway
-    return USER_CACHE["users"]
\ No newline at end of file
+    return user_directory.users
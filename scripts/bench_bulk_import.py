@@ -0,0 +1,117 @@
+"""
+Time POST /leave/bulk end to end against stubbed Slack and OpenAI.
+
+    python -m scripts.bench_bulk_import [--rows 1000] [--text-share 0.5]
+                                        [--llm-latency-ms 50] [--slack-latency-ms 20]
+                                        [--budget-s 15]
+
+Half the rows (by default) are free text that goes through the (stubbed)
+LLM, the rest are structured. The app runs in-process with its real rate
+limiter, bulk concurrency and leave store (in a temporary directory); only
+the Slack Web API and OpenAI calls are replaced. Exits non-zero if the import
+takes longer than --budget-s or any valid row fails.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+MANAGERS = 10
+# Free-text requesters; with 28 possible days no (user, day) repeats within 1000 rows
+TEXT_USERS = 500
+
+
+def build_rows(count, text_share):
+    text_every = max(1, round(1 / text_share)) if text_share else 0
+    for i in range(count):
+        if text_every and i % text_every == 0:
+            yield {"user_id": f"U{i % TEXT_USERS}", "text": f"sick leave on {1 + i % 28:02d}-07-2025 ref {i}"}
+        else:
+            yield {"user_id": f"U{i}", "manager_id": f"UM{i % MANAGERS}",
+                   "start_date": "01-08-2025", "end_date": "03-08-2025", "leave_type": "vacation"}
+
+
+def install_stubs(utils, llm_latency, slack_latency, calls):
+    class FakeSlack:
+        def __getattr__(self, method):
+            async def call(**kwargs):
+                calls[method] = calls.get(method, 0) + 1
+                await asyncio.sleep(slack_latency)
+                if method == "users_info":
+                    return {"ok": True, "user": {"id": kwargs["user"], "tz": "UTC"}}
+                return {"ok": True}
+            return call
+
+    class FakeCompletions:
+        async def create(self, messages, **kwargs):
+            calls["openai"] = calls.get("openai", 0) + 1
+            await asyncio.sleep(llm_latency)
+            day = messages[-1]["content"].split(" on ")[1][:10]
+            ref = int(messages[-1]["content"].rsplit(" ", 1)[1])
+            content = json.dumps({"leave_type": "sick", "leave_dates": [day], "leave_reason": None,
+                                  "manager_mention": f"<@UM{ref % MANAGERS}>"})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    utils.slack_api._web_client = lambda: FakeSlack()
+    utils._clients["async_openai_client"] = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    # users.list carries every requester's timezone, as in a real workspace
+    members = [{"id": f"U{i}", "name": f"user{i}", "tz": "UTC"} for i in range(TEXT_USERS)]
+    utils.user_directory.fetch_all_members = lambda: members
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time POST /leave/bulk against stubbed Slack and OpenAI.")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--text-share", type=float, default=0.5)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--slack-latency-ms", type=float, default=20)
+    parser.add_argument("--budget-s", type=float, default=15)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench", "SLACK_SIGNING_SECRET": "bench",
+        "OPENAI_API_KEY": "sk-bench", "EMPLOYEE_GCAL_EMAIL": "bench@example.com",
+        "ADMIN_API_TOKEN": "bench", "STARTUP_PREWARM": "false", "TRACE_SLOW_MS": "0",
+        "LEAVE_DB_PATH": os.path.join(tmp, "leave.sqlite3"),
+        "DEDUP_SQLITE_PATH": os.path.join(tmp, "dedup.sqlite3"),
+        "FAST_PARSE_MIN_CONFIDENCE": "2",  # send every text row to the (stub) LLM
+    })
+    from fastapi.testclient import TestClient
+    from app import utils
+    from app.main import app
+
+    calls = {}
+    install_stubs(utils, args.llm_latency_ms / 1000, args.slack_latency_ms / 1000, calls)
+    body = "\n".join(json.dumps(row) for row in build_rows(args.rows, args.text_share)).encode()
+
+    with TestClient(app) as client:
+        started = time.perf_counter()
+        lines = []
+        with client.stream("POST", "/leave/bulk", content=body, headers={
+            "Authorization": "Bearer bench", "Content-Type": "application/x-ndjson",
+        }) as response:
+            for line in response.iter_lines():
+                if line:
+                    lines.append(json.loads(line))
+        elapsed = time.perf_counter() - started
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    summary = lines[-1] if lines else {}
+    print(f"{args.rows} rows in {elapsed:.2f}s, budget {args.budget_s}s")
+    print(f"summary: {json.dumps(summary)}")
+    print(f"stub calls: {json.dumps(calls, sort_keys=True)}")
+    ok = response.status_code == 200 and summary.get("done") and not summary.get("failed") \
+        and elapsed <= args.budget_s
+    if not ok:
+        print("FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Query latency of the in-memory leave index with years of history.
+
+    python -m scripts.bench_leave_index [--employees 3000] [--years 5]
+                                        [--requests-per-year 8] [--team-size 10]
+                                        [--queries 5000] [--budget-ms 1] [--sql] [--memory]
+
+Builds a synthetic history (every employee takes a few 1-5 day leaves a
+year, one manager per `--team-size` people) through the same listener
+LeaveStore calls, then times LeaveIndex.check for 5-day requests. With
+--sql the history is also written to a temporary LeaveStore and the same
+questions are answered with its per-date queries, for comparison. Exits
+non-zero if p99 is over --budget-ms. --memory rebuilds the index under
+tracemalloc to report its size (slow).
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from app.leave_index import LeaveIndex
+from app.leave_store import LeaveStore, PENDING, APPROVED
+
+TEAM_ID = "T0"
+
+
+def build_history(employees, years, requests_per_year, team_size, seed=7):
+    rng = random.Random(seed)
+    first = date.today().replace(month=1, day=1) - timedelta(days=365 * (years - 1))
+    for n in range(employees):
+        user_id = f"U{n:05d}"
+        manager_id = f"UM{n // team_size:04d}"
+        for year in range(years):
+            for _ in range(requests_per_year):
+                start = first + timedelta(days=365 * year + rng.randrange(365))
+                days = [start + timedelta(days=d) for d in range(rng.randint(1, 5))]
+                status = APPROVED if rng.random() < 0.9 else PENDING
+                yield user_id, manager_id, days, status
+
+
+def build_index(history):
+    index = LeaveIndex(capacity_limit=3)
+    for i, (user_id, manager_id, days, status) in enumerate(history):
+        index.on_change(f"r{i}", status, (TEAM_ID, user_id, manager_id, [d.isoformat() for d in days]))
+    index.loaded = True
+    return index
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_queries(count, employees, team_size, seed=11):
+    rng = random.Random(seed)
+    today = date.today()
+    for _ in range(count):
+        n = rng.randrange(employees)
+        start = today + timedelta(days=rng.randrange(-365, 120))
+        yield (f"U{n:05d}", f"UM{n // team_size:04d}",
+               [(start + timedelta(days=d)).strftime("%d-%m-%Y") for d in range(5)])
+
+
+def sql_check(store, user_id, manager_id, leave_dates):
+    # The same question from SQLite: the user's days, then who is out on each date
+    mine = store.user_days(TEAM_ID, user_id, leave_dates[0], leave_dates[-1])
+    team = {day: store.who_is_out(TEAM_ID, day, (PENDING, APPROVED)) for day in leave_dates}
+    return mine, team
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query latency of the in-memory leave index.")
+    parser.add_argument("--employees", type=int, default=3000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--requests-per-year", type=int, default=8)
+    parser.add_argument("--team-size", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    parser.add_argument("--sql", action="store_true", help="also time the equivalent SQLite queries")
+    parser.add_argument("--memory", action="store_true", help="report the index size (slow)")
+    args = parser.parse_args()
+
+    history = list(build_history(args.employees, args.years, args.requests_per_year, args.team_size))
+    started = time.perf_counter()
+    index = build_index(history)
+    build_s = time.perf_counter() - started
+    leave_days = sum(len(days) for _, _, days, _ in history)
+    print(f"{len(history)} requests / {leave_days} leave days indexed in {build_s:.2f}s")
+    if args.memory:
+        tracemalloc.start()
+        measured = build_index(history)
+        print(f"index size: ~{tracemalloc.get_traced_memory()[0] / 1e6:.0f} MB ({len(measured.requests)} requests)")
+        tracemalloc.stop()
+
+    queries = list(make_queries(args.queries, args.employees, args.team_size))
+    timings = []
+    for user_id, manager_id, leave_dates in queries:
+        started = time.perf_counter()
+        index.check(TEAM_ID, user_id, manager_id, leave_dates)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000
+    print(f"index check (5 days): p50 {p50:.3f} ms, p99 {p99:.3f} ms, budget {args.budget_ms} ms")
+
+    if args.sql:
+        tmp = tempfile.mkdtemp()
+        store = LeaveStore(os.path.join(tmp, "leave.sqlite3"), batch_size=1000)
+        for user_id, manager_id, days, status in history:
+            leave_info = {"leave_dates": [d.strftime("%d-%m-%Y") for d in days]}
+            store.create_nowait(TEAM_ID, user_id, manager_id, leave_info, status=status)
+        store.flush()
+        sample = queries[:min(500, len(queries))]
+        sql_timings = []
+        for user_id, manager_id, leave_dates in sample:
+            started = time.perf_counter()
+            sql_check(store, user_id, manager_id, leave_dates)
+            sql_timings.append(time.perf_counter() - started)
+        print(f"sqlite per-date queries: p50 {percentile(sql_timings, 0.5) * 1000:.3f} ms, "
+              f"p99 {percentile(sql_timings, 0.99) * 1000:.3f} ms")
+        started = time.perf_counter()
+        fresh = LeaveIndex()
+        fresh.load(store)
+        print(f"index load from sqlite: {time.perf_counter() - started:.2f}s")
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if p99 > args.budget_ms:
+        print("FAIL")
+    sys.exit(0 if p99 <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
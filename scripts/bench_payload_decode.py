@@ -0,0 +1,104 @@
+"""
+Per-request CPU cost of decoding Slack payloads in /slack/events.
+
+    python -m scripts.bench_payload_decode [--iterations 5000]
+
+Replays the recorded payloads in scripts/fixtures/slack_payloads.jsonl
+through the previous decoding path (request.form() on every request, then
+request.json(), then json.loads on `payload` and the button value) and
+through app.slack_payload (one decode of the already-read body), with orjson
+and with the stdlib json fallback. Reports CPU microseconds per request.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from starlette.requests import Request
+
+from app import slack_payload
+from app.slack_payload import decode_slack_body, payload_type, loads
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "slack_payloads.jsonl")
+
+
+def load_fixtures():
+    with open(FIXTURES_PATH) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_request(body, content_type):
+    scope = {
+        "type": "http", "method": "POST", "path": "/slack/events", "query_string": b"",
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+async def decode_before(body, content_type):
+    request = make_request(body, content_type)
+    await request.body()  # read for the signature check
+    form = await request.form()
+    if "payload" in form:
+        payload = json.loads(form["payload"])
+        if payload.get("type") == "block_actions":
+            json.loads(payload["actions"][0]["value"])
+        return payload
+    return await request.json()
+
+
+async def decode_after(body, content_type):
+    request = make_request(body, content_type)
+    body = await request.body()
+    payload = decode_slack_body(body, request.headers.get("content-type"))
+    if payload_type(payload) == "block_actions":
+        loads(payload["actions"][0]["value"])
+    return payload
+
+
+async def cpu_per_request(decode, body, content_type, iterations):
+    for _ in range(min(100, iterations)):  # warm up
+        await decode(body, content_type)
+    started = time.process_time()
+    for _ in range(iterations):
+        await decode(body, content_type)
+    return (time.process_time() - started) / iterations * 1_000_000
+
+
+async def run(iterations):
+    orjson = slack_payload.orjson
+    print(f"CPU us per request over {iterations} iterations (orjson {'available' if orjson else 'missing'})")
+    print(f"{'payload':<20} {'bytes':>7} {'before':>9} {'after':>9} {'json only':>10} {'speedup':>8}")
+    for fixture in load_fixtures():
+        body = fixture["body"].encode()
+        content_type = fixture["content_type"]
+        before = await cpu_per_request(decode_before, body, content_type, iterations)
+        after = await cpu_per_request(decode_after, body, content_type, iterations)
+        slack_payload.orjson = None
+        try:
+            fallback = await cpu_per_request(decode_after, body, content_type, iterations)
+        finally:
+            slack_payload.orjson = orjson
+        print(f"{fixture['name']:<20} {len(body):>7} {before:>9.1f} {after:>9.1f} {fallback:>10.1f} "
+              f"{before / after:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request CPU cost of decoding Slack payloads.")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
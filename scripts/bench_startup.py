@@ -0,0 +1,102 @@
+"""
+Measure how long `import app.main` takes and fail if it exceeds a budget.
+
+    python -m scripts.bench_startup [--budget-ms 900] [--runs 3] [--top 15]
+
+Runs the import in fresh interpreters with `-X importtime`, reports the
+median total and the heaviest top-level packages (self time summed per
+package), and exits non-zero if the median is over --budget-ms. Modules in
+--forbid must not be imported at startup at all (they are loaded lazily).
+Placeholder values are used for required settings that aren't set, and the
+SQLite files go to a temporary directory.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLACEHOLDER_ENV = {
+    "SLACK_BOT_TOKEN": "xoxb-bench",
+    "SLACK_SIGNING_SECRET": "bench",
+    "OPENAI_API_KEY": "sk-bench",
+    "EMPLOYEE_GCAL_EMAIL": "bench@example.com",
+}
+DEFAULT_FORBID = "openai,googleapiclient,google.oauth2,aiohttp,slack_sdk"
+
+
+def run_import(env):
+    """
+    One cold import; returns [(self_us, cumulative_us, depth, module)].
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(f"import app.main failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long `import app.main` takes.")
+    parser.add_argument("--budget-ms", type=float, default=900.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--forbid", default=DEFAULT_FORBID,
+                        help="comma-separated modules that must not load at import time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**PLACEHOLDER_ENV, **os.environ}
+        env.update({
+            "LEAVE_DB_PATH": os.path.join(tmp, "leave.sqlite3"),
+            "DEDUP_SQLITE_PATH": os.path.join(tmp, "dedup.sqlite3"),
+            "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+            "TENANT_DB_PATH": os.path.join(tmp, "tenants.sqlite3"),
+            "LLM_CACHE_SQLITE_PATH": "",
+        })
+        runs = [run_import(env) for _ in range(args.runs)]
+
+    # Only what `import app.main` pulls in, not the interpreter's own startup
+    totals = [
+        sum(row[1] for row in rows if row[2] == 0 and row[3].split(".")[0] == "app") / 1000
+        for rows in runs
+    ]
+    median = statistics.median(totals)
+
+    # Self time per top-level package, from the median run
+    rows = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    per_package = defaultdict(int)
+    for self_us, _, _, name in rows:
+        per_package[name.split(".")[0]] += self_us
+    print(f"import app.main: median {median:.0f} ms over {args.runs} runs "
+          f"({', '.join(f'{t:.0f}' for t in totals)} ms), budget {args.budget_ms:.0f} ms")
+    print(f"{'package':<28} {'self ms':>8}")
+    for package, self_us in sorted(per_package.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{package:<28} {self_us / 1000:>8.1f}")
+
+    ok = median <= args.budget_ms
+    if not ok:
+        print(f"FAIL: {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    loaded = {name for _, _, _, name in rows}
+    for module in filter(None, args.forbid.split(",")):
+        eager = sorted(name for name in loaded if name == module or name.startswith(module + "."))
+        if eager:
+            print(f"FAIL: {module} is imported at startup ({len(eager)} modules)")
+            ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
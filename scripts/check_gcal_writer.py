@@ -0,0 +1,157 @@
+"""
+Check CalendarWriter against a local stub of the Google Calendar batch API.
+
+    python -m scripts.check_gcal_writer [--requests 120]
+
+The stub serves POST /batch/calendar/v3 on a random local port: it unpacks
+each multipart part, records the events.insert it carries and answers 200,
+or 409 when that calendar already has an event with the same id (what
+Google does for a reused event id). The writer is built with the real
+google-api-python-client discovery document, pointed at the stub, and
+checked for:
+
+- consecutive days merged into one all-day event, gaps split;
+- inserts batched at most 50 per HTTP request;
+- a second write of the same leave reported as "exists", with no new events;
+- the same leave written to two calendars in one batch.
+
+Exits non-zero if any check fails.
+"""
+import argparse
+import email
+import json
+import sys
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from app.gcal import BATCH_LIMIT, CalendarWriter
+
+BOUNDARY = "stub_batch_boundary"
+
+
+class FakeCalendar:
+    """
+    Events by (calendar_id, event_id), and the size of every batch request.
+    """
+    def __init__(self):
+        self.events = {}
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def insert(self, method, path, body):
+        # /calendar/v3/calendars/<calendarId>/events
+        parts = path.split("?")[0].split("/")
+        if method != "POST" or parts[-1] != "events":
+            return 400, {"error": {"code": 400, "message": f"unexpected {method} {path}"}}
+        calendar_id = unquote(parts[-2])
+        key = (calendar_id, body["id"])
+        with self.lock:
+            if key in self.events:
+                return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+            self.events[key] = body
+        return 200, {**body, "status": "confirmed"}
+
+    def handle_batch(self, content_type, raw):
+        message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + raw)
+        responses = []
+        for part in message.get_payload():
+            head, _, payload = part.get_payload().partition("\r\n\r\n")
+            if not payload:
+                head, _, payload = head.partition("\n\n")
+            method, path, _ = head.splitlines()[0].split(" ", 2)
+            status, result = self.insert(method, path, json.loads(payload or "{}"))
+            # Unfold the header; the client parses "<base + id>" back out of it
+            content_id = " ".join(part["Content-ID"].split()).replace("<", "<response-", 1)
+            responses.append(
+                f"--{BOUNDARY}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(result)}\r\n"
+            )
+        with self.lock:
+            self.batches.append(len(responses))
+        return "".join(responses) + f"--{BOUNDARY}--\r\n"
+
+
+def serve(calendar):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = calendar.handle_batch(self.headers["Content-Type"], raw).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/mixed; boundary={BOUNDARY}")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_writer(port):
+    import httplib2
+    from googleapiclient.discovery import build
+
+    base = f"http://127.0.0.1:{port}/"
+    service = build("calendar", "v3", http=httplib2.Http(), static_discovery=True,
+                    cache_discovery=False, client_options={"api_endpoint": base})
+    return CalendarWriter(service=service, batch_uri=f"{base}batch/calendar/v3")
+
+
+def days(start, count):
+    return [(start + timedelta(days=n)).strftime("%d-%m-%Y") for n in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check CalendarWriter against a local Calendar API stub.")
+    parser.add_argument("--requests", type=int, default=120, help="leave requests in the batching check")
+    args = parser.parse_args()
+
+    calendar = FakeCalendar()
+    server = serve(calendar)
+    writer = build_writer(server.server_address[1])
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}{f': {detail}' if detail else ''}")
+        if not ok:
+            failures.append(name)
+
+    # 25-27 June merge into one event, 30 June is its own
+    leave = {"leave_dates": ["26-06-2025", "25-06-2025", "27-06-2025", "30-06-2025"], "leave_reason": "trip"}
+    results = writer.write_leave("req-merge", leave, "alice@example.com")
+    events = sorted((e["start"]["date"], e["end"]["date"]) for e in calendar.events.values())
+    check("merges consecutive days", events == [("2025-06-25", "2025-06-28"), ("2025-06-30", "2025-07-01")], events)
+    check("one batch for one request", calendar.batches == [2], calendar.batches)
+    check("inserts reported created", sorted(results.values()) == ["created", "created"], results)
+
+    again = writer.write_leave("req-merge", leave, "alice@example.com")
+    check("rewrite is idempotent (409 -> exists)", sorted(again.values()) == ["exists", "exists"], again)
+    check("rewrite adds no events", len(calendar.events) == 2, len(calendar.events))
+
+    # Same leave to two calendars in one batch: event ids repeat, part ids must not
+    shared = {"leave_dates": ["01-07-2025"]}
+    both = writer.write_leaves([("req-shared", shared, "alice@example.com"), ("req-shared", shared, "team@example.com")])
+    check("same leave on two calendars", sorted(both.values()) == ["created", "created"], both)
+
+    calendar.batches.clear()
+    start = date(2025, 8, 1)
+    items = [(f"req-{n}", {"leave_dates": days(start + timedelta(days=n * 3), 2)}, "bob@example.com")
+             for n in range(args.requests)]
+    results = writer.write_leaves(items)
+    expected = [min(BATCH_LIMIT, args.requests - offset) for offset in range(0, args.requests, BATCH_LIMIT)]
+    check(f"{args.requests} events in batches of at most {BATCH_LIMIT}", calendar.batches == expected, calendar.batches)
+    check("every batched insert created", list(results.values()).count("created") == args.requests,
+          f"{len(results)} results")
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Local stand-ins for the Slack Web API and the OpenAI chat completions API.
+
+    python -m scripts.fake_services [--port 8700] [--slack-latency-ms 30]
+                                    [--openai-latency-ms 400] [--slack-429-rate 0]
+                                    [--openai-429-rate 0]
+
+Point the app at them with SLACK_API_URL=http://127.0.0.1:8700/api/ and
+OPENAI_BASE_URL=http://127.0.0.1:8700/v1. Every call waits a random latency
+around the configured mean, and a share of calls can be answered with 429 +
+Retry-After. The fake LLM answers leave requests written as
+"ref-<n> <leave type> leave on DD-MM-YYYY <@MANAGER>". The ref is echoed back
+as the leave reason, so the manager DM it ends up in can be matched to the
+request that caused it (see scripts/loadtest.py).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+REF_RE = re.compile(r"\bref-\d+\b")
+DAY_RE = re.compile(r"\b\d{2}-\d{2}-\d{4}\b")
+MENTION_RE = re.compile(r"<@[A-Z0-9]+>")
+LEAVE_TYPES = ("sick", "vacation", "personal")
+
+
+class Faults:
+    """
+    Latency (mean +- jitter share, in seconds) and 429 injection for one API.
+    """
+    def __init__(self, latency=0.0, jitter=0.5, error_429_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_429_rate = error_429_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+
+    def delay(self):
+        spread = self.latency * self.jitter
+        return max(0.0, self.latency + self.rng.uniform(-spread, spread))
+
+    def throttle(self):
+        return self.rng.random() < self.error_429_rate
+
+
+class FakeSlack:
+    """
+    Slack Web API under /api/<method>. users.list / users.info know the
+    `users` given (id -> tz); every other method just answers ok. Manager
+    DMs that carry a ref are timestamped in `delivered` (ref -> monotonic).
+    """
+    def __init__(self, faults, users=None):
+        self.faults = faults
+        self.users = users or {}
+        self.calls = {}
+        self.throttled = 0
+        self.delivered = {}
+
+    def user(self, user_id):
+        return {"id": user_id, "name": user_id.lower(), "real_name": user_id,
+                "tz": self.users.get(user_id, "UTC"), "profile": {"display_name": user_id.lower()}}
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        body = await request.read()
+        if request.content_type == "application/json":
+            args = json.loads(body or b"{}")
+        else:
+            args = dict(parse_qsl(body.decode()))
+        args.update(request.query)
+        await asyncio.sleep(self.faults.delay())
+        if self.faults.throttle():
+            self.throttled += 1
+            return web.json_response({"ok": False, "error": "ratelimited"}, status=429,
+                                     headers={"Retry-After": str(self.faults.retry_after)})
+
+        if method == "users.info":
+            return web.json_response({"ok": True, "user": self.user(args.get("user", ""))})
+        if method == "users.list":
+            members = [self.user(user_id) for user_id in self.users]
+            return web.json_response({"ok": True, "members": members, "response_metadata": {"next_cursor": ""}})
+        if method == "chat.postMessage":
+            blocks = args.get("blocks") or "[]"
+            ref = REF_RE.search(blocks if isinstance(blocks, str) else json.dumps(blocks))
+            if ref:
+                self.delivered.setdefault(ref.group(0), time.monotonic())
+            return web.json_response({"ok": True, "channel": args.get("channel"), "ts": f"{time.time():.6f}"})
+        return web.json_response({"ok": True})
+
+    def snapshot(self):
+        return {"calls": dict(sorted(self.calls.items())), "throttled": self.throttled}
+
+
+def leave_answer(prompt):
+    """
+    The JSON a well-behaved LLM would return for a load-test message.
+    """
+    ref = REF_RE.search(prompt)
+    mentions = MENTION_RE.findall(prompt)  # the last one; app mentions start with the bot's
+    leave_type = next((t for t in LEAVE_TYPES if t in prompt), None)
+    return json.dumps({
+        "leave_type": leave_type,
+        "leave_dates": DAY_RE.findall(prompt),
+        "leave_reason": ref.group(0) if ref else None,
+        "manager_mention": mentions[-1] if mentions else None,
+    })
+
+
+class FakeOpenAI:
+    """
+    POST /v1/chat/completions, plain or streamed (stream=true, as the
+    structured LLM mode uses). Streams split the answer into a few chunks
+    spread over the latency.
+    """
+    def __init__(self, faults, chunks=4):
+        self.faults = faults
+        self.chunks = chunks
+        self.calls = 0
+        self.throttled = 0
+
+    async def handle(self, request):
+        self.calls += 1
+        args = await request.json()
+        prompt = args["messages"][-1]["content"]
+        delay = self.faults.delay()
+        if self.faults.throttle():
+            self.throttled += 1
+            await asyncio.sleep(delay / 4)
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"Retry-After": str(self.faults.retry_after)},
+            )
+        content = leave_answer(prompt)
+        base = {"id": f"chatcmpl-{self.calls}", "created": int(time.time()), "model": args.get("model", "fake")}
+        if not args.get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response({
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        step = -(-len(content) // self.chunks)
+        for i in range(0, len(content), step):
+            await asyncio.sleep(delay / self.chunks)
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def snapshot(self):
+        return {"calls": self.calls, "throttled": self.throttled}
+
+
+def make_app(slack, openai):
+    app = web.Application()
+    app.router.add_post("/api/{method}", slack.handle)
+    app.router.add_get("/api/{method}", slack.handle)
+    app.router.add_post("/v1/chat/completions", openai.handle)
+    return app
+
+
+async def start(slack, openai, host="127.0.0.1", port=8700):
+    """
+    Serve both fakes on one port; returns the runner (await runner.cleanup()).
+    """
+    runner = web.AppRunner(make_app(slack, openai), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def add_fault_arguments(parser):
+    parser.add_argument("--slack-latency-ms", type=float, default=30)
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency spread as a share of the mean")
+    parser.add_argument("--slack-429-rate", type=float, default=0.0)
+    parser.add_argument("--openai-429-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+
+
+def fakes_from_args(args, users=None):
+    slack = FakeSlack(Faults(args.slack_latency_ms / 1000, args.jitter, args.slack_429_rate, args.retry_after), users)
+    openai = FakeOpenAI(Faults(args.openai_latency_ms / 1000, args.jitter, args.openai_429_rate, args.retry_after))
+    return slack, openai
+
+
+async def serve(args):
+    slack, openai = fakes_from_args(args)
+    runner = await start(slack, openai, args.host, args.port)
+    print(f"Fake Slack on http://{args.host}:{args.port}/api/, fake OpenAI on http://{args.host}:{args.port}/v1")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Slack Web API and OpenAI servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    add_fault_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
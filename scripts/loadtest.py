@@ -0,0 +1,391 @@
+"""
+Load test the app against local fake Slack and OpenAI servers.
+
+    python -m scripts.loadtest [--rate 5] [--duration 60] [--slash-share 0.3]
+                               [--users 50] [--managers 25]
+                               [--slack-latency-ms 30] [--openai-latency-ms 400]
+                               [--slack-429-rate 0] [--openai-429-rate 0]
+                               [--output loadtest.json] [--baseline previous.json]
+
+Starts scripts.fake_services in this process and the app under uvicorn in a
+subprocess pointed at them (SLACK_API_URL / OPENAI_BASE_URL, data in a
+temporary directory). It then sends correctly signed /slack/events
+app_mention and /slack/slash traffic at a fixed rate (open loop: requests go
+out on schedule however slow the app is). It reports:
+
+- throughput and status codes;
+- ack latency: the HTTP response Slack waits for;
+- end-to-end latency: from the request to the manager DM reaching fake Slack;
+- event-loop lag, as measured inside the app;
+- the app's RSS, dedup and leave index sizes, sampled over the run. Steady
+  growth in a long run points at unbounded state.
+
+Requests sent during the first --warmup seconds (cold imports, empty caches)
+are left out of the latency figures and the memory trend.
+
+The report is written as JSON. With --baseline the run is compared with an
+earlier report and the exit code is non-zero if throughput, p99 latency or
+memory growth regress by more than --tolerance. Note that the app's own
+Slack rate limiting (about one chat.postMessage per second per channel)
+bounds end-to-end throughput to roughly --managers requests per second.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+import aiohttp
+
+from scripts.fake_services import add_fault_arguments, fakes_from_args, start
+
+SIGNING_SECRET = "loadtest-signing-secret"
+LEAVE_TYPES = ("sick", "vacation", "personal")
+
+
+def sign(body, timestamp=None):
+    timestamp = str(int(timestamp or time.time()))
+    digest = hmac.new(SIGNING_SECRET.encode(), f"v0:{timestamp}:".encode() + body, hashlib.sha256).hexdigest()
+    return {"X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": f"v0={digest}"}
+
+
+def leave_text(seq, users, managers):
+    """
+    Request `seq`: every (user, day) pair is new, so none is a duplicate.
+    """
+    user_id = f"U{seq % users:05d}"
+    day = (date(2030, 1, 1) + timedelta(days=seq // users)).strftime("%d-%m-%Y")
+    manager = f"UM{seq % managers:04d}"
+    ref = f"ref-{seq}"
+    return user_id, ref, f"{ref} {LEAVE_TYPES[seq % 3]} leave on {day} <@{manager}>"
+
+
+def build_request(seq, kind, users, managers):
+    user_id, ref, text = leave_text(seq, users, managers)
+    if kind == "slash":
+        body = urlencode({
+            "command": "/leave", "user_id": user_id, "text": text,
+            "trigger_id": f"trigger-{seq}", "team_id": "TLOAD",
+        }).encode()
+        return ref, "/slack/slash", body, "application/x-www-form-urlencoded"
+    body = json.dumps({
+        "type": "event_callback", "team_id": "TLOAD", "event_id": f"EvLoad{seq}",
+        "event": {"type": "app_mention", "user": user_id, "text": f"<@UBOT> {text}",
+                  "ts": f"{time.time():.6f}", "channel": "CLOAD"},
+    }).encode()
+    return ref, "/slack/events", body, "application/json"
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def start_app(args, fake_port, tmp):
+    env = {
+        **os.environ,
+        "SLACK_BOT_TOKEN": "xoxb-loadtest", "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+        "OPENAI_API_KEY": "sk-loadtest", "EMPLOYEE_GCAL_EMAIL": "loadtest@example.com",
+        "SLACK_API_URL": f"http://127.0.0.1:{fake_port}/api/",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "LEAVE_DB_PATH": os.path.join(tmp, "leave.sqlite3"),
+        "DEDUP_SQLITE_PATH": os.path.join(tmp, "dedup.sqlite3"),
+        "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+        "TRACE_SLOW_MS": "0",
+        "EVENT_LOOP_LAG_INTERVAL_MS": "100",
+    }
+    if not args.fast_parse:
+        env["FAST_PARSE_MIN_CONFIDENCE"] = "2"  # every message goes to the (fake) LLM
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(args.app_port), "--log-level", "warning"],
+        env=env, stdout=None if args.app_logs else subprocess.DEVNULL,
+        stderr=None if args.app_logs else subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(session, base, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app exited with code {proc.returncode}")
+        try:
+            async with session.get(f"{base}/slack/pipeline") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("app did not start in time")
+
+
+class Run:
+    def __init__(self, args, slack):
+        self.args = args
+        self.slack = slack
+        self.started = time.monotonic()
+        self.sent_at = {}  # ref -> monotonic send time
+        self.ack = {"events": [], "slash": []}  # (sent at, latency)
+        self.statuses = {}
+        self.client_errors = 0
+        self.skipped = 0
+        self.inflight = 0
+        self.timeline = []
+
+    async def send(self, session, base, seq, kind):
+        ref, path, body, content_type = build_request(seq, kind, self.args.users, self.args.managers)
+        headers = {**sign(body), "Content-Type": content_type}
+        self.inflight += 1
+        started = time.monotonic()
+        self.sent_at[ref] = started
+        try:
+            async with session.post(base + path, data=body, headers=headers) as response:
+                await response.read()
+                self.ack[kind].append((started, time.monotonic() - started))
+                self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+                if response.status != 200:
+                    self.sent_at.pop(ref, None)  # Slack would retry it; nothing will arrive
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.client_errors += 1
+            self.sent_at.pop(ref, None)
+        finally:
+            self.inflight -= 1
+
+    async def generate(self, session, base):
+        args = self.args
+        interval = 1.0 / args.rate
+        total = int(args.rate * args.duration)
+        slash_every = round(1 / args.slash_share) if args.slash_share else 0
+        tasks = set()
+        started = self.started = time.monotonic()
+        for seq in range(total):
+            delay = started + seq * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.inflight >= args.max_inflight:
+                self.skipped += 1  # the app is not keeping up; don't let the generator fall over too
+                continue
+            kind = "slash" if slash_every and seq % slash_every == 0 else "events"
+            task = asyncio.create_task(self.send(session, base, seq, kind))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        return time.monotonic() - started
+
+    async def sample(self, session, base, pid):
+        while True:
+            try:
+                async with session.get(f"{base}/slack/pipeline") as response:
+                    pipeline = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pipeline = {}
+            self.timeline.append({
+                "t_s": round(time.monotonic() - self.started, 1),
+                "rss_mb": rss_mb(pid),
+                "sent": sum(len(v) for v in self.ack.values()),
+                "delivered": len(self.slack.delivered),
+                "queue_depth": pipeline.get("queue_depth"),
+                "dedup_entries": pipeline.get("dedup_entries"),
+                "leave_index_requests": (pipeline.get("leave_index") or {}).get("requests"),
+            })
+            await asyncio.sleep(self.args.sample_interval)
+
+    async def drain(self):
+        deadline = time.monotonic() + self.args.drain
+        while time.monotonic() < deadline and any(ref not in self.slack.delivered for ref in self.sent_at):
+            await asyncio.sleep(0.2)
+
+    def ack_latency(self):
+        warm = self.started + self.args.warmup
+        return {kind: summarize([latency for sent, latency in samples if sent >= warm])
+                for kind, samples in self.ack.items()}
+
+    def end_to_end(self):
+        warm = self.started + self.args.warmup
+        latencies = [self.slack.delivered[ref] - sent for ref, sent in self.sent_at.items()
+                     if ref in self.slack.delivered and sent >= warm]
+        undelivered = sum(1 for ref in self.sent_at if ref not in self.slack.delivered)
+        return {**summarize(latencies), "undelivered": undelivered}
+
+
+def memory_growth(timeline, warmup):
+    points = [(s["t_s"], s["rss_mb"]) for s in timeline if s["rss_mb"] is not None and s["t_s"] >= warmup]
+    if len(points) < 2:
+        return {"start_mb": None, "end_mb": None, "growth_mb": None, "growth_mb_per_min": None}
+    # Least-squares slope, so one GC pause or arena release doesn't decide it
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_m = sum(m for _, m in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points) or 1.0
+    slope = sum((t - mean_t) * (m - mean_m) for t, m in points) / var
+    return {
+        "start_mb": round(points[0][1], 1),
+        "end_mb": round(points[-1][1], 1),
+        "growth_mb": round(points[-1][1] - points[0][1], 1),
+        "growth_mb_per_min": round(slope * 60, 3),
+    }
+
+
+async def run(args):
+    users = {f"U{i:05d}": "UTC" for i in range(args.users)}
+    users.update({f"UM{i:04d}": "UTC" for i in range(args.managers)})
+    slack, openai = fakes_from_args(args, users)
+    fakes = await start(slack, openai, port=args.fake_port)
+    tmp = tempfile.mkdtemp()
+    proc = start_app(args, args.fake_port, tmp)
+    base = f"http://127.0.0.1:{args.app_port}"
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    connector = aiohttp.TCPConnector(limit=args.max_inflight)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await wait_ready(session, base, proc)
+            load = Run(args, slack)
+            sampler = asyncio.create_task(load.sample(session, base, proc.pid))
+            elapsed = await load.generate(session, base)
+            await load.drain()
+            sampler.cancel()
+            async with session.get(f"{base}/slack/pipeline") as response:
+                pipeline = await response.json()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        await fakes.cleanup()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    sent = sum(len(v) for v in load.ack.values())
+    ok = load.statuses.get(200, 0)
+    end_to_end = load.end_to_end()
+    return {
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+        "requests": {
+            "scheduled": int(args.rate * args.duration),
+            "sent": sent,
+            "skipped_max_inflight": load.skipped,
+            "client_errors": load.client_errors,
+            "status_codes": {str(code): n for code, n in sorted(load.statuses.items())},
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+            "delivered_rps": round(len(slack.delivered) / elapsed, 2) if elapsed else 0.0,
+        },
+        "ack_latency": load.ack_latency(),
+        "end_to_end_latency": end_to_end,
+        "event_loop_lag": (pipeline.get("latency") or {}).get("runtime:event_loop_lag"),
+        "memory": memory_growth(load.timeline, args.warmup),
+        "timeline": load.timeline,
+        "fakes": {"slack": slack.snapshot(), "openai": openai.snapshot()},
+        "app": {key: pipeline.get(key) for key in ("dedup_entries", "leave_index", "slack_api", "stages", "rejected")},
+    }
+
+
+# (path in the report, higher is better)
+COMPARED = (
+    (("requests", "throughput_rps"), True),
+    (("ack_latency", "events", "p99_ms"), False),
+    (("ack_latency", "slash", "p99_ms"), False),
+    (("end_to_end_latency", "p99_ms"), False),
+    (("memory", "growth_mb_per_min"), False),
+)
+
+
+def lookup(report, path):
+    for key in path:
+        report = (report or {}).get(key)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Regressions of `report` against `baseline` beyond `tolerance` (a share).
+    """
+    regressions = []
+    for path, higher_is_better in COMPARED:
+        now, before = lookup(report, path), lookup(baseline, path)
+        if now is None or before is None:
+            continue
+        if path[-1] == "growth_mb_per_min":
+            worse = now > max(before, 0) * (1 + tolerance) + 1.0  # 1 MB/min of noise
+        elif higher_is_better:
+            worse = now < before * (1 - tolerance)
+        else:
+            worse = now > before * (1 + tolerance) + 1.0  # 1 ms of noise
+        if worse:
+            regressions.append(f"{'.'.join(path)}: {before} -> {now}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app against fake Slack and OpenAI servers.")
+    parser.add_argument("--rate", type=float, default=5.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of traffic")
+    parser.add_argument("--slash-share", type=float, default=0.3, help="share of requests sent as /leave")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--managers", type=int, default=25)
+    parser.add_argument("--fast-parse", action="store_true", help="let the rule-based parser skip the LLM")
+    add_fault_arguments(parser)
+    parser.add_argument("--max-inflight", type=int, default=500)
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--drain", type=float, default=30.0, help="seconds to wait for DMs after the last request")
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds left out of latency and memory figures")
+    parser.add_argument("--sample-interval", type=float, default=2.0)
+    parser.add_argument("--app-port", type=int, default=8711)
+    parser.add_argument("--fake-port", type=int, default=8710)
+    parser.add_argument("--app-logs", action="store_true", help="show the app's output")
+    parser.add_argument("--output", default="loadtest.json")
+    parser.add_argument("--baseline", help="earlier report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    requests, e2e = report["requests"], report["end_to_end_latency"]
+    print(f"{requests['sent']} requests in {requests['elapsed_s']}s: {requests['throughput_rps']} rps acked, "
+          f"{requests['delivered_rps']} rps delivered, status {requests['status_codes']}")
+    for kind, stats in report["ack_latency"].items():
+        print(f"ack {kind}: {json.dumps(stats)}")
+    print(f"end to end: {json.dumps(e2e)}")
+    print(f"event loop lag: {json.dumps(report['event_loop_lag'])}")
+    print(f"memory: {json.dumps(report['memory'])}")
+    print(f"report written to {args.output}")
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
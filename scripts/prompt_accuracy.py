@@ -0,0 +1,196 @@
+"""
+Offline accuracy check for the leave extractor.
+
+    python -m scripts.prompt_accuracy [--variant full|compact|all] [--record]
+
+Runs every message in scripts/fixtures/leave_corpus.jsonl through the local
+fast-path parser and through a stubbed LLM that replays completions recorded
+per prompt variant in scripts/fixtures/llm_recordings.json. `--record` calls
+the real OpenAI API (needs OPENAI_API_KEY) to (re)record a variant, so a new or
+shortened prompt can be measured once and then checked offline.
+
+Recordings are keyed by a hash of the exact messages sent (rendered system
+prompt plus user message), so editing a prompt or a corpus case leaves its
+recordings stale rather than silently reusing answers to the old prompt.
+
+Exits non-zero if the fast path gets any case wrong, if a corpus case has no
+recording (or only a stale one) for a checked variant, or if a variant scores
+below --min-accuracy. The "_meta" entry in the recordings file says which
+model each variant was recorded with, and when.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytz
+
+from app.fast_parser import fast_parse_leave_request
+from app.prompt_helper import PROMPT_VARIANTS, render_system_prompt
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+CORPUS_PATH = os.path.join(FIXTURES, "leave_corpus.jsonl")
+RECORDINGS_PATH = os.path.join(FIXTURES, "llm_recordings.json")
+SCORED_FIELDS = ("leave_type", "leave_dates", "manager_mention")
+
+
+def messages_key(messages):
+    """
+    Recording key: sha256 of the messages exactly as they would be sent.
+    """
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class ReplayLLM:
+    """
+    Stand-in for openai_client: chat.completions.create() returns the
+    completion recorded for exactly these messages, or None if there is none.
+    """
+    def __init__(self, recordings):
+        self.recordings = recordings
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model, messages, **kwargs):
+        recording = self.recordings.get(messages_key(messages))
+        if recording is None:
+            return None
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=recording["completion"]))])
+
+    def is_stale(self, message):
+        """
+        True if `message` was recorded, but under a different prompt.
+        """
+        return any(recording["message"] == message for recording in self.recordings.values())
+
+
+def load_corpus():
+    with open(CORPUS_PATH) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_recordings():
+    if not os.path.exists(RECORDINGS_PATH):
+        return {}
+    with open(RECORDINGS_PATH) as f:
+        return json.load(f)
+
+
+def local_now(case):
+    return pytz.timezone(case["tz"]).localize(datetime.fromisoformat(case["now"]))
+
+
+def build_messages(variant, case):
+    now = local_now(case)
+    return [
+        {"role": "system", "content": render_system_prompt(variant, now.strftime("%d-%m-%Y"), now.strftime("%A"))},
+        {"role": "user", "content": case["message"]},
+    ]
+
+
+def wrong_fields(result, expected):
+    wrong = []
+    for field in SCORED_FIELDS:
+        got = result.get(field)
+        want = expected.get(field)
+        if field == "leave_dates":
+            got, want = sorted(got or []), sorted(want or [])
+        elif field == "leave_type":
+            got, want = (got or "").lower(), (want or "").lower()
+        if got != want:
+            wrong.append(f"{field}: got {got!r}, want {want!r}")
+    return wrong
+
+
+def check_fast_path(corpus, min_confidence):
+    handled = failures = 0
+    for case in corpus:
+        leave_info, confidence = fast_parse_leave_request(case["message"], case["tz"], now=local_now(case))
+        if leave_info is None or confidence < min_confidence:
+            continue
+        handled += 1
+        wrong = wrong_fields(leave_info, case["expected"])
+        if wrong:
+            failures += 1
+            print(f"  FAST WRONG {case['message']!r}: {'; '.join(wrong)}")
+    print(f"fast path: handled {handled}/{len(corpus)}, wrong {failures}")
+    return failures == 0
+
+
+def check_variant(variant, corpus, recordings, min_accuracy):
+    llm = ReplayLLM(recordings.get(variant, {}))
+    scored = correct = missing = 0
+    for case in corpus:
+        response = llm.chat.completions.create(model="stub", messages=build_messages(variant, case))
+        if response is None:
+            missing += 1
+            state = "STALE" if llm.is_stale(case["message"]) else "UNRECORDED"
+            print(f"  {variant} {state} {case['message']!r}")
+            continue
+        scored += 1
+        try:
+            result = json.loads(response.choices[0].message.content)
+        except ValueError:
+            result = {}
+        wrong = wrong_fields(result, case["expected"])
+        if wrong:
+            print(f"  {variant} WRONG {case['message']!r}: {'; '.join(wrong)}")
+        else:
+            correct += 1
+    source = recordings.get("_meta", {}).get(variant, {}).get("source", "none")
+    accuracy = correct / scored if scored else 0.0
+    print(f"{variant}: {correct}/{scored} correct ({accuracy:.0%}), {missing} unrecorded or stale (source: {source})")
+    if missing:
+        print(f"{variant}: missing or stale recordings, run with --record --variant {variant}")
+        return False
+    return accuracy >= min_accuracy
+
+
+def record_variant(variant, corpus, recordings, model):
+    import openai
+    client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    # Start over: recordings of an older prompt would never match again
+    recorded = recordings[variant] = {}
+    for case in corpus:
+        messages = build_messages(variant, case)
+        response = client.chat.completions.create(model=model, messages=messages, max_tokens=512, temperature=0.0)
+        recorded[messages_key(messages)] = {
+            "message": case["message"],
+            "completion": response.choices[0].message.content,
+        }
+    recordings.setdefault("_meta", {})[variant] = {
+        "source": f"openai:{model}",
+        "recorded_at": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+    }
+    with open(RECORDINGS_PATH, "w") as f:
+        json.dump(recordings, f, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"Recorded {len(corpus)} completions for {variant} with {model}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline accuracy check for the leave extractor.")
+    parser.add_argument("--variant", default="all", choices=["all", *PROMPT_VARIANTS])
+    parser.add_argument("--min-accuracy", type=float, default=0.9)
+    parser.add_argument("--fast-min-confidence", type=float, default=0.9)
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--model", default="gpt-4")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    recordings = load_recordings()
+    variants = list(PROMPT_VARIANTS) if args.variant == "all" else [args.variant]
+
+    if args.record:
+        for variant in variants:
+            record_variant(variant, corpus, recordings, args.model)
+
+    ok = check_fast_path(corpus, args.fast_min_confidence)
+    for variant in variants:
+        ok = check_variant(variant, corpus, recordings, args.min_accuracy) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Report the size of each system prompt variant.
+
+    python -m scripts.prompt_tokens [--model gpt-4]
+
+Uses tiktoken when it is installed, otherwise estimates ~4 characters per
+token. Pick a variant for the app with LLM_PROMPT_VARIANT.
+"""
+import argparse
+
+from app.prompt_helper import PROMPT_VARIANTS, DATE_LINE, render_system_prompt
+
+
+def get_token_counter(model):
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model)
+        return (lambda text: len(encoding.encode(text))), "tiktoken"
+    except Exception:
+        return (lambda text: (len(text) + 3) // 4), "estimate"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="gpt-4")
+    args = parser.parse_args()
+
+    count, method = get_token_counter(args.model)
+    date_line = DATE_LINE.format(today="07-06-2025", day_of_week="Saturday")
+    print(f"Token counts for {args.model} ({method}):")
+    print(f"{'variant':<10} {'static prefix':>14} {'date line':>10} {'total':>7} {'chars':>7}")
+    for variant, prefix in PROMPT_VARIANTS.items():
+        prompt = render_system_prompt(variant, "07-06-2025", "Saturday")
+        print(f"{variant:<10} {count(prefix):>14} {count(date_line):>10} {count(prompt):>7} {len(prompt):>7}")
+
+
+if __name__ == "__main__":
+    main()
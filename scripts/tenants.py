@@ -0,0 +1,67 @@
+"""
+Manage the workspaces a multi-tenant deployment (MULTI_TENANT=true) serves.
+
+    python -m scripts.tenants list
+    python -m scripts.tenants add T0123ABC [--name Acme] [--gcal-email ooo@acme.com] [--check]
+    python -m scripts.tenants remove T0123ABC
+
+`add` takes the workspace's bot token (xoxb-...) from TENANT_BOT_TOKEN or
+prompts for it, so it doesn't end up in shell history; --check asks Slack
+(auth.test) that the token belongs to that team first. A new workspace is
+served from its next request; running apps pick up a changed token or a
+removal within TENANT_REFRESH_SECONDS.
+"""
+import argparse
+import getpass
+import os
+import sys
+from datetime import datetime
+
+from app.config import settings
+from app.tenants import TenantStore
+
+
+def check_token(team_id, token):
+    from slack_sdk import WebClient
+    kwargs = {"base_url": settings.SLACK_API_URL} if settings.SLACK_API_URL else {}
+    response = WebClient(token=token, **kwargs).auth_test()
+    if response.get("team_id") != team_id:
+        sys.exit(f"Token belongs to team {response.get('team_id')}, not {team_id}")
+    return response.get("team")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=settings.TENANT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    add = commands.add_parser("add")
+    add.add_argument("team_id")
+    add.add_argument("--name")
+    add.add_argument("--gcal-email", help="Google Calendar OOO events go to (default EMPLOYEE_GCAL_EMAIL)")
+    add.add_argument("--check", action="store_true", help="verify the token with auth.test")
+    remove = commands.add_parser("remove")
+    remove.add_argument("team_id")
+    args = parser.parse_args()
+
+    store = TenantStore(args.db)
+    if args.command == "list":
+        for tenant in store.list():
+            updated = datetime.fromtimestamp(tenant["updated_at"]).strftime("%Y-%m-%d %H:%M")
+            print(f"{tenant['team_id']:<14} {tenant['team_name'] or '':<24} {tenant['gcal_email'] or '':<28} {updated}")
+    elif args.command == "add":
+        token = os.environ.get("TENANT_BOT_TOKEN") or getpass.getpass(f"Bot token for {args.team_id}: ")
+        if not token.startswith("xoxb-"):
+            sys.exit("Expected a bot token (xoxb-...)")
+        team_name = check_token(args.team_id, token) if args.check else None
+        name = args.name or team_name
+        store.put(args.team_id, token, team_name=name, gcal_email=args.gcal_email)
+        print(f"Saved {args.team_id}")
+    elif not store.remove(args.team_id):
+        sys.exit(f"{args.team_id} is not installed")
+    else:
+        print(f"Removed {args.team_id}")
+
+
+if __name__ == "__main__":
+    main()